@@ -43,6 +43,8 @@ import time
 import traceback
 import sys
 import StringIO
+import Queue
+import threading
 from eutester.euservice import EuserviceManager
 from boto.ec2.instance import Reservation
 from boto.exception import EC2ResponseError
@@ -53,13 +55,14 @@ from eutester.euvolume import EuVolume
 from eutester import eulogger
 import re
 import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 class Eucaops(EC2ops,S3ops,IAMops,STSops,CWops, ASops, ELBops):
     
     def __init__(self, config_file=None, password=None, keypath=None, credpath=None, aws_access_key_id=None,
                  aws_secret_access_key = None,  account="eucalyptus", user="admin", username=None, APIVersion='2011-01-01',
                  region=None, ec2_ip=None, s3_ip=None, s3_path=None, as_ip=None, elb_ip=None, download_creds=True,boto_debug=0,
-                 debug_method=None):
+                 debug_method=None, bootstrap_workers=10, bootstrap_timeout=None):
         self.config_file = config_file 
         self.APIVersion = APIVersion
         self.eucapath = "/opt/eucalyptus"
@@ -88,12 +91,15 @@ class Eucaops(EC2ops,S3ops,IAMops,STSops,CWops, ASops, ELBops):
         self.aws_access_key_id = aws_access_key_id
         self.aws_secret_access_key = aws_secret_access_key
         self.property_manager = None
+        self.bootstrap_workers = bootstrap_workers
+        self.bootstrap_timeout = bootstrap_timeout
 
 
         if self.config_file is not None:
             ## read in the config file
             self.debug("Reading config file: " + config_file)
-            self.config = self.read_config(config_file)
+            self.config = self.read_config(config_file, max_workers=self.bootstrap_workers,
+                                           timeout=self.bootstrap_timeout)
 
             ### Set the eucapath
             try:
@@ -449,7 +455,7 @@ class Eucaops(EC2ops,S3ops,IAMops,STSops,CWops, ASops, ELBops):
             self.debug("Current resources in the system:\n" + str(current_artifacts))
         return current_artifacts
     
-    def read_config(self, filepath, username="root"):
+    def read_config(self, filepath, username="root", max_workers=10, timeout=None):
         """ Parses the config file at filepath returns a dictionary with the config
             Config file
             ----------
@@ -474,9 +480,17 @@ class Eucaops(EC2ops,S3ops,IAMops,STSops,CWops, ASops, ELBops):
                 SC00 - Storage controller for cluster 00   
                 CC00 - Cluster controller for cluster 00    
                 NC00 - A node controller in cluster 00   
+
+            Machines are bootstrapped (ssh, sftp, distro probe, eucalyptus.conf) concurrently
+            using up to 'max_workers' threads. Set max_workers to 1 for the legacy serial behavior.
+
+        :param filepath: path to the legacy qa config file
+        :param username: ssh username used to connect to each machine
+        :param max_workers: max number of machines to bootstrap at once
+        :param timeout: optional seconds to wait per machine, None waits forever
         """
         config_hash = {}
-        machines = []
+        machine_dicts = []
         f = None
         try:
             #f = open(filepath, 'r')
@@ -499,20 +513,7 @@ class Eucaops(EC2ops,S3ops,IAMops,STSops,CWops, ASops, ELBops):
                 machine_dict["arch"] = machine_details[3]
                 machine_dict["source"] = machine_details[4]
                 machine_dict["components"] = map(str.lower, machine_details[5].strip('[]').split())
-
-                ### ADD the machine to the array of machine
-                cloud_machine = Machine(   machine_dict["hostname"], 
-                                        distro = machine_dict["distro"], 
-                                        distro_ver = machine_dict["distro_ver"], 
-                                        arch = machine_dict["arch"], 
-                                        source = machine_dict["source"], 
-                                        components = machine_dict["components"],
-                                        connect = True,
-                                        password = self.password,
-                                        keypath = self.keypath,
-                                        username = username
-                                        )
-                machines.append(cloud_machine)
+                machine_dicts.append(machine_dict)
                 
             ### LOOK for network mode in config file if not found then set it unknown
             try:
@@ -522,9 +523,101 @@ class Eucaops(EC2ops,S3ops,IAMops,STSops,CWops, ASops, ELBops):
                 self.debug("Could not find network type setting to unknown")
                 config_hash["network"] = "unknown"
         #f.close()   
-        config_hash["machines"] = machines 
+        config_hash["machines"] = self.bootstrap_machines(machine_dicts,
+                                                          username=username,
+                                                          max_workers=max_workers,
+                                                          timeout=timeout)
         return config_hash
 
+    def _create_config_machine(self, machine_dict, username="root"):
+        return Machine(machine_dict["hostname"],
+                       distro = machine_dict["distro"],
+                       distro_ver = machine_dict["distro_ver"],
+                       arch = machine_dict["arch"],
+                       source = machine_dict["source"],
+                       components = machine_dict["components"],
+                       connect = True,
+                       password = self.password,
+                       keypath = self.keypath,
+                       username = username
+                       )
+
+    def bootstrap_machines(self, machine_dicts, username="root", max_workers=10, timeout=None):
+        """
+        Creates Machine objects for each of the parsed config machine entries. Machines are created in parallel
+        using up to 'max_workers' threads so overall startup time follows the slowest host rather than the
+        sum of all hosts, max_workers=1 bootstraps one host at a time. All hosts are attempted; failures are
+        collected and raised together once every host has either finished, failed or timed out.
+        Each host has 'timeout' seconds from when its bootstrap starts. A host which times out is reported
+        and its thread is abandoned, freeing its slot for the remaining hosts.
+
+        :param machine_dicts: list of dicts as parsed by read_config()
+        :param username: ssh username used to connect to each machine
+        :param max_workers: max number of machines to bootstrap at once
+        :param timeout: optional seconds to wait per machine, None waits forever
+        :return: list of Machine objects in the same order as machine_dicts
+        """
+        if not machine_dicts:
+            return []
+        max_workers = max(1, min(int(max_workers or 1), len(machine_dicts)))
+        machines = [None] * len(machine_dicts)
+        errors = {}
+        timed_out = []
+        done = Queue.Queue()
+        #Map of index of running machine_dict to the time its bootstrap started
+        running = {}
+        next_index = 0
+        self.debug("Bootstrapping " + str(len(machine_dicts)) + " machines using " +
+                   str(max_workers) + " threads...")
+
+        def bootstrap(index):
+            try:
+                done.put((index, self._create_config_machine(machine_dicts[index], username), None))
+            except Exception, e:
+                done.put((index, None, str(e)))
+
+        while next_index < len(machine_dicts) or running:
+            while next_index < len(machine_dicts) and len(running) < max_workers:
+                running[next_index] = time.time()
+                thread = threading.Thread(target=bootstrap, args=(next_index,),
+                                          name='bootstrap-' + str(machine_dicts[next_index]["hostname"]))
+                thread.daemon = True
+                thread.start()
+                next_index += 1
+            wait_time = None
+            if timeout:
+                wait_time = max(0, min(running.values()) + timeout - time.time())
+            try:
+                index, machine, error = done.get(timeout=wait_time)
+            except Queue.Empty:
+                index = None
+            if index is not None and index in running:
+                running.pop(index)
+                hostname = machine_dicts[index]["hostname"]
+                if error is None:
+                    machines[index] = machine
+                    self.debug("Bootstrapped machine: " + str(hostname))
+                else:
+                    errors[hostname] = error
+            if timeout:
+                now = time.time()
+                for index, started in running.items():
+                    if now - started >= timeout:
+                        running.pop(index)
+                        hostname = machine_dicts[index]["hostname"]
+                        timed_out.append(hostname)
+                        errors[hostname] = "Timed out after " + str(timeout) + " seconds"
+                        self.debug("Timed out bootstrapping machine: " + str(hostname) + " after " +
+                                   str(timeout) + " seconds")
+        if errors:
+            errmsg = "Failed to bootstrap " + str(len(errors)) + " of " + str(len(machine_dicts)) + " machines:\n"
+            if timed_out:
+                errmsg += "Timed out hosts: " + ", ".join(timed_out) + "\n"
+            for hostname in errors:
+                errmsg += str(hostname) + ": " + str(errors[hostname]) + "\n"
+            raise Exception(errmsg)
+        return machines
+
 
     def update_property_manager(self,machine=None):
         machine = machine or self.clc
@@ -587,6 +680,79 @@ class Eucaops(EC2ops,S3ops,IAMops,STSops,CWops, ASops, ELBops):
             else:
                 return machines_with_role
 
+    def run_fleet_command(self, cmds, component=None, machines=None, max_workers=10, timeout=120,
+                          result_cb=None, code=None, verbose=True):
+        """
+        Runs command(s) on all machines matching 'component' in parallel. Per host results are handed to
+        'result_cb' and logged as each host finishes rather than once all hosts are done. Multiple commands
+        for the same host are run concurrently on that host's ssh connection, see Machine.cmd_many().
+        VMware hosts are skipped as they can not run shell commands.
+
+        Example:
+            out = tester.run_fleet_command('free', component='nc')
+            out = tester.run_fleet_command(lambda machine: 'ping -c 1 ' + machine.hostname, component='cc')
+
+        :param cmds: string command, list of commands, or a method which accepts a machine obj and returns the
+                     command (or list of commands) to run on that machine.
+        :param component: optional component string used to filter machines, ie: 'clc', 'nc', 'sc00'
+        :param machines: optional list of machines to use instead of a component lookup
+        :param max_workers: max number of hosts to run commands on at once
+        :param timeout: per command timeout in seconds
+        :param result_cb: optional method called as result_cb(machine, results) as each host finishes
+        :param code: optional expected exit code, raises an exception after all hosts finish if any
+                     command exited with a different code or any host failed
+        :param verbose: boolean to log each host's results as they finish
+        :return: dict containing:
+            ['results'] - dict of hostname to list of cmd result dicts, see Machine.cmd()
+            ['errors'] - dict of hostname to error string for hosts where the command(s) could not be run
+            ['status'] - 0 if every command on every host exited 0, otherwise the first non-zero exit status
+        """
+        if machines is None:
+            machines = self.get_component_machines(component)
+        machines = [machine for machine in machines if not (machine.distro and machine.distro.name == "vmware")]
+        ret = {'results': {}, 'errors': {}, 'status': 0}
+        if not machines:
+            return ret
+
+        def run_on_machine(machine):
+            host_cmds = cmds(machine) if callable(cmds) else cmds
+            if not isinstance(host_cmds, list):
+                host_cmds = [host_cmds]
+            return machine.cmd_many(host_cmds, verbose=False, timeout=timeout, listformat=True)
+
+        executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(machines))))
+        try:
+            future_map = {}
+            for machine in machines:
+                future_map[executor.submit(run_on_machine, machine)] = machine
+            for future in as_completed(future_map):
+                machine = future_map[future]
+                try:
+                    results = future.result()
+                except Exception, e:
+                    ret['errors'][machine.hostname] = str(e)
+                    self.debug('Failed to run command(s) on ' + str(machine.hostname) + ', err:' + str(e))
+                    continue
+                ret['results'][machine.hostname] = results
+                for result in results:
+                    if result['status'] != 0 and not ret['status']:
+                        ret['status'] = result['status']
+                    if verbose:
+                        machine.debug("[" + str(machine.username) + "@" + str(machine.hostname) + "]# " +
+                                      result['cmd'] + " (status:" + str(result['status']) + ")\n" +
+                                      "\n".join(result['output']))
+                if result_cb:
+                    result_cb(machine, results)
+        finally:
+            executor.shutdown(wait=True)
+        if code is not None:
+            failed = [hostname for hostname in ret['results']
+                      if [result for result in ret['results'][hostname] if result['status'] != code]]
+            if failed or ret['errors']:
+                raise Exception('Fleet command(s) did not return code:' + str(code) + ' on hosts:' +
+                                ",".join(failed + ret['errors'].keys()))
+        return ret
+
     def swap_component_hostname(self, hostname):
         if hostname != None:
             if len(hostname) < 5:
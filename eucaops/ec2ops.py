@@ -55,6 +55,7 @@ from boto.ec2.bundleinstance import BundleInstanceTask
 from boto.exception import EC2ResponseError
 from boto.ec2.regioninfo import RegionInfo
 import boto
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from eutester import Eutester
 import eutester
@@ -696,6 +697,51 @@ disable_root: false"""
         return retlist
     
     
+    def update_volumes(self, volumes, errors=None):
+        """
+        Updates a list of volume objs in place using a single batched describe volumes request, rather than
+        one request per volume. EuVolumes have their test status attributes updated as well.
+        Falls back to per volume updates if the batched request fails, ie if one of the volumes no longer exists.
+        A volume failing to update does not stop the remaining volumes from being updated.
+
+        :param volumes: list of boto volume or EuVolume objs
+        :param errors: optional dict, populated with volume id: exception for volumes which failed to update
+                       individually. If not provided the first such exception is raised once all volumes
+                       have been updated.
+        :return: list of volumes
+        """
+        if not volumes:
+            return volumes
+        try:
+            #Filter the results as some versions of Eucalyptus ignore the volume id list
+            described = {}
+            for volume in self.ec2.get_all_volumes(volume_ids=[vol.id for vol in volumes]):
+                described[volume.id] = volume
+        except EC2ResponseError, ec2re:
+            self.debug('Batched volume update failed, updating volumes individually. Err:' + str(ec2re))
+            first_error = None
+            for vol in volumes:
+                try:
+                    vol.update()
+                except Exception, e:
+                    self.debug('Failed to update volume:' + str(vol.id) + ', err:' + str(e))
+                    if first_error is None:
+                        first_error = e
+                    if errors is not None:
+                        errors[vol.id] = e
+            if first_error is not None and errors is None:
+                raise first_error
+            return volumes
+        for vol in volumes:
+            if vol.id in described:
+                if isinstance(vol, EuVolume):
+                    vol.update(volume=described[vol.id])
+                else:
+                    vol._update(described[vol.id])
+            elif isinstance(vol, EuVolume):
+                vol.set_last_status()
+        return volumes
+
     @Eutester.printinfo
     def monitor_created_euvolumes_to_state(self,
                                            volumes,
@@ -742,8 +788,8 @@ disable_root: false"""
         self.debug( "Polling "+str(len(volumes))+" volumes for status:\""+str(state)+"\"...")
         start = time.time()
         while volumes:
-            for volume in volumes:
-                volume.update()
+            self.update_volumes(volumes)
+            for volume in list(volumes):
                 voltimeout = timepergig * (volume.size or size)
                 elapsed = time.time()-start
                 self.debug("Volume #"+str(volume.eutest_createorder)+" ("+volume.id+") State("+volume.status+
@@ -863,9 +909,12 @@ disable_root: false"""
         start = time.time()
         elapsed = 0
         self.debug('Updating volume list before monitoring...')
+        try:
+            self.update_volumes(euvolumes)
+        except:
+            self.debug(self.get_traceback())
         for vol in euvolumes:
             try:
-                vol.update()
                 if not isinstance(vol, EuVolume):
                     vol = EuVolume.make_euvol_from_vol(vol,self)
                 monitor.append(vol)
@@ -875,9 +924,12 @@ disable_root: false"""
         self.print_euvolume_list(monitor)
         while monitor and (elapsed < timeout):
             elapsed = int(time.time()-start)
+            last_attached_statuses = {}
             for vol in monitor:
-                last_attached_status = vol.eutest_attached_status
-                vol.update()
+                last_attached_statuses[vol.id] = vol.eutest_attached_status
+            self.update_volumes(monitor)
+            for vol in list(monitor):
+                last_attached_status = last_attached_statuses[vol.id]
                 if vol.eutest_attached_instance_id:
                     instance_debug_str = ', (att_instance'+str(vol.eutest_attached_instance_id)+")"
                 else:
@@ -1418,6 +1470,7 @@ disable_root: false"""
                     snapshot.eutest_cmdtime = "{0:.2f}".format(cmdtime)
                     snapshot.eutest_volume_md5 = volume.md5
                     snapshot.eutest_volume_md5len = volume.md5len
+                    snapshot.eutest_volume_hash_tree = getattr(volume, 'hash_tree', None)
                     snapshot.eutest_volume_zone = volume.zone
                     
                     snapshot.update()
@@ -2580,40 +2633,29 @@ disable_root: false"""
             
             if image.root_device_type == 'ebs':
                 self.wait_for_instances_block_dev_mapping(reservation.instances, timeout=timeout)
-            for instance in reservation.instances:
-                try:
-                    self.debug(str(instance.id)+':Converting instance to euinstance type.')
-                    #convert to euinstances, connect ssh later...
-                    if image.platform == 'windows':
-                        eu_instance = WinInstance.make_euinstance_from_instance( instance,
-                                                                                 self,
-                                                                                 keypair=keypair,
-                                                                                 username='Administrator',
-                                                                                 password=password,
-                                                                                 reservation=reservation,
-                                                                                 private_addressing=private_addressing,
-                                                                                 timeout=timeout,
-                                                                                 cmdstart=cmdstart,
-                                                                                 auto_connect=False
-                                                                                 )
-
-                    else:
-                        eu_instance =  EuInstance.make_euinstance_from_instance( instance,
-                                                                                 self,
-                                                                                 keypair=keypair,
-                                                                                 username = username,
-                                                                                 password=password,
-                                                                                 reservation = reservation,
-                                                                                 private_addressing=private_addressing,
-                                                                                 timeout=timeout,
-                                                                                 cmdstart=cmdstart,
-                                                                                 auto_connect=False )
-                    #set the connect flag in the euinstance object for future use
-                    eu_instance.auto_connect = auto_connect
-                    instances.append(eu_instance)
-                except Exception, e:
-                    self.debug(self.get_traceback())
-                    raise Exception("Unable to create Euinstance from " + str(instance)+", err:\n"+str(e))
+            #convert to euinstances in bulk, connect ssh later...
+            if image.platform == 'windows':
+                instances = self.convert_instances_to_euinstances(reservation.instances,
+                                                                  reservation=reservation,
+                                                                  euinstance_class=WinInstance,
+                                                                  keypair=keypair,
+                                                                  username='Administrator',
+                                                                  password=password,
+                                                                  private_addressing=private_addressing,
+                                                                  timeout=timeout,
+                                                                  cmdstart=cmdstart)
+            else:
+                instances = self.convert_instances_to_euinstances(reservation.instances,
+                                                                  reservation=reservation,
+                                                                  keypair=keypair,
+                                                                  username=username,
+                                                                  password=password,
+                                                                  private_addressing=private_addressing,
+                                                                  timeout=timeout,
+                                                                  cmdstart=cmdstart)
+            for eu_instance in instances:
+                #set the connect flag in the euinstance object for future use
+                eu_instance.auto_connect = auto_connect
             if monitor_to_running:
                 return self.monitor_euinstances_to_running(instances, timeout=timeout)
             else:
@@ -2626,6 +2668,162 @@ disable_root: false"""
             raise e 
     
     
+    def convert_instances_to_euinstances(self,
+                                         instances,
+                                         reservation=None,
+                                         euinstance_class=None,
+                                         keypair=None,
+                                         username="root",
+                                         password=None,
+                                         private_addressing=False,
+                                         timeout=120,
+                                         cmdstart=None):
+        """
+        Converts a list of boto instances to EuInstances (or WinInstances) in bulk. The keypair, reservations,
+        security groups, vm type info and ebs root volumes are each fetched once for the whole list and shared
+        across the new objs, rather than looked up per instance. This keeps the number of requests needed to
+        convert a large launch constant. Ssh/winrm connections are not attempted here.
+
+        :param instances: list of boto instance objs
+        :param reservation: optional reservation obj containing all the instances, ie as returned from run
+        :param euinstance_class: class to convert to, EuInstance(default) or WinInstance
+        :param keypair: keypair obj or keypair name used for creating connections to the instances
+        :param username: username for connecting to instances
+        :param password: password for connecting to instances
+        :param private_addressing: boolean to indicate instances were run without public ips
+        :param timeout: connection timeout to set on the new instance objs
+        :param cmdstart: time the run instances request was issued
+        :return: list of converted instances in the same order as 'instances'
+        """
+        euinstance_class = euinstance_class or EuInstance
+        if not instances:
+            return []
+        if keypair and isinstance(keypair, types.StringTypes):
+            keypair = self.get_keypair(keypair)
+        #Map each instance to its reservation, using a single describe for any not in the provided reservation
+        reservations = {}
+        if reservation:
+            for instance in reservation.instances:
+                reservations[instance.id] = reservation
+        missing = [instance.id for instance in instances if instance.id not in reservations]
+        if missing:
+            for res in self.ec2.get_all_instances(instance_ids=missing):
+                for instance in res.instances:
+                    reservations[instance.id] = res
+        #Fetch the security groups referenced by all the reservations with one request
+        group_names = []
+        for res in reservations.values():
+            for group in res.groups:
+                if group.name not in group_names:
+                    group_names.append(group.name)
+        groups = {}
+        if group_names:
+            try:
+                for group in self.ec2.get_all_security_groups(groupnames=group_names):
+                    groups[group.name] = group
+            except EC2ResponseError, ec2re:
+                self.debug('Batched security group lookup failed, instances will look up groups individually. Err:'
+                           + str(ec2re))
+                groups = None
+        #Fetch the vm type info once per zone
+        vmtypes = {}
+        zones = []
+        for instance in instances:
+            if instance.placement not in zones:
+                zones.append(instance.placement)
+        for euzone in self.get_euzones(zones):
+            for vmtype in euzone.vm_types:
+                vmtypes[(euzone.name, vmtype.name)] = vmtype
+        #Fetch the ebs root volumes for all the instances with one request
+        root_vols = {}
+        root_vol_ids = []
+        for instance in instances:
+            if instance.root_device_type == 'ebs' and instance.block_device_mapping:
+                root_dev = instance.block_device_mapping.get(instance.root_device_name)
+                if root_dev and root_dev.volume_id:
+                    root_vol_ids.append(root_dev.volume_id)
+        if root_vol_ids:
+            try:
+                for volume in self.ec2.get_all_volumes(volume_ids=root_vol_ids):
+                    root_vols[volume.id] = EuVolume.make_euvol_from_vol(volume, tester=self, cmdstart=cmdstart)
+            except EC2ResponseError, ec2re:
+                self.debug('Batched root volume lookup failed, instances will look up volumes individually. Err:'
+                           + str(ec2re))
+        euinstances = []
+        for instance in instances:
+            self.debug(str(instance.id)+':Converting instance to euinstance type.')
+            res = reservations.get(instance.id)
+            security_groups = None
+            if res and groups is not None:
+                security_groups = [groups[group.name] for group in res.groups if group.name in groups]
+            bdm_root_vol = None
+            if instance.root_device_type == 'ebs' and instance.block_device_mapping:
+                root_dev = instance.block_device_mapping.get(instance.root_device_name)
+                if root_dev:
+                    bdm_root_vol = root_vols.get(root_dev.volume_id)
+            try:
+                euinstances.append(euinstance_class.make_euinstance_from_instance(
+                    instance,
+                    self,
+                    keypair=keypair,
+                    username=username,
+                    password=password,
+                    reservation=res,
+                    private_addressing=private_addressing,
+                    timeout=timeout,
+                    cmdstart=cmdstart,
+                    auto_connect=False,
+                    security_groups=security_groups,
+                    vmtype_info=vmtypes.get((instance.placement, instance.instance_type)),
+                    bdm_root_vol=bdm_root_vol))
+            except Exception, e:
+                self.debug(self.get_traceback())
+                raise Exception("Unable to create Euinstance from " + str(instance)+", err:\n"+str(e))
+        return euinstances
+
+    def update_instances(self, instances, errors=None):
+        """
+        Updates a list of instance objs in place using a single batched describe instances request, rather than
+        one request per instance. EuInstances and WinInstances have their test status attributes updated as well.
+        Falls back to per instance updates if the batched request fails, ie if one of the instances no longer
+        exists. An instance failing to update does not stop the remaining instances from being updated.
+
+        :param instances: list of boto instance, EuInstance or WinInstance objs
+        :param errors: optional dict, populated with instance id: exception for instances which failed to
+                       update individually. If not provided the first such exception is raised once all
+                       instances have been updated.
+        :return: list of instances
+        """
+        if not instances:
+            return instances
+        try:
+            described = {}
+            for reservation in self.ec2.get_all_instances(instance_ids=[instance.id for instance in instances]):
+                for instance in reservation.instances:
+                    described[instance.id] = instance
+        except EC2ResponseError, ec2re:
+            self.debug('Batched instance update failed, updating instances individually. Err:' + str(ec2re))
+            first_error = None
+            for instance in instances:
+                try:
+                    instance.update()
+                except Exception, e:
+                    self.debug('Failed to update instance:' + str(instance.id) + ', err:' + str(e))
+                    if first_error is None:
+                        first_error = e
+                    if errors is not None:
+                        errors[instance.id] = e
+            if first_error is not None and errors is None:
+                raise first_error
+            return instances
+        for instance in instances:
+            if instance.id in described:
+                if isinstance(instance, EuInstance) or isinstance(instance, WinInstance):
+                    instance.update(instance=described[instance.id])
+                else:
+                    instance._update(described[instance.id])
+        return instances
+
     def wait_for_instances_block_dev_mapping(self, instances, poll_interval=1, timeout=60):
         waiting = copy.copy(instances)
         elapsed = 0
@@ -2635,8 +2833,8 @@ disable_root: false"""
         self.debug('wait_for_instance_block_dev_mapping started...')
         while waiting and (elapsed < timeout):
             elapsed = time.time() - start
-            for instance in waiting:
-                instance.update()
+            self.update_instances(waiting)
+            for instance in list(waiting):
                 for failed_state in ['terminated', 'stopped','stopping']:
                     if instance.state == failed_state:
                         failed.append(instance)
@@ -2682,7 +2880,18 @@ disable_root: false"""
 
 
     @Eutester.printinfo 
-    def monitor_euinstances_to_running(self,instances, poll_interval=10, timeout=480):
+    def monitor_euinstances_to_running(self,instances, poll_interval=10, timeout=480, max_workers=10):
+        """
+        Monitors instances to running, waits for valid ips, and then attempts to connect to each instance which
+        has auto_connect set. Connection attempts (ping, port checks, ssh/winrm connect) are made concurrently
+        using up to 'max_workers' threads so a slow booting instance does not hold up the others.
+
+        :param instances: list of EuInstance or WinInstance objs
+        :param poll_interval: int seconds between connection passes
+        :param timeout: int seconds to wait for instances to be running and connectable
+        :param max_workers: int max number of instances to attempt connections to at once
+        :return: list of instances
+        """
         self.debug("("+str(len(instances))+") Monitor_instances_to_running starting...")
         ip_err = ""
         #Wait for instances to go to running state...
@@ -2699,49 +2908,29 @@ disable_root: false"""
         elapsed = 0
         start = time.time()
         self.debug("Instances in running state and wait_for_valid_ip complete, attempting connections...")
-        while waiting and (elapsed < timeout):
-            self.debug("Checking "+str(len(waiting))+" instance ssh connections...")
-            elapsed = int(time.time()-start)
-            for instance in waiting:
-                self.debug('Checking instance:'+str(instance.id)+" ...")
-                if instance.auto_connect:
+        executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(instances) or 1)))
+        try:
+            while waiting and (elapsed < timeout):
+                self.debug("Checking "+str(len(waiting))+" instance ssh connections...")
+                elapsed = int(time.time()-start)
+                futures = {}
+                for instance in waiting:
+                    futures[executor.submit(self.connect_to_running_instance, instance)] = instance
+                for future in as_completed(futures):
+                    instance = futures[future]
                     try:
-                        if isinstance(instance, WinInstance):
-                            #First try checking the RDP and WINRM ports for access...
-                            self.debug('Do Security group rules allow winrm from this test machine:'+
-                                       str(self.does_instance_sec_group_allow(instance, protocol='tcp', port=instance.winrm_port)))
-                            self.debug('Do Security group rules allow winrm from this test machine:'+
-                                       str(self.does_instance_sec_group_allow(instance, protocol='tcp', port=instance.rdp_port)))
-                            instance.poll_for_ports_status(timeout=1)
-                            instance.connect_to_instance(timeout=15)
-                            self.debug("Connected to instance:"+str(instance.id))
-                            good.append(instance)
-                        else:
-                            #First try ping
-                            self.debug('Do Security group rules allow ping from this test machine:'+
-                                       str(self.does_instance_sec_group_allow(instance, protocol='icmp', port=0)))
-                            self.ping(instance.ip_address, 2)
-                            #now try to connect ssh or winrm
-                            allow = "None"
-                            try:
-                                allow=str(self.does_instance_sec_group_allow(instance, protocol='tcp', port=22))
-                            except:
-                                pass
-                            self.debug('Do Security group rules allow ssh from this test machine:'+str(allow))
-                            instance.connect_to_instance(timeout=15)
-                            self.debug("Connected to instance:"+str(instance.id))
-                            good.append(instance)
-                    except :
-                        self.debug(self.get_traceback())
-                        pass
-                else:
-                    good.append(instance)
-            for instance in good:
-                if instance in waiting:
-                    waiting.remove(instance)
-            if waiting:
-                time.sleep(poll_interval)
-                
+                        future.result()
+                        good.append(instance)
+                    except Exception, e:
+                        self.debug('Instance:' + str(instance.id) + ' not connected yet, err:' + str(e))
+                for instance in good:
+                    if instance in waiting:
+                        waiting.remove(instance)
+                if waiting:
+                    time.sleep(poll_interval)
+        finally:
+            executor.shutdown(wait=True)
+
         if waiting:
             buf = "Following Errors occurred while waiting for instances:\n"
             buf += 'Errors while waiting for valid ip:'+ ip_err + "\n"
@@ -2751,8 +2940,47 @@ disable_root: false"""
             raise Exception(buf)
         self.print_euinstance_list(good)
         return good
-    
-    
+
+    def connect_to_running_instance(self, instance, timeout=15):
+        """
+        Single connection attempt to a running instance, used by monitor_euinstances_to_running().
+        Instances without auto_connect set are considered connected.
+        Linux instances are pinged, then connected to via ssh. Windows instances have their rdp and winrm
+        ports checked, then are connected to via winrm.
+
+        :param instance: EuInstance or WinInstance obj
+        :param timeout: int seconds to allow for the connection attempt
+        :return: instance
+        :raise: Exception if the instance could not be connected to
+        """
+        self.debug('Checking instance:'+str(instance.id)+" ...")
+        if not instance.auto_connect:
+            return instance
+        if isinstance(instance, WinInstance):
+            #First try checking the RDP and WINRM ports for access...
+            self.debug('Do Security group rules allow winrm from this test machine:'+
+                       str(self.does_instance_sec_group_allow(instance, protocol='tcp', port=instance.winrm_port)))
+            self.debug('Do Security group rules allow winrm from this test machine:'+
+                       str(self.does_instance_sec_group_allow(instance, protocol='tcp', port=instance.rdp_port)))
+            instance.poll_for_ports_status(timeout=1)
+            instance.connect_to_instance(timeout=timeout)
+        else:
+            #First try ping
+            self.debug('Do Security group rules allow ping from this test machine:'+
+                       str(self.does_instance_sec_group_allow(instance, protocol='icmp', port=0)))
+            self.ping(instance.ip_address, 2)
+            #now try to connect ssh or winrm
+            allow = "None"
+            try:
+                allow=str(self.does_instance_sec_group_allow(instance, protocol='tcp', port=22))
+            except:
+                pass
+            self.debug('Do Security group rules allow ssh from this test machine:'+str(allow))
+            instance.connect_to_instance(timeout=timeout)
+        self.debug("Connected to instance:"+str(instance.id))
+        return instance
+
+
     @Eutester.printinfo
     def does_instance_sec_group_allow(self, instance, src_addr=None, protocol='tcp',port=22):
         s = None
@@ -2918,9 +3146,21 @@ disable_root: false"""
             elapsed = int(time.time() - start)
             self.debug("\n------>Waiting for remaining "+str(len(monitor))+"/"+str(len(instance_list))+
                        " instances to go to state:"+str(state)+', elapsed:('+str(elapsed)+'/'+str(timeout)+")...")
+            #Instances which fail to update, or whose root volume fails to update, are marked failed below
+            update_errors = {}
+            try:
+                self.update_instances(monitor, errors=update_errors)
+                self.update_volumes([instance.bdm_root_vol for instance in monitor
+                                     if instance.root_device_type == 'ebs' and getattr(instance, 'bdm_root_vol', None)],
+                                    errors=update_errors)
+            except Exception, e:
+                self.debug('Error updating instances, will retry next poll. Err:' + str(e))
             for instance in monitor:
                 try:
-                    instance.update()
+                    if instance.id in update_errors:
+                        raise update_errors[instance.id]
+                    if getattr(instance, 'bdm_root_vol', None) and instance.bdm_root_vol.id in update_errors:
+                        raise update_errors[instance.bdm_root_vol.id]
                     bdm_root_vol_status = None
                     bdm_root_vol_id = None
                     if instance.root_device_type == 'ebs':
@@ -2931,7 +3171,6 @@ disable_root: false"""
                                 bdm_root_vol_status = instance.bdm_root_vol.status
                             except: pass
                         else:
-                            instance.bdm_root_vol.update()
                             bdm_root_vol_id = instance.bdm_root_vol.id
                             bdm_root_vol_status = instance.bdm_root_vol.status
                         if instance.laststate:
@@ -2966,7 +3205,7 @@ disable_root: false"""
                         failmsg += str(e)+"\n"
                         
             #remove good instances from list to monitor
-            for instance in monitor:
+            for instance in list(monitor):
                 if (instance in good) or (instance in failed):
                     monitor.remove(instance)
                     
@@ -3060,8 +3299,8 @@ disable_root: false"""
         zeros = re.compile(regex)
         while monitoring and (elapsed <= timeout):
             elapsed = int(time.time()- start)
+            self.update_instances(monitoring)
             for instance in monitoring:
-                instance.update()
                 if zeros.search(str(instance.ip_address)) or zeros.search(str(instance.private_ip_address)):
                     self.debug(str(instance.id)+": WAITING for public ip. Current:"+str(instance.ip_address)+
                                ", elapsed:"+str(elapsed)+"/"+str(timeout))
@@ -31,10 +31,14 @@
 # Author: vic.iglesias@eucalyptus.com
 import re
 import copy
+import math
 import time
+import threading
+import httplib
+import urlparse
 from boto.ec2.regioninfo import RegionInfo
 import boto
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, wait
 import urllib2
 import cookielib
 from eutester import Eutester
@@ -51,6 +55,59 @@ ELBRegionData = {
     'ap-southeast-1': 'elasticloadbalancing.ap-southeast-1.amazonaws.com'}
 
 
+class LatencyHistogram():
+    '''
+    Fixed memory latency histogram. Values are counted in logarithmic buckets roughly 1% wide, so percentiles
+    are accurate to about 1% no matter how many values are added, and histograms from several threads can
+    be merged.
+    '''
+    log_base = math.log(1.01)
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        usec = max(seconds * 1000000.0, 1.0)
+        index = int(math.log(usec) / self.log_base)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def merge(self, other):
+        for index, count in other.buckets.iteritems():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, pct):
+        '''
+        Returns the latency in milliseconds at percentile 'pct' (0-100)
+        '''
+        if not self.count:
+            return 0
+        target = max(1, int(math.ceil((pct / 100.0) * self.count)))
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= target:
+                return min(math.exp((index + 0.5) * self.log_base) / 1000.0, self.max * 1000)
+        return self.max * 1000
+
+    def summary(self):
+        return {'count': self.count,
+                'avg_ms': round((self.total / self.count) * 1000, 3) if self.count else 0,
+                'p50_ms': round(self.percentile(50), 3),
+                'p90_ms': round(self.percentile(90), 3),
+                'p95_ms': round(self.percentile(95), 3),
+                'p99_ms': round(self.percentile(99), 3),
+                'max_ms': round(self.max * 1000, 3)}
+
+
 class ELBops(Eutester):
     @Eutester.printinfo
     def __init__(self, host=None, credpath=None, endpoint=None, aws_access_key_id=None, aws_secret_access_key=None,
@@ -177,6 +234,10 @@ class ELBops(Eutester):
         return healthcheck
 
     def generate_http_requests(self, url, count=100, worker_threads=20):
+        """
+        Sends 'count' requests through a shared cookie jar and returns the list of response bodies, for
+        checking which backend served each request. Use generate_http_load() to generate load.
+        """
         self.debug("Generating {0} http requests against {1}".format(count, url))
         jar = cookielib.FileCookieJar("cookies")
         handler = urllib2.HTTPCookieProcessor(jar)
@@ -203,6 +264,196 @@ class ELBops(Eutester):
                 http_response.close()
         return responses
 
+    def generate_http_load(self, url, rps=None, duration=None, count=None, connections=50, timeout=10,
+                           keepalive=True, backend_header=None, body_limit=256, max_backends=1000,
+                           headers=None, late_threshold=0.01, report_interval=10):
+        """
+        Open loop HTTP GET load generator. Each of 'connections' threads keeps one keep-alive connection
+        open and sends requests on a fixed schedule of 'rps' requests per second, so a slow server does not
+        slow the offered load down. Latency is measured from when a request was scheduled to be sent, so
+        queuing behind a slow response is counted. Responses are aggregated as they arrive, only counters
+        and fixed size histograms are kept, so memory does not grow with the number of requests.
+
+        :param url: http or https url to GET
+        :param rps: target requests per second, None sends requests as fast as 'connections' allow
+        :param duration: seconds to generate load for
+        :param count: number of requests to send, at least one of duration or count is required
+        :param connections: number of concurrent connections/threads. Needs to be at least rps x expected
+                            latency for the target rate to be held.
+        :param timeout: socket timeout per request
+        :param keepalive: reuse connections between requests, otherwise each request opens a new connection
+        :param backend_header: response header identifying the backend, by default the first 'body_limit'
+                               bytes of the response body are used, ie the /instance-name page
+        :param body_limit: number of bytes of the response body used to identify the backend
+        :param max_backends: maximum number of distinct backends counted, the rest are counted as 'other'
+        :param headers: dict of extra request headers
+        :param late_threshold: seconds after its scheduled time a request is sent before it is counted as late
+        :param report_interval: seconds between progress messages
+        :return: dict of results, ie:
+                 {'requests':10000, 'completed':9998, 'errors':2, 'error_types':{'timeout':2},
+                  'status_codes':{200:9998}, 'backends':{'i-12345678':5001, 'i-87654321':4997},
+                  'achieved_rps':998.7, 'latency':{'p50_ms':3.1, 'p95_ms':8.2, 'p99_ms':15.0, ...},
+                  'service_time':{...}, 'late_requests':0, 'max_lag_ms':2.1, 'connections_opened':50, ...}
+        """
+        if not count and not duration:
+            raise Exception("generate_http_load requires a count or duration")
+        parsed = urlparse.urlparse(url)
+        if parsed.scheme == 'https':
+            connection_class = httplib.HTTPSConnection
+        else:
+            connection_class = httplib.HTTPConnection
+        path = parsed.path or '/'
+        if parsed.query:
+            path += '?' + parsed.query
+        request_headers = dict(headers or {})
+        if not keepalive:
+            request_headers['Connection'] = 'close'
+        interval = 1.0 / rps if rps else 0
+        if count and rps:
+            connections = min(connections, count)
+        self.debug("Generating http load against {0}, rps:{1} duration:{2} count:{3} connections:{4}"
+                   .format(url, rps, duration, count, connections))
+        lock = threading.Lock()
+        state = {'next': 0, 'stop': False}
+        worker_stats = []
+        start = time.time()
+        end = start + duration if duration else None
+
+        def next_request():
+            #Only requests which will be sent are counted in state['next']
+            with lock:
+                index = state['next']
+                if state['stop'] or (count and index >= count):
+                    return None
+                scheduled = start + (index * interval) if rps else time.time()
+                if end and scheduled >= end:
+                    state['stop'] = True
+                    return None
+                state['next'] += 1
+            return scheduled
+
+        def send(connection):
+            connection.request('GET', path, headers=request_headers)
+            response = connection.getresponse()
+            head = response.read(body_limit)
+            size = len(head)
+            while True:
+                chunk = response.read(65536)
+                if not chunk:
+                    break
+                size += len(chunk)
+            return response, head, size
+
+        def worker():
+            stats = {'latency': LatencyHistogram(), 'service_time': LatencyHistogram(), 'status_codes': {},
+                     'error_types': {}, 'backends': {}, 'bytes': 0, 'connections_opened': 0, 'late': 0,
+                     'max_lag': 0.0}
+            worker_stats.append(stats)
+            connection = None
+            while True:
+                scheduled = next_request()
+                if scheduled is None:
+                    break
+                delay = scheduled - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+                elif rps:
+                    stats['max_lag'] = max(stats['max_lag'], -delay)
+                    if -delay > late_threshold:
+                        stats['late'] += 1
+                sent = time.time()
+                result = None
+                #A reused keep-alive connection may have been closed by the server, retry those once
+                for attempt in xrange(2):
+                    reused = connection is not None
+                    try:
+                        if connection is None:
+                            connection = connection_class(parsed.hostname, parsed.port, timeout=timeout)
+                            stats['connections_opened'] += 1
+                        result = send(connection)
+                        break
+                    except Exception, e:
+                        if connection:
+                            connection.close()
+                        connection = None
+                        if not reused or attempt:
+                            error = e.__class__.__name__
+                            stats['error_types'][error] = stats['error_types'].get(error, 0) + 1
+                            break
+                if result is None:
+                    continue
+                done = time.time()
+                response, head, size = result
+                if not keepalive or response.will_close:
+                    connection.close()
+                    connection = None
+                stats['latency'].add(done - scheduled)
+                stats['service_time'].add(done - sent)
+                stats['bytes'] += size
+                stats['status_codes'][response.status] = stats['status_codes'].get(response.status, 0) + 1
+                if backend_header:
+                    backend = str(response.getheader(backend_header))
+                else:
+                    backend = head.strip()
+                if backend not in stats['backends'] and len(stats['backends']) >= max_backends:
+                    backend = 'other'
+                stats['backends'][backend] = stats['backends'].get(backend, 0) + 1
+            if connection:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=connections) as executor:
+            futures = [executor.submit(worker) for x in xrange(connections)]
+            try:
+                while True:
+                    done, pending = wait(futures, timeout=report_interval)
+                    if not pending:
+                        break
+                    self.debug("Sent {0} requests to {1} in {2:.1f}s".format(state['next'], url,
+                                                                               time.time() - start))
+            except KeyboardInterrupt:
+                state['stop'] = True
+                raise
+            for future in futures:
+                future.result()
+        elapsed = time.time() - start
+
+        latency = LatencyHistogram()
+        service_time = LatencyHistogram()
+        totals = {'status_codes': {}, 'error_types': {}, 'backends': {}}
+        for stats in worker_stats:
+            latency.merge(stats['latency'])
+            service_time.merge(stats['service_time'])
+            for name in totals:
+                for key, value in stats[name].iteritems():
+                    totals[name][key] = totals[name].get(key, 0) + value
+        results = {'url': url,
+                   'target_rps': rps,
+                   'connections': connections,
+                   'duration_sec': round(elapsed, 3),
+                   'requests': state['next'],
+                   'completed': latency.count,
+                   'errors': sum(totals['error_types'].values()),
+                   'error_types': totals['error_types'],
+                   'status_codes': totals['status_codes'],
+                   'backends': totals['backends'],
+                   'achieved_rps': round(latency.count / elapsed, 2) if elapsed else 0,
+                   'mb_per_sec': round(sum(s['bytes'] for s in worker_stats) / 1048576.0 / elapsed, 3)
+                   if elapsed else 0,
+                   'latency': latency.summary(),
+                   'service_time': service_time.summary(),
+                   'late_requests': sum(s['late'] for s in worker_stats),
+                   'max_lag_ms': round(max([s['max_lag'] for s in worker_stats] or [0]) * 1000, 3),
+                   'connections_opened': sum(s['connections_opened'] for s in worker_stats)}
+        self.debug("HTTP load results for {0}: {1} requests in {2}s, {3} rps (target {4}), errors:{5}\n"
+                   "    status codes:{6}\n    backends:{7}\n    latency ms: p50:{8} p95:{9} p99:{10} max:{11}\n"
+                   "    late requests:{12} connections opened:{13}"
+                   .format(url, results['completed'], results['duration_sec'], results['achieved_rps'], rps,
+                           results['error_types'], results['status_codes'], results['backends'],
+                           results['latency']['p50_ms'], results['latency']['p95_ms'],
+                           results['latency']['p99_ms'], results['latency']['max_ms'],
+                           results['late_requests'], results['connections_opened']))
+        return results
+
     def register_lb_instances(self, name, instances, timeout=360, poll_count=15):
         inst_ids = [inst.id for inst in instances]
         self.debug("Registering instances {0} with lb {1}".format(inst_ids, name))
@@ -32,7 +32,12 @@
 
 from eutester import Eutester
 import os
+import time
+import threading
 import hashlib
+import base64
+import cStringIO
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from boto.s3.connection import OrdinaryCallingFormat
 from boto.s3.key import Key
 from boto.s3.acl import ACL, Grant
@@ -159,13 +164,25 @@ class S3ops(Eutester):
         else:
             return None
     
-    def upload_object(self, bucket_name, key_name, path_to_file=None, contents=None):
+    def upload_object(self, bucket_name, key_name, path_to_file=None, contents=None, multipart_threshold=None,
+                      part_size=8388608, workers=4):
         """
         Write the contents of a local file to walrus
         bucket_name   The name of the walrus Bucket.
         key_name      The name of the object containing the data in walrus.
         path_to_file  Fully qualified path to local file.
+        multipart_threshold  If set, data of at least this many bytes is uploaded with upload_object_multipart()
+        part_size     Size in bytes of each part of a multipart upload
+        workers       Number of parts uploaded concurrently in a multipart upload
         """
+        if multipart_threshold is not None:
+            if path_to_file is not None:
+                size = os.path.getsize(path_to_file)
+            else:
+                size = len(contents or '')
+            if size >= multipart_threshold:
+                return self.upload_object_multipart(bucket_name, key_name, path_to_file=path_to_file,
+                                                    contents=contents, part_size=part_size, workers=workers)
         bucket = self.get_bucket_by_name(bucket_name)
         if bucket == None:
             raise S3opsException("Could not find bucket " + bucket_name + " to upload file")
@@ -184,6 +201,283 @@ class S3ops(Eutester):
         self.test_resources["keys"].append(key)
         return key
     
+    def upload_object_from_stream(self, bucket_name, key_name, stream, part_size=8388608, workers=4,
+                                  verify_etag=True, retries=2):
+        """
+        Write data read from a file like object to walrus as a multipart upload, without staging it on local disk.
+        Parts are read from the stream in order and uploaded concurrently, at most workers + 1 parts are held
+        in memory at once. The md5 of each part is sent for the server to verify, and the md5 and multipart
+        ETag of the object are computed as the data is read.
+        bucket_name   The name of the walrus Bucket.
+        key_name      The name of the object containing the data in walrus.
+        stream        File like object providing the object's data through read(), ie an http response
+        part_size     Size in bytes of each part, all but the last part must be at least 5MB
+        workers       Number of parts uploaded concurrently
+        verify_etag   Compare the ETag of the completed upload with the ETag computed while reading
+        retries       Number of times a failed part upload is retried
+        Returns the uploaded key, with the md5 of its data in key.eutest_md5
+        """
+        bucket = self.get_bucket_by_name(bucket_name)
+        if bucket == None:
+            raise S3opsException("Could not find bucket " + bucket_name + " to upload stream")
+        object_md5 = hashlib.md5()
+        part_digests = []
+        size = 0
+        mp = bucket.initiate_multipart_upload(key_name)
+        self.debug("Started multipart upload:" + str(mp.id) + " for key:" + str(key_name) + ", part_size:" +
+                   str(part_size) + ", workers:" + str(workers))
+        executor = ThreadPoolExecutor(max_workers=workers)
+        try:
+            pending = set()
+            while True:
+                data = self.read_stream_part(stream, part_size)
+                if not data and part_digests:
+                    break
+                part_digest = hashlib.md5(data).digest()
+                part_len = len(data)
+                object_md5.update(data)
+                part_digests.append(part_digest)
+                size += part_len
+                pending.add(executor.submit(self.upload_multipart_part, mp, len(part_digests), data, part_digest,
+                                            retries=retries))
+                data = None
+                #Bound memory use by waiting for a part to finish before reading another
+                if len(pending) >= workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        future.result()
+                if part_len < part_size:
+                    break
+            for future in pending:
+                future.result()
+            completed = mp.complete_upload()
+        except Exception, e:
+            executor.shutdown(wait=True)
+            self.debug("Canceling multipart upload:" + str(mp.id) + " for key:" + str(key_name) + ", err:" + str(e))
+            mp.cancel_upload()
+            raise
+        executor.shutdown(wait=True)
+        etag = hashlib.md5("".join(part_digests)).hexdigest() + '-' + str(len(part_digests))
+        if verify_etag and str(completed.etag).strip('"') != etag:
+            raise S3opsException("Multipart ETag mismatch for key:" + str(key_name) + ", expected:" + etag +
+                                 ", got:" + str(completed.etag))
+        key = bucket.get_key(key_name)
+        key.eutest_md5 = object_md5.hexdigest()
+        self.debug("Uploaded key: " + str(key_name) + " to bucket:" + str(bucket_name) + " in " +
+                   str(len(part_digests)) + " parts, size:" + str(size) + ", md5:" + str(key.eutest_md5))
+        self.test_resources["keys"].append(key)
+        return key
+
+    def upload_object_multipart(self, bucket_name, key_name, path_to_file=None, contents=None, part_size=8388608,
+                                workers=4, resume=False, verify_etag=True, retries=2):
+        """
+        Write the contents of a local file or string to walrus as a multipart upload with parts uploaded
+        concurrently. Each worker reads its own part of the file, so at most 'workers' parts are held in memory.
+        The md5 of each part is sent for the server to verify, and the ETag of the completed upload is compared
+        with the ETag computed locally. The md5 of the entire object is computed while the parts upload.
+        If 'resume' is set and an unfinished multipart upload of this key exists with the same part layout,
+        ie from an earlier failed attempt with the same part_size, parts it already holds with matching md5s
+        are not uploaded again and a failed upload is left in place to be resumed. Otherwise a failed upload
+        is canceled.
+        bucket_name   The name of the walrus Bucket.
+        key_name      The name of the object containing the data in walrus.
+        path_to_file  Fully qualified path to local file.
+        contents      String to upload if path_to_file is not provided, see upload_object_from_stream()
+        part_size     Size in bytes of each part, all but the last part must be at least 5MB
+        workers       Number of parts uploaded concurrently
+        resume        Reuse the parts of an existing unfinished upload of this key with the same part layout
+        verify_etag   Compare the ETag of the completed upload with the ETag computed locally
+        retries       Number of times a failed part upload is retried
+        Returns the uploaded key, with the md5 of its data in key.eutest_md5
+        """
+        if path_to_file is None:
+            return self.upload_object_from_stream(bucket_name, key_name, cStringIO.StringIO(contents or ''),
+                                                  part_size=part_size, workers=workers, verify_etag=verify_etag,
+                                                  retries=retries)
+        bucket = self.get_bucket_by_name(bucket_name)
+        if bucket == None:
+            raise S3opsException("Could not find bucket " + bucket_name + " to upload file")
+        size = os.path.getsize(path_to_file)
+        part_count = max(1, (size + part_size - 1) / part_size)
+        mp = None
+        existing = {}
+        if resume:
+            #Only reuse an upload whose parts all fit this file's part layout, parts of an upload made with a
+            #different part_size would otherwise be included when the upload is completed
+            for upload in bucket.get_all_multipart_uploads():
+                if upload.key_name != key_name:
+                    continue
+                parts = {}
+                for part in upload:
+                    parts[part.part_number] = (str(part.etag).strip('"'), part.size)
+                matches = True
+                for part_num, (etag, part_len) in parts.iteritems():
+                    if part_num > part_count or part_len != min(part_size, size - (part_num - 1) * part_size):
+                        matches = False
+                        break
+                if not matches:
+                    self.debug("Not resuming multipart upload:" + str(upload.id) + " for key:" + str(key_name) +
+                               ", its parts do not match part_size:" + str(part_size))
+                elif mp is None or len(parts) > len(existing):
+                    mp = upload
+                    existing = parts
+            if mp:
+                self.debug("Resuming multipart upload:" + str(mp.id) + " for key:" + str(key_name) + " with " +
+                           str(len(existing)) + " existing parts")
+        if not mp:
+            mp = bucket.initiate_multipart_upload(key_name)
+        self.debug("Uploading " + str(size) + " bytes from " + str(path_to_file) + " to key:" + str(key_name) +
+                   " in " + str(part_count) + " parts, part_size:" + str(part_size) + ", workers:" + str(workers))
+
+        def upload_file_part(part_num):
+            with open(path_to_file, 'rb') as partfile:
+                partfile.seek((part_num - 1) * part_size)
+                data = partfile.read(part_size)
+            part_digest = hashlib.md5(data).digest()
+            if existing.get(part_num) == (part_digest.encode('hex'), len(data)):
+                self.debug("Part:" + str(part_num) + " already uploaded, skipping")
+            else:
+                self.upload_multipart_part(mp, part_num, data, part_digest, retries=retries)
+            return part_digest
+
+        object_md5 = hashlib.md5()
+        executor = ThreadPoolExecutor(max_workers=workers)
+        try:
+            futures = [executor.submit(upload_file_part, part_num) for part_num in xrange(1, part_count + 1)]
+            #compute the md5 of the entire object while the parts upload
+            with open(path_to_file, 'rb') as objfile:
+                for data in iter(lambda: objfile.read(1048576), ''):
+                    object_md5.update(data)
+            part_digests = [future.result() for future in futures]
+            completed = mp.complete_upload()
+        except Exception, e:
+            executor.shutdown(wait=True)
+            self.debug("Multipart upload:" + str(mp.id) + " for key:" + str(key_name) + " failed, err:" + str(e))
+            #when resuming leave the upload in place so a later attempt can resume it
+            if not resume:
+                self.debug("Canceling multipart upload:" + str(mp.id) + " for key:" + str(key_name))
+                mp.cancel_upload()
+            raise
+        executor.shutdown(wait=True)
+        etag = hashlib.md5("".join(part_digests)).hexdigest() + '-' + str(len(part_digests))
+        if verify_etag and str(completed.etag).strip('"') != etag:
+            raise S3opsException("Multipart ETag mismatch for key:" + str(key_name) + ", expected:" + etag +
+                                 ", got:" + str(completed.etag))
+        key = bucket.get_key(key_name)
+        key.eutest_md5 = object_md5.hexdigest()
+        self.debug("Uploaded key: " + str(key_name) + " to bucket:" + str(bucket_name) + " in " +
+                   str(part_count) + " parts, size:" + str(size) + ", md5:" + str(key.eutest_md5))
+        self.test_resources["keys"].append(key)
+        return key
+
+    def download_object(self, bucket_name, key_name, path_to_file=None, part_size=8388608, workers=4,
+                        md5=None, retries=2):
+        """
+        Read an object from walrus using concurrent ranged GETs of 'part_size' bytes, written into a
+        preallocated local file at their offsets, or assembled in memory if no path_to_file is given.
+        The md5 of the data is computed and verified against 'md5' if provided, otherwise against the key's
+        ETag when the ETag is a plain md5 (ie: not from a multipart upload).
+        bucket_name   The name of the walrus Bucket.
+        key_name      The name of the object to read
+        path_to_file  Local file to write to
+        part_size     Size in bytes of each ranged GET
+        workers       Number of ranged GETs in flight at once
+        md5           Expected md5 of the object's data, ie key.eutest_md5 from upload_object_multipart()
+        retries       Number of times a failed ranged GET is retried
+        Returns path_to_file, or the object's data as a string if path_to_file was not provided
+        """
+        bucket = self.get_bucket_by_name(bucket_name)
+        if bucket == None:
+            raise S3opsException("Could not find bucket " + bucket_name + " to download from")
+        key = bucket.get_key(key_name)
+        if key is None:
+            raise S3opsException("Could not find key " + str(key_name) + " in bucket " + str(bucket_name))
+        size = int(key.size)
+        ranges = [(start, min(start + part_size, size) - 1) for start in xrange(0, size, part_size)]
+        if path_to_file:
+            with open(path_to_file, 'wb') as destfile:
+                destfile.truncate(size)
+        buffers = {}
+
+        def get_range(start, end):
+            for attempt in xrange(0, retries + 1):
+                try:
+                    buf = cStringIO.StringIO()
+                    bucket.new_key(key_name).get_contents_to_file(buf, headers={'Range': 'bytes=%s-%s' % (start, end)})
+                    data = buf.getvalue()
+                    if len(data) != (end + 1) - start:
+                        raise S3opsException("Got " + str(len(data)) + " bytes for range " + str(start) + "-" +
+                                             str(end) + " of key:" + str(key_name))
+                    break
+                except Exception, e:
+                    if attempt >= retries:
+                        raise
+                    self.debug("Retrying range " + str(start) + "-" + str(end) + " of key:" + str(key_name) +
+                               ", err:" + str(e))
+            if path_to_file:
+                with open(path_to_file, 'r+b') as destfile:
+                    destfile.seek(start)
+                    destfile.write(data)
+            else:
+                buffers[start] = data
+            return hashlib.md5(data).digest()
+
+        executor = ThreadPoolExecutor(max_workers=workers)
+        try:
+            futures = [executor.submit(get_range, start, end) for start, end in ranges]
+            for future in futures:
+                future.result()
+        finally:
+            executor.shutdown(wait=True)
+        object_md5 = hashlib.md5()
+        if path_to_file:
+            with open(path_to_file, 'rb') as destfile:
+                for data in iter(lambda: destfile.read(1048576), ''):
+                    object_md5.update(data)
+            result = path_to_file
+        else:
+            result = "".join(buffers[start] for start, end in ranges)
+            object_md5.update(result)
+        etag = str(key.etag).strip('"')
+        if md5 is None and '-' not in etag:
+            md5 = etag
+        if md5 and object_md5.hexdigest() != md5:
+            raise S3opsException("MD5 mismatch for key:" + str(key_name) + ", expected:" + str(md5) + ", got:" +
+                                 object_md5.hexdigest())
+        self.debug("Downloaded key: " + str(key_name) + " from bucket:" + str(bucket_name) + " in " +
+                   str(len(ranges)) + " ranges, size:" + str(size) + ", md5:" + object_md5.hexdigest())
+        return result
+
+    def read_stream_part(self, stream, part_size):
+        """
+        Reads up to part_size bytes from stream, returns less only at the end of the stream
+        """
+        chunks = []
+        remaining = part_size
+        while remaining > 0:
+            data = stream.read(remaining)
+            if not data:
+                break
+            chunks.append(data)
+            remaining -= len(data)
+        return "".join(chunks)
+
+    def upload_multipart_part(self, mp, part_num, data, part_digest=None, retries=2):
+        """
+        Uploads data as part number 'part_num' of the multipart upload 'mp', sending its md5 for the server to
+        verify. Retries upon failure.
+        """
+        part_digest = part_digest or hashlib.md5(data).digest()
+        md5 = (part_digest.encode('hex'), base64.b64encode(part_digest))
+        for attempt in xrange(0, retries + 1):
+            try:
+                mp.upload_part_from_file(cStringIO.StringIO(data), part_num, md5=md5, size=len(data))
+                return part_num
+            except Exception, e:
+                if attempt >= retries:
+                    raise
+                self.debug("Retrying part:" + str(part_num) + " of upload:" + str(mp.id) + ", err:" + str(e))
+
     def get_objects_by_prefix(self, bucket_name, prefix):
         """
         Get keys in the specified bucket that match the prefix if no prefix is passed all objects are returned
@@ -208,11 +502,16 @@ class S3ops(Eutester):
         except Exception, e:
             return
         
-    def clear_bucket(self, bucket_name=None):
+    def clear_bucket(self, bucket_name=None, workers=8, batch_size=1000, use_multi_delete=None):
         """Deletes the contents of the bucket specified and the bucket itself
             THIS WILL DELETE EVERYTHING!
            bucket       bucket name to clear
+           workers      number of delete requests in flight at once
+           batch_size   number of keys per multi-object delete request, max 1000
+           use_multi_delete  use multi-object delete requests. If None, multi-object delete is tried first and
+                             keys are deleted individually by 'workers' threads if the endpoint does not support it.
         """
+        bucket_name = getattr(bucket_name, 'name', bucket_name)
         try :
             bucket = self.s3.get_bucket(bucket_name=bucket_name)      
         except S3ResponseError as e:
@@ -221,15 +520,14 @@ class S3ops(Eutester):
         
         try:
             self.debug( "Getting bucket listing for " + bucket.name )     
-            self.debug(  "Iterating throught the bucket" )
-            key_list = bucket.list()        
-            self.debug(  "Starting loop" )
-            for k in key_list:
-                if isinstance(k, boto.s3.prefix.Prefix):
-                    self.debug(  "Skipping prefix" )
-                    continue
-                self.debug(  "Deleting key: " + k.name )
-                bucket.delete_key(k)
+            #the listing is paginated lazily, keys are deleted while later pages are fetched
+            try:
+                self.delete_keys_bulk(bucket, bucket.list(), workers=workers, batch_size=batch_size,
+                                      use_multi_delete=use_multi_delete)
+            except S3opsException as e:
+                #Keys a multi-object delete failed to delete are only logged. Deleting the bucket then fails
+                #with a 409 if keys remain, which leads to the versioning cleanup below.
+                self.debug("Failed to delete some keys from bucket " + bucket.name + ": " + str(e.msg))
             bucket.delete()
         except S3ResponseError as e:
             self.debug(  "Exception caught doing bucket cleanup." )
@@ -238,36 +536,109 @@ class S3ops(Eutester):
                 #Do version cleanup
                 self.debug(  "Cleaning up versioning artifacts" )
                 try:
-                    keys = bucket.get_all_versions()
-                    for k in keys:
-                        if isinstance(k, Key):
-                            self.debug(  "Got version: " + k.name + "--" + k.version_id + "-- Delete marker? " + str(k.delete_marker) )
-                            self.debug(  "Deleting key: " + k.name )
-                            bucket.delete_key(key_name=k.name,version_id=k.version_id)
-                        elif isinstance(k, DeleteMarker):
-                            self.debug(  "Got marker: " + k.name + "--" + k.version_id + "--" + str(k.is_latest) )
-                            self.debug(  "Deleting delete marker" )
-                            bucket.delete_key(key_name=k.name,version_id=k.version_id)
+                    #versions and delete markers are both deleted by name and version id
+                    self.delete_keys_bulk(bucket, bucket.list_versions(), workers=workers, batch_size=batch_size,
+                                          use_multi_delete=use_multi_delete)
                     self.debug(  "Deleting bucket " + bucket.name )
                     bucket.delete()
                 except Exception as e:
-                    self.debug(  "Exception deleting versioning artifacts: " + e.message )
+                    self.debug(  "Exception deleting versioning artifacts: " + str(getattr(e, 'msg', e.message)) )
             else:
                 self.debug('Got ' + e.message + ' and status ' + str(e.status))
-                    
+
+    def delete_keys_bulk(self, bucket, keys, workers=8, batch_size=1000, use_multi_delete=None):
+        """
+        Deletes keys, versions and delete markers from a bucket as they are read from the iterable 'keys', ie a
+        lazily paginated bucket.list() or bucket.list_versions(), without building the full listing first.
+        Keys are sent in multi-object delete requests of batch_size keys, several in flight at once. If the
+        endpoint does not support multi-object delete, keys are deleted individually by a pool of threads.
+        bucket            boto bucket obj to delete from
+        keys              iterable of Key, DeleteMarker or Prefix objs. Prefixes are skipped.
+        workers           number of delete requests in flight at once
+        batch_size        number of keys per multi-object delete request, max 1000
+        use_multi_delete  True, False, or None to detect support with the first request
+        Returns number of keys deleted
+        """
+        batch_size = max(1, min(int(batch_size), 1000))
+        executor = ThreadPoolExecutor(max_workers=workers)
+        pending = set()
+        errors = []
+        state = {'deleted': 0, 'multi_delete': use_multi_delete}
+        lock = threading.Lock()
+        start = time.time()
+
+        def delete_batch(batch, detect=False):
+            try:
+                result = bucket.delete_keys(batch, quiet=True)
+            except S3ResponseError as e:
+                if detect and e.status in [400, 405, 501]:
+                    self.debug("Multi-object delete not supported by endpoint, status:" + str(e.status) +
+                               ", deleting keys individually")
+                    return False
+                raise
+            with lock:
+                errors.extend(str(error.key) + ':' + str(error.code) + ':' + str(error.message)
+                              for error in result.errors)
+                state['deleted'] += len(batch) - len(result.errors)
+            return True
+
+        def delete_one(name, version_id):
+            bucket.delete_key(name, version_id=version_id)
+            with lock:
+                state['deleted'] += 1
+
+        def submit(func, *args):
+            pending.add(executor.submit(func, *args))
+            if len(pending) >= workers * 2:
+                done, remaining = wait(pending, return_when=FIRST_COMPLETED)
+                pending.difference_update(done)
+                for future in done:
+                    future.result()
+
+        def flush(batch):
+            if state['multi_delete'] is None:
+                #detect support with this first request before sending any others
+                state['multi_delete'] = delete_batch(batch, detect=True)
+                if state['multi_delete']:
+                    return
+            if state['multi_delete']:
+                submit(delete_batch, batch)
+            else:
+                for name, version_id in batch:
+                    submit(delete_one, name, version_id)
+
+        try:
+            batch = []
+            for key in keys:
+                if isinstance(key, boto.s3.prefix.Prefix):
+                    continue
+                version_id = getattr(key, 'version_id', None)
+                if version_id == 'null':
+                    version_id = None
+                batch.append((key.name, version_id))
+                if len(batch) >= batch_size:
+                    flush(batch)
+                    batch = []
+            if batch:
+                flush(batch)
+            for future in pending:
+                future.result()
+        finally:
+            executor.shutdown(wait=True)
+        self.debug("Deleted " + str(state['deleted']) + " keys from bucket " + str(bucket.name) + " in " +
+                   "%.2f" % (time.time() - start) + " seconds, multi-object delete:" + str(state['multi_delete']))
+        if errors:
+            raise S3opsException("Failed to delete " + str(len(errors)) + " keys from bucket " + str(bucket.name) +
+                                 ": " + ", ".join(errors[:10]))
+        return state['deleted']
+
     def clear_keys_with_prefix(self, bucket, prefix):
         try :
-            listing = self.walrus.get_all_buckets()        
+            listing = self.s3.get_all_buckets()        
             for bucket in listing:
                 if bucket.name.startswith(prefix):
                     self.debug( "Getting bucket listing for " + bucket.name)
-                    key_list = bucket.list()
-                    for k in key_list:
-                        if isinstance(k, boto.s3.prefix.Prefix):
-                            self.debug( "Skipping prefix" )
-                            continue
-                        self.debug( "Deleting key: " + k.name )
-                        bucket.delete_key(k)
+                    self.delete_keys_bulk(bucket, bucket.list())
                     bucket.delete()
                 else:
                     self.debug( "skipping bucket: " + bucket.name )
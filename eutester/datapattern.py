@@ -0,0 +1,141 @@
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2009-2011, Eucalyptus Systems, Inc.
+# All rights reserved.
+#
+# Redistribution and use of this software in source and binary forms, with or
+# without modification, are permitted provided that the following conditions
+# are met:
+#
+#   Redistributions of source code must retain the above
+#   copyright notice, this list of conditions and the
+#   following disclaimer.
+#
+#   Redistributions in binary form must reproduce the above
+#   copyright notice, this list of conditions and the
+#   following disclaimer in the documentation and/or other
+#   materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+'''
+Deterministic, seeded data pattern used to fill volumes and verify them without reading back what was written.
+
+The pattern is a stream of pseudo random bytes derived from a seed string. Each block of 'block_size' bytes
+is generated independently from the seed and the block's index, so any byte range can be produced, or its md5
+computed, without producing the bytes before it. The same generator source is run locally and on the guest
+(see get_remote_write_cmd()), so the guest only needs a python interpreter.
+
+Sample:
+    from eutester.datapattern import DataPattern
+    pattern = DataPattern('vol-12345678')
+    #write the first 1GB of the pattern into a device on the guest...
+    instance.sys(pattern.get_remote_write_cmd(0, 1073741824) + ' | dd of=/dev/vdb obs=1048576')
+    #expected checksum of any range, computed locally...
+    md5 = pattern.md5_range(524288000, 1048576)
+'''
+import base64
+import hashlib
+import re
+
+
+#Python 2 and 3 compatible generator source, exec'd locally and sent to the guest
+pattern_source = """
+import hashlib
+import struct
+
+
+def pattern_block(seed, index, block_size):
+    key = hashlib.sha256(('%s:%d' % (seed, index)).encode('utf-8')).digest()
+    chunks = []
+    for counter in range((block_size + 63) // 64):
+        chunks.append(hashlib.sha512(key + struct.pack('>Q', counter)).digest())
+    return key[:0].join(chunks)[:block_size]
+
+
+def pattern_range(seed, offset, length, block_size):
+    pos = offset
+    end = offset + length
+    while pos < end:
+        index = pos // block_size
+        block = pattern_block(seed, index, block_size)
+        start = pos - (index * block_size)
+        chunk = block[start:start + (end - pos)]
+        pos += len(chunk)
+        yield chunk
+"""
+
+#Appended to pattern_source when run on the guest, writes the requested range to stdout
+pattern_write_source = """
+import sys
+out = getattr(sys.stdout, 'buffer', sys.stdout)
+for chunk in pattern_range(sys.argv[1], int(sys.argv[2]), int(sys.argv[3]), int(sys.argv[4])):
+    out.write(chunk)
+out.flush()
+"""
+
+_pattern_namespace = {}
+exec(pattern_source, _pattern_namespace)
+pattern_block = _pattern_namespace['pattern_block']
+pattern_range = _pattern_namespace['pattern_range']
+
+
+class DataPattern():
+    def __init__(self, seed, block_size=1048576):
+        '''
+        :param seed: string used to derive the pattern, ie a volume id
+        :param block_size: size in bytes of the independently generated blocks of the pattern. The same
+                           block_size must be used when writing and verifying.
+        '''
+        if not seed or re.search("['\\s]", str(seed)):
+            raise Exception('DataPattern requires a seed without quotes or whitespace, got:' + str(seed))
+        self.seed = str(seed)
+        self.block_size = int(block_size)
+
+    def get_block(self, index):
+        '''
+        Returns block number 'index' of the pattern
+        '''
+        return pattern_block(self.seed, int(index), self.block_size)
+
+    def get_range(self, offset, length):
+        '''
+        Returns 'length' bytes of the pattern starting at byte 'offset'
+        '''
+        chunks = list(pattern_range(self.seed, int(offset), int(length), self.block_size))
+        if not chunks:
+            return ''
+        return chunks[0][:0].join(chunks)
+
+    def md5_range(self, offset, length):
+        '''
+        Returns the md5 hex digest of 'length' bytes of the pattern starting at byte 'offset', as md5sum
+        would report for the same range of a device filled with this pattern.
+        '''
+        md5 = hashlib.md5()
+        for chunk in pattern_range(self.seed, int(offset), int(length), self.block_size):
+            md5.update(chunk)
+        return md5.hexdigest()
+
+    def get_remote_write_cmd(self, offset, length, python=None):
+        '''
+        Returns a shell command which writes 'length' bytes of the pattern starting at byte 'offset' to stdout
+        on a remote machine, using the first python interpreter found there, for use in a pipeline.
+        :param python: optional path to the python interpreter to use on the remote machine
+        '''
+        python = python or '$(command -v python || command -v python3 || command -v python2)'
+        encoded = base64.b64encode((pattern_source + pattern_write_source).encode('utf-8'))
+        if not isinstance(encoded, str):
+            encoded = encoded.decode('ascii')
+        return python + ' -c "import base64; exec(base64.b64decode(\'' + encoded + '\'))" ' + \
+               "'" + self.seed + "' " + str(int(offset)) + ' ' + str(int(length)) + ' ' + \
+               str(self.block_size)
@@ -51,8 +51,11 @@ from boto.ec2.instance import Instance
 from eutester import Eutester
 from eutester.euvolume import EuVolume
 from eutester import eulogger
+from eutester.datapattern import DataPattern
+from eutester.hashtree import HashTree
 from eutester.taggedresource import TaggedResource
 from random import randint
+from fractions import gcd
 import sshconnection
 import sys
 import os
@@ -82,7 +85,10 @@ class EuInstance(Instance, TaggedResource):
                                       cmdstart=None,
                                       try_non_root_exec=True,
                                       exec_password=None,
-                                      retry=2
+                                      retry=2,
+                                      security_groups=None,
+                                      vmtype_info=None,
+                                      bdm_root_vol=None
                                       ):
         '''
         Primary constructor for this class. Note: to avoid an ssh session within this method, provide keys, username/pass later.
@@ -98,6 +104,9 @@ class EuInstance(Instance, TaggedResource):
         debugmethod - optional - method, used for debug output 
         verbose - optional - boolean to determine if debug is to be printed using debug()
         retry - optional - integer, ssh connection attempts for non-authentication failures
+        security_groups - optional - list of security group objs already fetched for this instance's reservation
+        vmtype_info - optional - vm type info obj already fetched for this instance's zone and type
+        bdm_root_vol - optional - EuVolume obj already fetched for this instance's ebs root volume
         '''
         newins = EuInstance(instance.connection)
         newins.__dict__ = instance.__dict__
@@ -117,6 +126,7 @@ class EuInstance(Instance, TaggedResource):
         newins.vmtype_info = None
         newins.use_sudo = None
         newins.security_groups = []
+        newins.blockdev_md5_cache = {}
 
         newins.tester = tester
         newins.debugmethod = debugmethod
@@ -141,7 +151,9 @@ class EuInstance(Instance, TaggedResource):
         newins.retry = retry    
         newins.private_addressing = private_addressing
         newins.reservation = reservation or newins.get_reservation()
-        if newins.reservation:
+        if security_groups is not None:
+            newins.security_groups = security_groups
+        elif newins.reservation:
             newins.security_groups = newins.tester.get_instance_security_groups(newins)
         else:
             newins.security_groups = None
@@ -149,8 +161,13 @@ class EuInstance(Instance, TaggedResource):
         newins.cmdstart = cmdstart
         newins.auto_connect = auto_connect
         newins.set_last_status()
-        newins.update_vm_type_info()
-        if newins.root_device_type == 'ebs':
+        if vmtype_info is not None:
+            newins.vmtype_info = vmtype_info
+        else:
+            newins.update_vm_type_info()
+        if newins.root_device_type == 'ebs' and bdm_root_vol:
+            newins.bdm_root_vol = bdm_root_vol
+        elif newins.root_device_type == 'ebs':
             try:
                 volume = newins.tester.get_volume(volume_id = newins.block_device_mapping.get(newins.root_device_name).volume_id)
                 newins.bdm_root_vol = EuVolume.make_euvol_from_vol(volume, tester=newins.tester,cmdstart=newins.cmdstart)
@@ -170,8 +187,16 @@ class EuInstance(Instance, TaggedResource):
 
         return newins
     
-    def update(self):
-        super(EuInstance, self).update()
+    def update(self, instance=None):
+        """
+        Updates this instance's state. If 'instance' is provided, the update is applied from that already fetched
+        instance obj (ie from a batched describe, see EC2ops.update_instances()) instead of a new describe request.
+        :param instance: optional boto instance obj with the same id as this instance
+        """
+        if instance is not None:
+            self._update(instance)
+        else:
+            super(EuInstance, self).update()
         self.set_last_status()
     
     def set_last_status(self,status=None):
@@ -255,7 +280,8 @@ class EuInstance(Instance, TaggedResource):
         self.debug('reset_ssh_connection for:'+str(self.id))
         if ((self.keypath is not None) or ((self.username is not None)and(self.password is not None))):
             if self.ssh is not None:
-                self.ssh.close()
+                #the old connection may be dead (ie after a reboot), do not leave it pooled for the new one
+                self.ssh.close(invalidate=True)
             self.debug('Connecting ssh '+str(self.id))
             self.ssh = sshconnection.SshConnection(
                                                     self.ip_address,
@@ -620,6 +646,162 @@ class EuInstance(Instance, TaggedResource):
         self.tester.wait_for_result(try_to_write_to_disk, True)
         self.debug('Success attaching volume:'+str(euvolume.id)+' to instance:'+self.id+', cloud dev:'+str(euvolume.attach_data.device)+', attached dev:'+str(attached_dev))
         return attached_dev
+
+    def attach_euvolumes(self, euvolumes, timeout=180, poll_interval=5, overwrite=False):
+        '''
+        Attaches a list of volumes at once. The attach requests for all volumes are sent together, their cloud
+        state is then monitored with one batched describe per poll, and the guest devices of the whole batch are
+        resolved from a single remote inventory of the new block devices. See attach_euvolume() for a single volume.
+        Guest devices are matched to volumes by existing md5 (see EuVolume.md5/md5len), by the device serial
+        matching the volume id, by the requested device name when not using virtio_blk, and by unique size. A
+        single volume left unmatched takes the single remaining device, otherwise an exception is raised.
+        Volumes which already have an md5 are not written to, the md5 of their matched device is checked against
+        it instead. Volumes without an md5 have unique data written to their head and its md5 recorded.
+        required - euvolumes - list of volumes to attach, volumes not of type euvolume will be converted
+        optional - timeout - integer- time allowed for all volumes to attach and appear on the guest
+        optional - poll_interval - integer seconds between cloud and guest state checks
+        optional - overwrite - flag to indicate whether to overwrite head data of a non-zero filled volume upon attach for md5
+        returns list of attached euvolumes
+        '''
+        euvolumes = [vol if isinstance(vol, EuVolume) else EuVolume.make_euvol_from_vol(vol, self.tester)
+                     for vol in euvolumes]
+        if not euvolumes:
+            return euvolumes
+        start = time.time()
+        self.set_block_device_prefix()
+        dev_list_before = self.get_dev_dir()
+        devs = self.get_free_scsi_devs(len(euvolumes))
+        requested = {}
+        for euvolume, dev in zip(euvolumes, devs):
+            self.debug("Sending attach for volume:" + str(euvolume.id) + " to instance:" + str(self.id) +
+                       " at dev:" + str(dev))
+            euvolume.attach(self.id, dev)
+            requested[euvolume.id] = dev
+        self.tester.monitor_euvolumes_to_status(euvolumes, status='in-use', attached_status='attached',
+                                                poll_interval=poll_interval, timeout=timeout)
+        for euvolume in euvolumes:
+            if euvolume.attach_data.device != requested[euvolume.id]:
+                raise Exception('Attached device:' + str(euvolume.attach_data.device) + " for volume:" +
+                                str(euvolume.id) + ", does not equal requested dev:" + str(requested[euvolume.id]))
+        #Wait for a new guest device per volume, then inventory them all at once...
+        new_devs = []
+        inventory = {}
+        elapsed = int(time.time() - start)
+        while elapsed < timeout:
+            new_devs = sorted(set(self.get_dev_dir()) - set(dev_list_before))
+            inventory = self.get_block_dev_inventory(new_devs, md5lens=[vol.md5len for vol in euvolumes if vol.md5])
+            if len(inventory) >= len(euvolumes):
+                break
+            self.debug("Found " + str(len(inventory)) + "/" + str(len(euvolumes)) + " new devices on guest, elapsed:" +
+                       str(elapsed) + "/" + str(timeout))
+            time.sleep(poll_interval)
+            elapsed = int(time.time() - start)
+        if len(inventory) < len(euvolumes):
+            raise Exception(str(self.id) + ': Only ' + str(len(inventory)) + ' of ' + str(len(euvolumes)) +
+                            ' attached volumes found on guest after ' + str(elapsed) + ' seconds, new devs:' +
+                            ",".join(new_devs))
+        unmatched = list(euvolumes)
+        free = sorted(inventory)
+
+        def assign(vol, dev, reason):
+            vol.guestdev = '/dev/' + dev
+            unmatched.remove(vol)
+            free.remove(dev)
+            self.debug(str(vol.id) + " Requested dev:" + str(vol.attach_data.device) + ", attached to guest device:" +
+                       str(vol.guestdev) + ", matched by " + reason)
+
+        for vol in list(unmatched):
+            if vol.md5:
+                for dev in free:
+                    if inventory[dev]['md5'].get(int(vol.md5len)) == vol.md5:
+                        assign(vol, dev, 'md5')
+                        break
+        for vol in list(unmatched):
+            for dev in free:
+                serial = self.normalize_volume_id(inventory[dev]['serial'])
+                if serial and serial == self.normalize_volume_id(vol.id):
+                    assign(vol, dev, 'serial')
+                    break
+        if not self.virtio_blk:
+            #virtio_blk guests name devices in attach order regardless of the requested name
+            for vol in list(unmatched):
+                name = str(vol.attach_data.device).replace('/dev/', '')
+                for dev in free:
+                    if dev == name or re.sub('^(sd|xvd)', '', dev) == re.sub('^(sd|xvd)', '', name):
+                        assign(vol, dev, 'device name')
+                        break
+        for vol in list(unmatched):
+            size = int(vol.size) * 1073741824
+            sized = [dev for dev in free if inventory[dev]['size'] == size]
+            if len(sized) == 1 and len([v for v in unmatched if int(v.size) == int(vol.size)]) == 1:
+                assign(vol, sized[0], 'size')
+        if len(unmatched) == 1 and len(free) == 1:
+            assign(unmatched[0], free[0], 'only remaining device')
+        if unmatched:
+            raise Exception(str(self.id) + ': Could not match guest devices:' + ",".join(free) + ' to volumes:' +
+                            ",".join(str(vol.id) for vol in unmatched) + ', attach these volumes one at a time')
+        for euvolume in euvolumes:
+            if euvolume.md5:
+                found_md5 = inventory[euvolume.guestdev.replace('/dev/', '')]['md5'].get(int(euvolume.md5len))
+                if found_md5 != euvolume.md5:
+                    raise Exception(str(euvolume.id) + ': md5:' + str(found_md5) + ' of guest device:' +
+                                    str(euvolume.guestdev) + ' does not match volume md5:' + str(euvolume.md5) +
+                                    ', md5len:' + str(euvolume.md5len))
+        for euvolume in euvolumes:
+            self.attached_vols.append(euvolume)
+        #Write unique data to the head of volumes without an existing md5, and md5 it
+        for euvolume in euvolumes:
+            if euvolume.md5:
+                continue
+            def try_to_write_to_disk():
+                try:
+                    self.vol_write_random_data_get_md5(euvolume, overwrite=overwrite)
+                    return True
+                except:
+                    return False
+            self.tester.wait_for_result(try_to_write_to_disk, True)
+        self.debug('Success attaching ' + str(len(euvolumes)) + ' volumes to instance:' + str(self.id) + ' after ' +
+                   str(int(time.time() - start)) + ' seconds')
+        return euvolumes
+
+    @staticmethod
+    def normalize_volume_id(volume_id):
+        '''
+        Returns a volume id or block device serial in a comparable form, ie 'vol-1234ABCD' and '1234abcd'
+        both return '1234abcd'
+        '''
+        volume_id = re.sub('[^a-z0-9]', '', str(volume_id or '').lower())
+        return re.sub('^vol', '', volume_id)
+
+    def get_block_dev_inventory(self, devs, md5lens=None):
+        '''
+        Returns the size, serial and md5sums of the head of each of the given guest block devices using a single
+        remote command. Partitions and devices not found are omitted.
+        devs - mandatory - list of device names in /dev, ie ['vdb', 'vdc']
+        md5lens - optional - list of lengths in bytes from the head of each device to calculate md5sums for
+        returns dict mapping device name to {'size': bytes, 'serial': string, 'md5': {md5len: md5}}
+        '''
+        inventory = {}
+        if not devs:
+            return inventory
+        md5lens = sorted(set(int(x) for x in (md5lens or [])))
+        cmd = 'for dev in ' + " ".join(str(dev) for dev in devs) + '; do ' + \
+              '[ -e "/sys/block/$dev" ] || continue; ' + \
+              'echo "dev $dev $(blockdev --getsize64 /dev/$dev 2>/dev/null || echo 0) ' + \
+              '$(cat /sys/block/$dev/serial 2>/dev/null)"; '
+        if md5lens:
+            cmd += 'for len in ' + " ".join(str(x) for x in md5lens) + '; do ' + \
+                   'echo "md5 $dev $len $(head -c $len /dev/$dev 2>/dev/null | md5sum | cut -d\' \' -f1)"; done; '
+        cmd += 'done'
+        for line in self.sys(cmd, verbose=False):
+            fields = str(line).split()
+            if len(fields) >= 3 and fields[0] == 'dev':
+                inventory[fields[1]] = {'size': int(fields[2]) if fields[2].isdigit() else 0,
+                                        'serial': " ".join(fields[3:]),
+                                        'md5': {}}
+            elif len(fields) == 4 and fields[0] == 'md5' and fields[1] in inventory:
+                inventory[fields[1]]['md5'][int(fields[2])] = fields[3]
+        return inventory
     
     def detach_euvolume(self, euvolume, waitfordev=True, timeout=180):
         '''
@@ -663,6 +845,69 @@ class EuInstance(Instance, TaggedResource):
                     raise Exception("Volume("+str(vol.id)+") failed to detach from device("+str(dev)+") on ("+str(self.id)+")")
         raise Exception("Detach Volume("+str(euvolume.id)+") not found on ("+str(self.id)+")")
         return True
+
+    def detach_euvolumes(self, euvolumes, waitfordev=True, timeout=180, poll_interval=5):
+        '''
+        Detaches a list of volumes at once. The detach requests for all volumes are sent together, their cloud
+        state is then monitored with one batched describe per poll, and the guest is checked for the removal of
+        all their devices with one remote command per poll. See detach_euvolume() for a single volume.
+        required - euvolumes - list of euvolumes attached to this instance
+        optional - waitfordev - boolean to indicate whether or no to poll guest instance for local devices to be removed
+        optional - timeout - integer seconds to wait before timing out waiting for the volumes to detach
+        optional - poll_interval - integer seconds between cloud and guest state checks
+        '''
+        start = time.time()
+        detaching = []
+        for euvolume in euvolumes:
+            for vol in self.attached_vols:
+                if vol.id == euvolume.id:
+                    detaching.append(vol)
+                    break
+            else:
+                raise Exception("Detach Volume(" + str(euvolume.id) + ") not found on (" + str(self.id) + ")")
+        if not detaching:
+            return True
+        for vol in detaching:
+            vol.detach()
+            self.debug("Sent detach for volume: " + vol.id + " which is currently in state: " + vol.status)
+        self.tester.monitor_euvolumes_to_status(detaching, status='available', poll_interval=poll_interval,
+                                                timeout=timeout)
+        if not waitfordev:
+            for vol in detaching:
+                self.attached_vols.remove(vol)
+            return True
+        remaining = list(detaching)
+        elapsed = int(time.time() - start)
+        while remaining:
+            present = self.get_dev_dir()
+            for vol in list(remaining):
+                if str(vol.guestdev).replace('/dev/', '').strip() not in present:
+                    remaining.remove(vol)
+                    self.attached_vols.remove(vol)
+            if not remaining or elapsed >= timeout:
+                break
+            self.debug("Waiting for devices '" + ",".join(str(vol.guestdev) for vol in remaining) +
+                       "' on guest to be removed. Elapsed:" + str(elapsed))
+            time.sleep(poll_interval)
+            elapsed = int(time.time() - start)
+        if remaining:
+            #one last check, in case devs have changed.
+            errmsg = ""
+            md5_maps = {}
+            for vol in remaining:
+                if vol.md5len not in md5_maps:
+                    md5_maps[vol.md5len] = self.get_blockdev_md5_map(vol.md5len, use_cache=False)
+                if md5_maps[vol.md5len].get(str(vol.guestdev).strip()) == vol.md5:
+                    errmsg += "Volume(" + str(vol.id) + ") detached, but device(" + str(vol.guestdev) + \
+                              ") still present on (" + str(self.id) + ")\n"
+                else:
+                    #assume the cloud has successfully released the device, guest may have not
+                    self.debug(str(self.id) + 'previously attached device for vol(' + str(vol.id) +
+                               ') no longer matches md5')
+                    self.attached_vols.remove(vol)
+            if errmsg:
+                raise Exception(errmsg)
+        return True
     
     def get_metadata(self, element_path, prefix='latest/meta-data/', timeout=10, staticmode=False):
         """Return the lines of metadata from the element path provided"""
@@ -745,6 +990,8 @@ class EuInstance(Instance, TaggedResource):
         while all_vols and elapsed < volto:
             elapsed = int(time.time()-start)
             loop_vols = copy.copy(all_vols)
+            #update all remaining volumes with a single describe request per poll
+            self.tester.update_volumes(loop_vols)
             for vol in loop_vols:
                 vol_status = 'available'
                 fail_fast_status = 'deleted'
@@ -759,7 +1006,6 @@ class EuInstance(Instance, TaggedResource):
                     self.debug('volume:' + str(vol.id) + "/" + str(vol.status) +", was attached, waiting on status:" +
                                str(vol_status) + ", elapsed:" + str(elapsed) + "/" + str(volto) )
                 vol.expected_status = vol_status
-                vol.update()
                 #if volume has reached it's intended status or
                 # the volume is no longer on the system and it's intended status is 'deleted'
                 if vol.status == vol_status or (not self.tester.get_volume(volume_id=vol.id, eof=False) and vol_status == 'deleted'):
@@ -833,6 +1079,39 @@ class EuInstance(Instance, TaggedResource):
                 dev = None
         if dev is None:
             raise Exception("Could not find a free scsi dev on instance:"+self.id+", maxdevs:"+str(maxdevs)+"\nCloud_devs:"+str(in_use_cloud)+"\nGuest_devs:"+str(in_use_guest))
+
+    def get_free_scsi_devs(self, count, prefix=None, maxdevs=16):
+        '''
+        Returns a list of 'count' cloud level device names not currently associated with a volume, using a
+        single describe of the volumes attached to this instance. See get_free_scsi_dev().
+        required - count - number of device names needed
+        optional - prefix - string, pre-pended to the the device search string
+        optional - maxdevs - number use to specify the max device names to iterate over.Some virt envs have a limit of 16 devs.
+        '''
+        if prefix is None:
+            prefix = self.block_device_prefix
+        in_use = set()
+        for avol in self.attached_vols:
+            if avol.attach_data:
+                in_use.add(avol.attach_data.device)
+        for vol in self.tester.get_volumes(attached_instance=self.id):
+            if vol.attach_data is not None:
+                in_use.add(vol.attach_data.device)
+        devs = []
+        d = 'e'
+        for x in xrange(0, maxdevs):
+            #double up the letter identifier to avoid exceeding z
+            if d == 'z':
+                prefix = prefix + 'e'
+            dev = "/dev/" + prefix + str(d)
+            if dev not in in_use:
+                devs.append(dev)
+                if len(devs) == count:
+                    self.debug("Instance:" + str(self.id) + " returning available cloud scsi devs:" + ",".join(devs))
+                    return devs
+            d = chr(ord('e') + x + 1)
+        raise Exception("Could not find " + str(count) + " free scsi devs on instance:" + self.id + ", maxdevs:" +
+                        str(maxdevs) + "\nIn use devs:" + ",".join(sorted(in_use)))
         
     def zero_fill_volume(self,euvolume):
         '''
@@ -844,17 +1123,22 @@ class EuInstance(Instance, TaggedResource):
         return self.time_dd(fillcmd)
 
     @Eutester.printinfo
-    def random_fill_volume(self,euvolume,srcdev=None, length=None, timepergig=90):
+    def random_fill_volume(self,euvolume,srcdev=None, length=None, timepergig=90, seed=None):
         '''
         Attempts to fill the entire given euvolume with unique non-zero data.
+        If 'seed' is provided the volume is instead filled with the deterministic pattern for that seed, see
+        pattern_fill_volume().
         The srcdev is read from in a set size, and then used to write to the euvolume to populate it. The file 
         helps with both speed up the copy in the urandom case, and adds both some level of randomness another src device as well as 
         allows smaller src devs to be used to fill larger euvolumes by repeatedly reading into the copy. 
         :param euvolume: the attached euvolume object to write data to
         :param srcdev: the source device to copy data from 
         :param length: the number of bytes to copy into the euvolume
+        :param seed: optional string, fill with the data pattern for this seed rather than from srcdev
         :returns dd's data/time stat
         '''
+        if seed is not None:
+            return self.pattern_fill_volume(euvolume, seed=seed, length=length, timepergig=timepergig)
         mb = 1048576
         gb = 1073741824 
         fsize = 10485760 #10mb
@@ -863,6 +1147,8 @@ class EuInstance(Instance, TaggedResource):
         
         voldev = euvolume.guestdev.strip()
         self.assertFilePresent(voldev)
+        #the volume's recorded hash tree no longer matches once it is written to
+        euvolume.hash_tree = None
         if srcdev is None:
             if self.found('ls /dev/urandom', 'urandom'):
                 srcdev = '/dev/urandom'
@@ -902,6 +1188,117 @@ class EuInstance(Instance, TaggedResource):
                 
             
     
+    def pattern_fill_volume(self, euvolume, seed=None, length=None, offset=0, block_size=1048576, timepergig=90):
+        '''
+        Writes the deterministic data pattern for 'seed' (see eutester.datapattern) into an attached euvolume.
+        Since the data written is known, the euvolume's md5 of its first md5len bytes is computed locally rather
+        than read back from the device, and any range can later be checked with verify_volume_pattern().
+        The pattern is generated on the guest by python, which must be installed.
+        :param euvolume: the attached euvolume object to write data to
+        :param seed: string the pattern is derived from, defaults to the euvolume's id
+        :param length: number of bytes to write, defaults to the remainder of the volume after 'offset'
+        :param offset: byte offset in the volume (and pattern) to start writing at, must be a multiple of block_size
+        :param block_size: pattern block size, also used as dd's output block size
+        :param timepergig: the time in seconds per gig, used to estimate an adequate timeout period
+        :returns dd's data/time stat
+        '''
+        gb = 1073741824
+        if not euvolume in self.attached_vols:
+            raise Exception(self.id+" Did not find this in instance's attached list. Can not write to this euvolume")
+        voldev = euvolume.guestdev.strip()
+        self.assertFilePresent(voldev)
+        euvolume.hash_tree = None
+        seed = seed or euvolume.id
+        offset = int(offset or 0)
+        if offset % block_size:
+            raise Exception('Pattern fill offset:' + str(offset) + ' is not a multiple of block_size:' + str(block_size))
+        if length is None:
+            length = (int(euvolume.size) * gb) - offset
+        length = int(length)
+        try:
+            python = self.sys('command -v python || command -v python3 || command -v python2', code=0)[0].strip()
+        except Exception, e:
+            raise Exception(str(self.id) + ': python is needed on the guest to generate the data pattern, err:' + str(e))
+        pattern = DataPattern(seed, block_size=block_size)
+        timeout = timepergig * ((length/gb) or 1)
+        ddcmd = pattern.get_remote_write_cmd(offset, length, python=python) + ' | dd of=' + str(voldev) + \
+                ' obs=' + str(block_size) + ' seek=' + str(offset / block_size)
+        ret = self.dd_monitor(ddcmd=ddcmd, timeout=timeout)
+        if int(ret['dd_bytes']) != length:
+            raise Exception('Pattern fill of ' + str(euvolume.id) + ' wrote ' + str(ret['dd_bytes']) +
+                            ' bytes, expected ' + str(length))
+        if euvolume.pattern_seed != seed or euvolume.pattern_block_size != block_size:
+            euvolume.pattern_length = 0
+        if offset <= euvolume.pattern_length:
+            euvolume.pattern_length = max(euvolume.pattern_length, offset + length)
+        euvolume.pattern_seed = seed
+        euvolume.pattern_block_size = block_size
+        if offset == 0:
+            euvolume.md5len = min(int(euvolume.md5len or 1024), length)
+            euvolume.md5 = pattern.md5_range(0, euvolume.md5len)
+            self.debug("Filled Volume:" + euvolume.id + " dev:" + voldev + " with pattern seed:" + str(seed) +
+                       ", md5:" + str(euvolume.md5) + ", md5len:" + str(euvolume.md5len))
+        return ret
+
+    def verify_volume_pattern(self, euvolume, seed=None, length=None, block_size=None, samples=8,
+                              sample_size=1048576, timeout=300):
+        '''
+        Verifies sampled ranges of an attached euvolume against md5s computed locally from the data pattern it was
+        filled with, see pattern_fill_volume(). The first and last sample_size bytes of the pattern and evenly
+        spaced ranges between are read on the guest with a single remote command.
+        The seed, length and block_size default to those recorded in the euvolume by pattern_fill_volume(). To
+        verify a volume created from a snapshot of a pattern filled volume, provide the original volume's values.
+        :param euvolume: the attached euvolume object to verify
+        :param seed: string the pattern was derived from
+        :param length: number of bytes of the volume filled with the pattern
+        :param block_size: pattern block size used when filling
+        :param samples: number of ranges to verify
+        :param sample_size: size in bytes of each range
+        :param timeout: remote command timeout in seconds
+        :returns list of verified (offset, length) tuples
+        '''
+        seed = seed or euvolume.pattern_seed
+        length = int(length or euvolume.pattern_length or 0)
+        block_size = block_size or euvolume.pattern_block_size or 1048576
+        if not seed or not length:
+            raise Exception('No pattern seed or length provided or recorded for volume:' + str(euvolume.id))
+        voldev = euvolume.guestdev.strip()
+        pattern = DataPattern(seed, block_size=block_size)
+        sample_size = min(int(sample_size), length)
+        #Sample offsets are aligned to sample_size, except the last which ends at 'length'
+        last = (length - sample_size) / sample_size
+        offsets = [0, length - sample_size]
+        for x in xrange(1, max(int(samples), 2) - 1):
+            offsets.append(((last * x) / (int(samples) - 1)) * sample_size)
+        offsets = sorted(set(offsets))
+        cmds = []
+        for offset in offsets:
+            #dd's block size must divide both the offset and sample_size, it is sample_size for aligned offsets
+            bs = gcd(offset, sample_size)
+            cmds.append('echo "' + str(offset) + ' $(dd if=' + str(voldev) + ' bs=' + str(bs) + ' skip=' +
+                        str(offset / bs) + ' count=' + str(sample_size / bs) +
+                        ' 2>/dev/null | md5sum | cut -d\' \' -f1)"')
+        remote_md5s = {}
+        for line in self.sys("; ".join(cmds), code=0, timeout=timeout, verbose=False):
+            fields = str(line).split()
+            if len(fields) == 2 and fields[0].isdigit():
+                remote_md5s[int(fields[0])] = fields[1]
+        verified = []
+        errors = ""
+        for offset in offsets:
+            expected = pattern.md5_range(offset, sample_size)
+            if remote_md5s.get(offset) != expected:
+                errors += '\nOffset:' + str(offset) + ', length:' + str(sample_size) + ', expected md5:' + \
+                          str(expected) + ', got:' + str(remote_md5s.get(offset))
+            else:
+                verified.append((offset, sample_size))
+        if errors:
+            raise Exception(str(euvolume.id) + ' on dev:' + str(voldev) + ' does not match pattern seed:' +
+                            str(seed) + errors)
+        self.debug('Verified ' + str(len(verified)) + ' ranges of ' + str(euvolume.id) + ' against pattern seed:' +
+                   str(seed))
+        return verified
+
     def time_dd(self,ddcmd, timeout=90, poll_interval=1, tmpfile=None):
         '''
         (Added for legacy support, use dd_monitor instead) Executes dd command on instance, parses and returns stats on dd outcome
@@ -921,7 +1318,8 @@ class EuInstance(Instance, TaggedResource):
                    timeout=300,
                    poll_interval=1,
                    tmpfile=None,
-                   sync=True):
+                   sync=True,
+                   stream=True):
         '''
         Executes dd command on instance, monitors and displays ongoing status, and returns stats dict for dd outcome
         :type ddif: str
@@ -953,13 +1351,25 @@ class EuInstance(Instance, TaggedResource):
         
         :type tmpfile: str
         :param tmpfile: temp file used on remote instance to redirect dd's stderr to in order to nohup dd. 
-        
+                        Only used when stream is False.
+
+        :type stream: bool
+        :param stream: If True dd runs in the foreground of a single ssh command, which signals dd for status
+                       every poll_interval and streams the status back as it is written. If False dd is nohup'd
+                       and each status update is fetched with separate ssh commands.
+
         :rtype: dict
         :returns: dict containing dd stats
         '''
         
         mb = 1048576 #bytes per mb
         gig = 1073741824 #bytes per gig
+        #dd may write to a block device, drop any md5s cached for it (or for all devices if the target is unknown)
+        self.invalidate_blockdev_md5_cache(None if ddcmd else ddof)
+        if ddof:
+            for vol in self.attached_vols:
+                if str(vol.guestdev).strip() == str(ddof).strip():
+                    vol.hash_tree = None
         #this tmp file will be created on remote instance to write stderr from dd to...
         if not tmpfile:
             tstamp = time.time()
@@ -1006,24 +1416,6 @@ class EuInstance(Instance, TaggedResource):
                  ddseek_str = ''
             ddcmd = str('dd if='+str(ddif)+' of='+str(ddof)+str(ddseek_str)+str(ddbs_str)+str(ddcount_str))
             ret['ddcmd'] = ddcmd
-        '''
-        Due to the ssh psuedo tty, this is done in an ugly manner to get output of future usr1 signals 
-        for dd status updates and allow this to run with nohup in the background. Added sleep so cmd is nohup'd 
-        before tty is terminated (maybe?)
-        '''
-        cmd = 'nohup '+str(ddcmd)+' 2> '+str(tmpfile)+' & echo $! && sleep 2'
-        #Execute dd command and store echo'd pid from output
-        try:
-            dd_pid = self.sys(cmd, code=0)[0]
-        except sshconnection.CommandExitCodeException, se:
-            dbg_buf = ""
-            file_contents = self.sys('cat ' + str(tmpfile))
-            if file_contents:
-                dbg_buf = "\n".join(file_contents)
-            raise Exception('Failed dd cmd:"' +str(cmd) + '", tmpfile contents:\n' + str(dbg_buf) )
-
-
-        
         #Form the table headers for printing dd status...
         linediv = '\n----------------------------------------------------------------------------------------------------------------------------\n'
         databuf = str('BYTES').ljust(15)
@@ -1049,6 +1441,43 @@ class EuInstance(Instance, TaggedResource):
         buf += linediv
         buf += databuf + timebuf + ratebuf + recbuf
         buf += linediv
+
+        if stream:
+            sys.stdout.write(buf)
+            sys.stdout.flush()
+            out, done, dd_pid = self.dd_monitor_stream(ddcmd, ret, start, timeout=timeout, poll_interval=poll_interval)
+            sys.stdout.write(linediv)
+            sys.stdout.flush()
+            elapsed = int(time.time()-start)
+            if not done:
+                #Attempt to kill dd process...
+                if dd_pid:
+                    self.sys('kill '+str(dd_pid))
+                raise Exception('dd_monitor timed out before dd cmd completed, elapsed:'+str(elapsed)+'/'+str(timeout))
+            if sync:
+                self.sys('sync', code=0)
+                elapsed = int(time.time()-start)
+            if not ret['dd_bytes']:
+                raise Exception('Did not transfer any data using dd cmd:'+str(ddcmd)+"\nstderr: "+str("\n".join(out)))
+            self.debug('Done with dd, copied '+str(ret['dd_bytes'])+' over elapsed:'+str(elapsed))
+            return ret
+
+        '''
+        Due to the ssh psuedo tty, this is done in an ugly manner to get output of future usr1 signals 
+        for dd status updates and allow this to run with nohup in the background. Added sleep so cmd is nohup'd 
+        before tty is terminated (maybe?)
+        '''
+        cmd = 'nohup '+str(ddcmd)+' 2> '+str(tmpfile)+' & echo $! && sleep 2'
+        #Execute dd command and store echo'd pid from output
+        try:
+            dd_pid = self.sys(cmd, code=0)[0]
+        except sshconnection.CommandExitCodeException, se:
+            dbg_buf = ""
+            file_contents = self.sys('cat ' + str(tmpfile))
+            if file_contents:
+                dbg_buf = "\n".join(file_contents)
+            raise Exception('Failed dd cmd:"' +str(cmd) + '", tmpfile contents:\n' + str(dbg_buf) )
+
         sys.stdout.write(buf)
         sys.stdout.flush()
         
@@ -1065,48 +1494,11 @@ class EuInstance(Instance, TaggedResource):
                 #if the above command didn't error out then dd ps is still running, grab status from tmpfile, and clear it
                 out= self.sys('cat '+str(tmpfile)+" && echo '' > "+str(tmpfile)+ ' 2>&1 > /dev/null', code=0, verbose=False)
             for line in out:
-                line = str(line)
-                try:
-                    if re.search('records in',line):
-                        ret['dd_records_in'] = str(line.split()[0]).strip()
-                        ret['dd_full_rec_in'] = str(ret['dd_records_in'].split("+")[0].strip())
-                        #dd_full_rec_in = int(dd_full_rec_in)
-                        ret['dd_partial_rec_in'] = str(ret['dd_records_in'].split("+")[1].strip())
-                        #dd_partial_rec_in = int(dd_partial_rec_in)
-                    elif re.search('records out', line):
-                        ret['dd_records_out'] = str(line.split()[0]).strip()
-                        ret['dd_full_rec_out'] = str(ret['dd_records_out'].split("+")[0].strip())
-                        #dd_ful_rec_out = int(dd_full_rec_out)
-                        ret['dd_partial_rec_out'] = str(ret['dd_records_out'].split("+")[1].strip())
-                        #dd_partial_rec_out = int(dd_partial_rec_out)
-                    elif re.search('copied',line):
-                        #123456789 bytes (123 MB) copied, 12.34 s, 123.45 MB/s
-                        summary = line.split()
-                        ret['dd_bytes'] = int(summary[0])
-                        ret['dd_mb'] = float("{0:.2f}".format(ret['dd_bytes']/float(mb)))
-                        ret['dd_gig'] = float("{0:.2f}".format(ret['dd_bytes']/float(gig)))
-                        ret['dd_elapsed'] = float(summary[5])
-                        ret['dd_rate'] = float(summary[7])
-                        ret['dd_units'] = str(summary[8])
-                except Exception, e:
-                    #catch any exception in the data parsing and show it as info/debug later...
-                    tb = self.tester.get_traceback()
-                    infobuf = '\n\nCaught exception while processing line:"'+str(line)+'"'
-                    infobuf += '\n'+str(tb)+"\n"+str(e)+'\n'
+                infobuf = self.parse_dd_status_line(line, ret) or infobuf
             elapsed = float(time.time()-start)
             ret['test_rate'] = float("{0:.2f}".format(ret['dd_mb'] / elapsed ))
             ret['test_time'] = "{0:.4f}".format(elapsed)
-            #Create and format the status output buffer, then print it...
-            buf = str(ret['dd_bytes']).ljust(15)
-            buf += '|'+str(ret['dd_mb']).center(15)
-            buf += '|'+str(ret['dd_gig']).center(8)
-            buf += '|'+str(ret['dd_elapsed']).center(10)
-            buf += '|'+str(ret['test_time']).center(10)
-            buf += '|'+str(str(ret['dd_rate'])+" "+str(ret['dd_units'])).center(12)
-            buf += '|'+str(str(ret['test_rate'])+" "+str('MB/s')).center(12)
-            buf += '|'+str("F:"+str(ret['dd_full_rec_in'])+" P:"+str(ret['dd_partial_rec_in'])).center(18)
-            buf += '|'+str("F:"+str(ret['dd_full_rec_out'])+" P:"+str(ret['dd_partial_rec_out'])).center(18)
-            sys.stdout.write("\r\x1b[K"+str(buf))
+            sys.stdout.write("\r\x1b[K"+str(self.get_dd_status_row(ret)))
             sys.stdout.flush()
             time.sleep(poll_interval)
         sys.stdout.write(linediv)
@@ -1133,8 +1525,116 @@ class EuInstance(Instance, TaggedResource):
         self.sys('rm -f ' + str(tmpfile))
         self.sys('rm -f ' + str(tmppidfile))
         return ret
+
+    def dd_monitor_stream(self, ddcmd, ret, start, timeout=300, poll_interval=1):
+        '''
+        Runs 'ddcmd' in a single ssh command alongside a background loop sending dd USR1 every poll_interval.
+        dd's status output is parsed into 'ret' and printed as it arrives on the channel.
+        :param ddcmd: string, dd command to run. If a pipeline, dd must be the last command.
+        :param ret: stats dict to update, see dd_monitor()
+        :param start: time the test started, used for the test time and rate
+        :param timeout: seconds to wait for dd to complete
+        :param poll_interval: seconds between dd status updates
+        :returns tuple (list of output lines, boolean dd completed, string remote dd pid)
+        '''
+        poll_interval = poll_interval or 1
+        #LC_ALL=C for parsable dd output. The signaling loop only outlives dd until it is killed after wait.
+        cmd = 'export LC_ALL=C; ' + str(ddcmd) + ' 2>&1 & pid=$!; echo "dd_pid=$pid"; ' + \
+              '(sleep ' + str(poll_interval) + '; while kill -USR1 $pid 2>/dev/null; do sleep ' + \
+              str(poll_interval) + '; done) >/dev/null 2>&1 & poller=$!; ' + \
+              'wait $pid; status=$?; kill $poller 2>/dev/null; echo "dd_exit_status=$status"'
+        state = {'partial': '', 'lines': [], 'dd_pid': None, 'dd_exit_status': None, 'infobuf': None}
+
+        def handle_line(line):
+            line = line.strip('\r')
+            if line.startswith('dd_pid='):
+                state['dd_pid'] = line.split('=')[1].strip()
+                return
+            if line.startswith('dd_exit_status='):
+                state['dd_exit_status'] = line.split('=')[1].strip()
+                return
+            state['lines'].append(line)
+            state['infobuf'] = self.parse_dd_status_line(line, ret) or state['infobuf']
+            if re.search('copied', line):
+                elapsed = float(time.time() - start)
+                ret['test_rate'] = float("{0:.2f}".format(ret['dd_mb'] / elapsed))
+                ret['test_time'] = "{0:.4f}".format(elapsed)
+                sys.stdout.write("\r\x1b[K"+str(self.get_dd_status_row(ret)))
+                sys.stdout.flush()
+
+        def dd_stream_cb(buf, state):
+            lines = (state['partial'] + buf).split('\n')
+            state['partial'] = lines.pop()
+            for line in lines:
+                handle_line(line)
+            return sshconnection.SshCbReturn(stop=False, nextargs=[state])
+
+        try:
+            self.cmd(cmd, verbose=False, timeout=timeout, cb=dd_stream_cb, cbargs=[state], get_pty=False)
+        except sshconnection.CommandTimeoutException, cte:
+            self.debug('dd_monitor_stream: ' + str(cte))
+        if state['partial']:
+            handle_line(state['partial'])
+            state['partial'] = ''
+        if state['infobuf']:
+            print state['infobuf']
+        if state['dd_exit_status'] not in [None, '0']:
+            self.debug('dd exited with status:' + str(state['dd_exit_status']) + ', cmd:' + str(ddcmd))
+        done = state['dd_exit_status'] is not None
+        return state['lines'], done, state['dd_pid']
+
+    def parse_dd_status_line(self, line, ret):
+        '''
+        Parses a line of dd status output into the dd_monitor() stats dict 'ret'
+        :returns: string with error info if the line could not be parsed, otherwise None
+        '''
+        mb = 1048576 #bytes per mb
+        gig = 1073741824 #bytes per gig
+        line = str(line)
+        try:
+            if re.search('records in',line):
+                ret['dd_records_in'] = str(line.split()[0]).strip()
+                ret['dd_full_rec_in'] = str(ret['dd_records_in'].split("+")[0].strip())
+                ret['dd_partial_rec_in'] = str(ret['dd_records_in'].split("+")[1].strip())
+            elif re.search('records out', line):
+                ret['dd_records_out'] = str(line.split()[0]).strip()
+                ret['dd_full_rec_out'] = str(ret['dd_records_out'].split("+")[0].strip())
+                ret['dd_partial_rec_out'] = str(ret['dd_records_out'].split("+")[1].strip())
+            elif re.search('copied',line):
+                #123456789 bytes (123 MB) copied, 12.34 s, 123.45 MB/s
+                #newer coreutils: 123456789 bytes (123 MB, 118 MiB) copied, 12.34 s, 123.45 MB/s
+                summary = re.search('^(\d+) bytes.*copied, ([\d.e-]+) s(?:econds)?, ([\d.]+) (\S+)', line.strip())
+                ret['dd_bytes'] = int(summary.group(1))
+                ret['dd_mb'] = float("{0:.2f}".format(ret['dd_bytes']/float(mb)))
+                ret['dd_gig'] = float("{0:.2f}".format(ret['dd_bytes']/float(gig)))
+                ret['dd_elapsed'] = float(summary.group(2))
+                ret['dd_rate'] = float(summary.group(3))
+                ret['dd_units'] = str(summary.group(4))
+        except Exception, e:
+            #catch any exception in the data parsing and show it as info/debug later...
+            tb = self.tester.get_traceback()
+            infobuf = '\n\nCaught exception while processing line:"'+str(line)+'"'
+            infobuf += '\n'+str(tb)+"\n"+str(e)+'\n'
+            return infobuf
+        return None
+
+    def get_dd_status_row(self, ret):
+        '''
+        Returns a formatted status row for the dd_monitor() stats dict 'ret'
+        '''
+        buf = str(ret['dd_bytes']).ljust(15)
+        buf += '|'+str(ret['dd_mb']).center(15)
+        buf += '|'+str(ret['dd_gig']).center(8)
+        buf += '|'+str(ret['dd_elapsed']).center(10)
+        buf += '|'+str(ret['test_time']).center(10)
+        buf += '|'+str(str(ret['dd_rate'])+" "+str(ret['dd_units'])).center(12)
+        buf += '|'+str(str(ret['test_rate'])+" "+str('MB/s')).center(12)
+        buf += '|'+str("F:"+str(ret['dd_full_rec_in'])+" P:"+str(ret['dd_partial_rec_in'])).center(18)
+        buf += '|'+str("F:"+str(ret['dd_full_rec_out'])+" P:"+str(ret['dd_partial_rec_out'])).center(18)
+        return buf
     
-    def vol_write_random_data_get_md5(self, euvolume, srcdev=None, length=32, timepergig=90, overwrite=False):
+    def vol_write_random_data_get_md5(self, euvolume, srcdev=None, length=32, timepergig=90, overwrite=False,
+                                      seed=None):
         '''
         Attempts to copy some amount of data into an attached volume, and return the md5sum of that volume
         A brief check of the first 32 bytes is performed to see if this volume has pre-existing non-zero filled data. 
@@ -1144,6 +1644,8 @@ class EuInstance(Instance, TaggedResource):
         srcdev - optional - string, the file to copy into the volume
         timepergig - optional - the time in seconds per gig, used to estimate an adequate timeout period
         overwrite - optional - boolean. write to volume regardless of whether existing data is found
+        seed - optional - string, write the data pattern for this seed instead of srcdev data. The md5 is then
+               computed locally instead of being read back from the device, see pattern_fill_volume()
         '''
         
         voldev = euvolume.guestdev.strip()
@@ -1154,14 +1656,20 @@ class EuInstance(Instance, TaggedResource):
                             ', euvolume.guestdev:' + str(euvolume.guestdev) +
                             ', voldev:' + str(voldev))
         #check to see if there's existing data that we should avoid overwriting 
+        filled = False
         if overwrite or ( int(self.sys('head -c '+str(length)+ ' '+str(voldev)+' | xargs -0 printf %s | wc -c')[0]) == 0):
-            
-            self.random_fill_volume(euvolume, srcdev=srcdev, length=length)
+            self.invalidate_blockdev_md5_cache(voldev)
+            self.random_fill_volume(euvolume, srcdev=srcdev, length=length, seed=seed)
+            filled = True
             #length = dd_dict['dd_bytes']
         else:
             self.debug("Volume has existing data, skipping random data fill")
-        #calculate checksum of euvolume attached device for given length
-        md5 = self.md5_attached_euvolume(euvolume, timepergig=timepergig,length=length)
+        if filled and seed is not None:
+            #the pattern written is known, no need to read it back
+            md5 = DataPattern(seed, block_size=euvolume.pattern_block_size).md5_range(0, length)
+        else:
+            #calculate checksum of euvolume attached device for given length
+            md5 = self.md5_attached_euvolume(euvolume, timepergig=timepergig,length=length)
         self.debug("Filled Volume:"+euvolume.id+" dev:"+voldev+" md5:"+md5)
         euvolume.md5 = md5
         euvolume.md5len = length
@@ -1193,7 +1701,154 @@ class EuInstance(Instance, TaggedResource):
             print str(tb)
             raise Exception("Failed to md5 attached volume: " +str(e))
         return md5
+
+    def get_euvolume_hash_tree(self, euvolume, chunk_size=67108864, length=None, parallel=4, timepergig=90,
+                               updatevol=True):
+        '''
+        Calculates the md5sum of each 'chunk_size' chunk of the dev representing the attached euvolume and
+        builds a hash tree from them, see eutester.hashtree. The chunks are read in parallel on the guest using
+        a single remote command. The euvolume's hash_tree is updated with the result.
+        Returns the HashTree
+        euvolume - mandatory - euvolume object used to calc checksums against
+        chunk_size - optional - number of bytes per chunk
+        length - optional - number of bytes to read from the head of the device, defaults to the entire device
+        parallel - optional - number of chunks read concurrently on the guest
+        timepergig - optional - number of seconds used per gig in volume size used in calculating timeout
+        updatevol - optional - boolean used to update the euvolume data or not
+        '''
+        mb = 1048576
+        chunk_size = int(chunk_size)
+        #Read in 1MB blocks when possible to avoid allocating chunk_size buffers per dd process
+        bs = mb if not chunk_size % mb else chunk_size
+        voldev = euvolume.guestdev.strip()
+        timeout = int(euvolume.size) * timepergig
+        if length:
+            size = str(int(length))
+        else:
+            size = '$(blockdev --getsize64 "$dev")'
+        read_chunk = 'c=$chunk; [ $(( ($0 + 1) * chunk )) -gt $size ] && c=$((size - $0 * chunk)); ' + \
+                     'echo "$0 $(dd if=$dev bs=$bs skip=$(( $0 * chunk / bs )) count=$(( (c + bs - 1) / bs )) ' + \
+                     '2>/dev/null | head -c $c | md5sum | cut -d" " -f1)"'
+        cmd = 'export dev=' + str(voldev) + ' chunk=' + str(chunk_size) + ' bs=' + str(bs) + '; ' + \
+              'export size=' + size + '; echo "size=$size"; ' + \
+              'seq 0 $(( (size + chunk - 1) / chunk - 1 )) | xargs -n 1 -P ' + str(int(parallel)) + \
+              " sh -c '" + read_chunk + "'"
+        try:
+            out = self.sys(cmd, code=0, timeout=timeout, verbose=False)
+            dev_size = None
+            digests = {}
+            for line in out:
+                line = str(line).strip()
+                if line.startswith('size='):
+                    dev_size = int(line.replace('size=', ''))
+                    continue
+                fields = line.split()
+                if len(fields) == 2 and fields[0].isdigit():
+                    digests[int(fields[0])] = fields[1]
+            if dev_size is None:
+                raise Exception('Could not determine size of ' + str(voldev) + ', output:' + "".join(out))
+            leaves = [digests.get(x) for x in xrange((dev_size + chunk_size - 1) / chunk_size)]
+            if None in leaves:
+                raise Exception('Missing checksum for chunk:' + str(leaves.index(None)) + ' of ' + str(voldev))
+            hash_tree = HashTree(leaves, chunk_size, dev_size)
+            self.debug("Got hash tree for Volume:" + euvolume.id + " dev:" + voldev + " " + str(hash_tree))
+            if updatevol:
+                euvolume.hash_tree = hash_tree
+        except Exception, e:
+            tb = self.tester.get_traceback()
+            print str(tb)
+            raise Exception("Failed to get hash tree of attached volume: " + str(e))
+        return hash_tree
+
+    def verify_euvolume_hash_tree(self, euvolume, hash_tree=None, parallel=4, timepergig=90):
+        '''
+        Verifies the entire attached euvolume against a hash tree previously recorded by get_euvolume_hash_tree().
+        To verify a volume created from a snapshot, provide the hash tree recorded for the snapshot's volume.
+        Raises an exception listing the byte ranges which differ.
+        euvolume - mandatory - euvolume object to verify
+        hash_tree - optional - HashTree to verify against, defaults to the euvolume's hash_tree
+        parallel - optional - number of chunks read concurrently on the guest
+        timepergig - optional - number of seconds used per gig in volume size used in calculating timeout
+        returns the current HashTree of the volume
+        '''
+        hash_tree = hash_tree or euvolume.hash_tree
+        if not hash_tree:
+            raise Exception('No hash tree provided or recorded for volume:' + str(euvolume.id))
+        current = self.get_euvolume_hash_tree(euvolume, chunk_size=hash_tree.chunk_size, length=hash_tree.length,
+                                              parallel=parallel, timepergig=timepergig, updatevol=False)
+        if current != hash_tree:
+            ranges = current.get_chunk_ranges(hash_tree.diff(current))
+            raise Exception('Volume:' + str(euvolume.id) + ' dev:' + str(euvolume.guestdev) + ' root hash:' +
+                            str(current.root) + ' != expected:' + str(hash_tree.root) + ', ' + str(len(ranges)) +
+                            ' chunks differ at (offset, length):' + str(ranges))
+        self.debug('Verified Volume:' + str(euvolume.id) + ' root hash:' + str(current.root))
+        return current
     
+    def get_blockdev_md5_map(self, length, match=None, timeout=120, use_cache=False):
+        '''
+        Calculates the md5sum of the first 'length' bytes of every block device in /dev matching 'match' using a
+        single remote command, rather than one command per device.
+        Checksums are cached per device and length. If 'use_cache' is set, a cached checksum is reused until the
+        device node has been re-created, ie when a volume is detached and another attached in its place, which is
+        detected using the node's ctime, or until dd_monitor() writes to the device. Writes made any other way,
+        ie through a mounted filesystem, are not detected, so callers verifying volume data should not use the cache.
+        Devices no longer present are dropped from the cache.
+        length - mandatory - integer, number of bytes to read from the head of each device, 0 reads the entire device
+        match - optional - string used in grep search of /dev dir on instance, see get_dev_dir()
+        timeout - optional - integer, command timeout in seconds
+        use_cache - optional - boolean, reuse cached checksums of unchanged device nodes instead of reading them
+        returns dict mapping device paths (ie: '/dev/vdb') to md5 checksums
+        '''
+        if match is None:
+            match = '^sd\|^vd\|^xd\|^xvd'
+        length = int(length or 0)
+        if length:
+            read_cmd = 'head -c ' + str(length) + ' "/dev/$dev" 2>/dev/null | md5sum'
+        else:
+            read_cmd = 'md5sum < "/dev/$dev" 2>/dev/null'
+        hash_cmd = 'echo "/dev/$dev $ctime $(' + read_cmd + ' | cut -d\' \' -f1)"'
+        cached = []
+        if use_cache:
+            for (dev, dev_length), (ctime, md5) in self.blockdev_md5_cache.iteritems():
+                if dev_length == length:
+                    cached.append(dev.replace('/dev/', '') + ':' + str(ctime))
+        cmd = "for dev in $(ls -1 /dev/ | grep '" + str(match) + "'); do " + \
+              '[ -b "/dev/$dev" ] || continue; ctime=$(stat -c %Z "/dev/$dev"); '
+        if cached:
+            #Only print the ctime for devices whose checksum is cached and whose node has not been re-created
+            cmd += 'case "$dev:$ctime" in ' + '|'.join(cached) + ') echo "/dev/$dev $ctime";; *) ' + \
+                   hash_cmd + ';; esac; '
+        else:
+            cmd += hash_cmd + '; '
+        cmd += 'done'
+        md5_map = {}
+        for line in self.sys(cmd, code=0, timeout=timeout, verbose=False):
+            fields = str(line).split()
+            if not fields or not fields[0].startswith('/dev/'):
+                continue
+            dev = fields[0]
+            if len(fields) == 3:
+                self.blockdev_md5_cache[(dev, length)] = (fields[1], fields[2])
+                md5_map[dev] = fields[2]
+            elif len(fields) == 2 and (dev, length) in self.blockdev_md5_cache:
+                md5_map[dev] = self.blockdev_md5_cache[(dev, length)][1]
+        for key in self.blockdev_md5_cache.keys():
+            if key[1] == length and key[0] not in md5_map:
+                self.blockdev_md5_cache.pop(key)
+        self.debug('Block device md5s for length ' + str(length) + ': ' +
+                   ", ".join(str(dev) + ':' + str(md5_map[dev]) for dev in sorted(md5_map)))
+        return md5_map
+
+    def invalidate_blockdev_md5_cache(self, dev=None):
+        '''
+        Drops the checksums cached by get_blockdev_md5_map() for 'dev' (ie: '/dev/vdb'), or for all devices
+        if 'dev' is None. Called before writing to a device.
+        '''
+        cache = getattr(self, 'blockdev_md5_cache', {})
+        for key in cache.keys():
+            if dev is None or key[0] == str(dev).strip():
+                cache.pop(key)
+
     def get_dev_md5(self, devpath, length, timeout=60): 
         self.assertFilePresent(devpath)
         if length == 0:
@@ -1279,7 +1934,7 @@ class EuInstance(Instance, TaggedResource):
         return int(self.sys('cat /proc/uptime', code=0)[0].split()[0].split('.')[0])
 
 
-    def attach_euvolume_list(self,list,intervoldelay=0, timepervol=90, md5len=32):
+    def attach_euvolume_list(self,list,intervoldelay=0, timepervol=90, md5len=32, batch=False):
         '''
         Attempts to attach a list of euvolumes. Due to limitations with KVM and detecting the location/device
         name of the volume as attached on the guest, MD5 sums are used... 
@@ -1287,29 +1942,34 @@ class EuInstance(Instance, TaggedResource):
         before attempting to attach the next volume in the list. 
         -If the next volume in the list does not have an MD5, the next volume will not be attached until
         this volume is detected and an md5sum is populated in the euvolume. 
+        -If batch is set the volumes are instead attached together, see attach_euvolumes()
         
         :param list: List of volumes to be attached, if volumes are not of type euvolume they will be converted
         :param intervoldelay : integer representing seconds between each volume attach attempt
         :param timepervol: time to wait for volume to attach before failing
         :param md5len: length from head of block device to read when calculating md5
+        :param batch: boolean, attach all volumes at once with attach_euvolumes(), intervoldelay is ignored
         
         '''
         for euvol in list:
             if not isinstance(euvol, EuVolume): # or not euvol.md5:
                 list[list.index(euvol)] = EuVolume.make_euvol_from_vol(euvol, self.tester)
-        for euvol in list:
-            dev = self.get_free_scsi_dev()
-            if euvol.md5:
-                #Monitor volume to attached, dont write/read head for md5 use existing. Check md5 sum later in get_unsynced_volumes. 
-                if (self.tester.attach_volume(self, euvol, dev, pause=10,timeout=timepervol)):
-                    self.attached_vols.append(euvol)
+        if batch:
+            self.attach_euvolumes(list, timeout=timepervol)
+        else:
+            for euvol in list:
+                dev = self.get_free_scsi_dev()
+                if euvol.md5:
+                    #Monitor volume to attached, dont write/read head for md5 use existing. Check md5 sum later in get_unsynced_volumes. 
+                    if (self.tester.attach_volume(self, euvol, dev, pause=10,timeout=timepervol)):
+                        self.attached_vols.append(euvol)
+                    else:
+                        raise Exception('attach_euvolume_list: Test Failed to attach volume:'+str(euvol.id))
                 else:
-                    raise Exception('attach_euvolume_list: Test Failed to attach volume:'+str(euvol.id))
-            else:
-                #monitor volume to attached and write unique string to head and record it's md5sum 
-                self.attach_euvolume(euvol, dev, timeout=timepervol)
-            if intervoldelay:
-                time.sleep(intervoldelay)
+                    #monitor volume to attached and write unique string to head and record it's md5sum 
+                    self.attach_euvolume(euvol, dev, timeout=timepervol)
+                if intervoldelay:
+                    time.sleep(intervoldelay)
         start = time.time()
         elapsed = 0 
         badvols = self.get_unsynced_volumes(list, md5length=md5len, timepervol=timepervol, check_md5=True)
@@ -1320,7 +1980,8 @@ class EuInstance(Instance, TaggedResource):
             raise Exception("Volume(s) were not found on guest:"+str(buf))
         
         
-    def get_unsynced_volumes(self,euvol_list=None, md5length=32, timepervol=90,min_polls=2, check_md5=False):
+    def get_unsynced_volumes(self,euvol_list=None, md5length=32, timepervol=90,min_polls=2, check_md5=False,
+                             poll_interval=10):
         '''
         Description: Returns list of volumes which are:
         -in a state the cloud believes the vol is no longer attached
@@ -1336,13 +1997,14 @@ class EuInstance(Instance, TaggedResource):
         :param timerpervolume: -optional - time to wait for device to appear, per volume before failing
         :param min_polls: - optional - minimum iterations to check guest devs before failing, despite timeout
         :param check_md5: - optional - find devices by md5 comparision. Default is to only perform this check when virtio_blk is in use.
+        :param poll_interval: - optional - seconds to wait between checks of the guest devs for a volume
         '''
         bad_list = []
         vol_list = []
-        checked_vdevs = []
         poll_count = 0
-        dev_list = self.get_dev_dir()
         found = False
+        #md5 maps of the guest's block devs by checksum length, shared across volumes until a volume is not found
+        md5_maps = {}
 
         if euvol_list is not None:
             vol_list.extend(euvol_list)
@@ -1358,7 +2020,6 @@ class EuInstance(Instance, TaggedResource):
                     found = False
                     elapsed = 0 
                     start = time.time()
-                    checked_vdevs = []
                     #loop here for timepervol in case were waiting for a volume to appear in the guest. ie attaching
                     while (not found) and ((elapsed <= timepervol) or (poll_count < min_polls)):
                         try:
@@ -1366,29 +2027,22 @@ class EuInstance(Instance, TaggedResource):
                             #Ugly... :-(
                             #handle virtio and non virtio cases differently (KVM case needs improvement here).
                             if self.virtio_blk or check_md5:
-                                self.debug('Checking any new devs for md5:'+str(vol.md5))
+                                self.debug('Checking devs for md5:'+str(vol.md5))
                                 #Do some detective work to see what device name the previously attached volume is using
-                                devlist = self.get_dev_dir()
-                                for vdev in devlist:
-                                    vdev = "/dev/"+str(vdev)
-                                    
-                                    #if we've already checked the md5 on this dev no need to re-check it. 
-                                    if not vdev in checked_vdevs: 
-                                        self.debug('Checking '+str(vdev)+" for match against euvolume:"+str(vol.id))
-                                        md5 = self.get_dev_md5(vdev, vol.md5len )
-                                        self.debug('comparing '+str(md5)+' vs '+str(vol.md5))
-                                        if md5 == vol.md5:
-                                            self.debug('Found match at dev:'+str(vdev))
-                                            found = True
-                                            if (vol.guestdev != vdev ):
-                                                self.debug("("+str(vol.id)+")Found dev match. Guest dev changed! Updating from previous:'"
-                                                           + str(vol.guestdev) + "' to:'"+str(vdev)+"'")
-                                            else:
-                                                self.debug("(" + str(vol.id) + ")Found dev match. Previous dev:'"
-                                                           + str(vol.guestdev) + "', Current dev:'" + str(vdev) + "'")
-                                            vol.guestdev = vdev
-                                        checked_vdevs.append(vdev) # add to list of devices we've already checked.
-                                    if found:
+                                if vol.md5len not in md5_maps:
+                                    md5_maps[vol.md5len] = self.get_blockdev_md5_map(vol.md5len)
+                                md5_map = md5_maps[vol.md5len]
+                                for vdev in sorted(md5_map):
+                                    if md5_map[vdev] == vol.md5:
+                                        self.debug('Found match at dev:'+str(vdev))
+                                        found = True
+                                        if (vol.guestdev != vdev ):
+                                            self.debug("("+str(vol.id)+")Found dev match. Guest dev changed! Updating from previous:'"
+                                                       + str(vol.guestdev) + "' to:'"+str(vdev)+"'")
+                                        else:
+                                            self.debug("(" + str(vol.id) + ")Found dev match. Previous dev:'"
+                                                       + str(vol.guestdev) + "', Current dev:'" + str(vdev) + "'")
+                                        vol.guestdev = vdev
                                         break
                             else:
                                 #Not using virtio_blk assume the device will be the same
@@ -1399,7 +2053,8 @@ class EuInstance(Instance, TaggedResource):
                         if found:
                             break
                         self.debug('Local device for volume:' + str(vol.id) + ' not found. Sleeping and checking again...')
-                        time.sleep(10)
+                        md5_maps = {}
+                        time.sleep(poll_interval)
                         elapsed = int(time.time() - start)
                     if not found:
                         bad_list.append(vol)
@@ -1418,10 +2073,9 @@ class EuInstance(Instance, TaggedResource):
 
         md5 = md5 or euvolume.md5
         md5len = md5len or euvolume.md5len
-        for vdev in  self.get_dev_dir():
-            vdev = '/dev/'+ str(vdev).replace('/dev/','')
-            self.debug('Checking '+str(vdev)+" for a matching block device")
-            block_md5 = self.get_dev_md5(vdev, md5len )
+        md5_map = self.get_blockdev_md5_map(md5len)
+        for vdev in sorted(md5_map):
+            block_md5 = md5_map[vdev]
             self.debug('comparing dev' + str(vdev) +': '+str(block_md5)+' vs vol:'+str(md5))
             if block_md5 == md5:
                 self.debug('Found match at dev:'+str(vdev))
@@ -1469,13 +2123,17 @@ class EuInstance(Instance, TaggedResource):
         #Make sure the volumes we think our attached are in a known good state
         badvols = self.get_unsynced_volumes()
         
-        for badvol in badvols:
+        if badvols:
             try:
-                self.detach_euvolume(badvol, timeout=timeout)
+                self.detach_euvolumes(badvols, timeout=timeout)
             except Exception, e:
-               raise Exception("Error in sync_volume_list attempting to detach badvol:"+str(badvol.id)+". Err:"+str(e))
+               raise Exception("Error in sync_volume_list attempting to detach badvols:" +
+                               ",".join(str(badvol.id) for badvol in badvols) + ". Err:"+str(e))
                 
         cloudlist=self.tester.ec2.get_all_volumes()
+        #Detach and reattach requests are sent together after checking all volumes
+        to_detach = []
+        to_reattach = []
         found = False
         for vol in cloudlist:
             #check to see if the volume is attached to us, but is not involved with the bdm for this instance
@@ -1495,13 +2153,20 @@ class EuInstance(Instance, TaggedResource):
                             evol.guestdev = dev
                             self.attached_vols.append(evol)
                         else:
-                            self.tester.detach_volume(vol,timeout=timeout)
+                            to_detach.append(vol)
                     except Exception,e:
                         if reattach or detach:
-                            self.tester.detach_volume(vol,timeout=timeout)
+                            to_detach.append(vol)
                         if reattach:
-                            dev = self.get_free_scsi_dev()
-                            self.attach_volume(self, self, vol,dev )
+                            to_reattach.append(vol)
+        if to_detach:
+            for vol in to_detach:
+                vol.detach()
+                self.debug("Sent detach for volume: " + vol.id + " which is currently in state: " + vol.status)
+            self.tester.monitor_euvolumes_to_status(to_detach, status='available', timeout=timeout)
+        #Reattach one at a time, these volumes have no md5 to match their guest devices by
+        for vol in to_reattach:
+            self.attach_euvolume(EuVolume.make_euvol_from_vol(vol, self.tester), timeout=timeout)
             
                     
                 
@@ -31,6 +31,7 @@
 # author: clarkmatthew
 # modified by: Trevor Hodde
 
+
 '''
     Example:
     import eulogger
@@ -39,12 +40,26 @@
     
     self.log.debug("This is a debug message")
     self.log.critical("this is a critical message")
+
+    All Euloggers share one logger, one bounded queue and one log file writer thread (see Eulogger_Backend).
+    Each Eulogger's identifier, levels and files are carried on its records rather than creating a new
+    logger and handlers per Eulogger, and each log file is opened once no matter how many Euloggers write to it.
 '''
 
 import os
 import sys
+import atexit
 import logging
-import time
+import threading
+import Queue
+
+#Shared canned formatters, records carry the Eulogger's identifier
+default_format = logging.Formatter('[%(asctime)s] [%(identifier)s] [%(levelname)s]: %(message)s')
+formatter2 = logging.Formatter('[%(asctime)s] [%(identifier)s] [%(levelname)s] '
+                               '[%(filename)s:%(funcName)s():%(lineno)d]: %(message)s')
+formatter3 = logging.Formatter('%(identifier)s:%(funcName)s():%(lineno)d: %(message)s')
+formatter4 = logging.Formatter('%(message)s')
+
 
 class Eulogger(object):
     #constructor for the Eulogger
@@ -60,161 +75,269 @@ class Eulogger(object):
                  file_format = None,
                  clear_file = False):
         """
-        This class basically sets up a child debugger for testing purposes.
-        It allows the user to set up a new logger object and pass different logging formats and levels so different
-        objects and modules can log with unique identifiers and logging levels.
+        This class sets up a logger for testing purposes.
+        It allows the user to pass different logging formats and levels so different objects and modules
+        can log with unique identifiers and logging levels. Records are written by the shared
+        Eulogger_Backend, so creating many Euloggers does not create new loggers, handlers or file handles.
 
 
         :param parent_logger_name: Name of root/parent logger
-        :param identifier: identifier used for log formatting and child logger name
-        :param stdout_level: log level (see 'logging' class) for std out handler under this child logger
-        :param stdout_format: logging format used by this child logger's stdout handler
-        :param logfile: file path to use for this child logger's logging file handler
-        :param logfile_level: log level (see 'logging' class) for file handler under this child logger
-        :param file_format: logging formate used by this child logger's file handler
-        :param clear_file: will attempt to remove 'logfile' before creating handler. Will not remove parent's files.
-        :param make_log_file_global: boolean, will add this logfile to parent so other child loggers create afterward
-                                     will attempt to create a handler that writes to this file as well.
-        :param use_global_log_files: boolean, will query the parent logger for any file handlers and will attemp to
-                                     create a handler for this child logger using the same file
-
-        #Debug for init...
-        print ( "-----------------------------------------------" \
-                + "\nparent_logger_name:" + str(parent_logger_name) \
-                + "\neulogger init:" \
-                + "\nidentifier:" + str(identifier) \
-                + "\nstdout_level:" + str(stdout_level) \
-                + "\nstdout_format:" + str(stdout_format) \
-                + "\nlogfile:" + str(logfile) \
-                + "\nlogfile_level:" + str(logfile_level) \
-                + "\nfile_format:" + str(file_format) \
-                + "\nclear_file:" + str(clear_file) \
-                + "\n-----------------------------------------------" )
+        :param identifier: identifier used for log formatting
+        :param stdout_level: log level (see 'logging' class) for std out under this eulogger
+        :param stdout_format: logging.Formatter used for this eulogger's stdout output
+        :param logfile: file path this eulogger also logs to
+        :param logfile_level: log level (see 'logging' class) for 'logfile'
+        :param file_format: logging.Formatter used for this eulogger's file output
+        :param clear_file: will attempt to truncate 'logfile' before using it. Will not clear parent's files.
+        :param make_log_file_global: boolean, will add this logfile to parent so other euloggers created afterward
+                                     will write to this file as well.
+        :param use_global_log_files: boolean, will also write to any global log files added by euloggers
+                                     created before this one
         """
-        self.logfile = os.path.join(logfile)
+        self.logfile = os.path.abspath(logfile) if logfile else ""
         self.clear_file = clear_file
-
-        #Create of fetch existing logger of name 'logger_name
         self.parent_logger_name = parent_logger_name
         self.identifier = identifier
-        self.name = identifier + str(time.time())
-        self.parent_logger = logging.getLogger(self.parent_logger_name)
-        self.log = self.getChild(self.parent_logger, self.name)
+        self.name = identifier
+        self.backend = get_backend(parent_logger_name)
+        self.parent_logger = self.backend.logger
         self.file_info_list = []
 
         #map string for log level to 'logging' class type or default to logging.DEBUG if string isn't found
         self.stdout_level = logging.__dict__.get(stdout_level.upper(),logging.DEBUG)
         self.logfile_level = logging.__dict__.get(logfile_level.upper(),logging.DEBUG)
 
-        #set the parent and child logger levels to the lowest of the two handler levels
-        if self.stdout_level < self.logfile_level:
-            self.logger_level = self.stdout_level
-        else:
-            self.logger_level = self.logfile_level
-        if self.log.level > self.logger_level or self.log.level == 0:
-            self.log.setLevel(self.logfile_level)
-        if self.parent_logger > self.logger_level or self.log.level == 0:
-            self.parent_logger.setLevel(self.logfile_level)
-
-
         #set some default and canned formatters for logging output
-        self.default_format = stdout_format or logging.Formatter('[%(asctime)s] [' + self.identifier + '] [%(levelname)s]: %(message)s')
+        self.default_format = stdout_format or default_format
         self.file_format = file_format or self.default_format
+        self.formatter2 = formatter2
+        self.formatter3 = formatter3
+        self.formatter4 = formatter4
 
-        #Add a few canned formatters for reference/convenience
-        self.formatter2 = logging.Formatter('[%(asctime)s] [' + self.identifier + '] [%(levelname)s] [%(filename)s:%(funcName)s():%(lineno)d]: %(message)s')
-        self.formatter3 = logging.Formatter( self.identifier +':%(funcName)s():%(lineno)d: %(message)s')
-        self.formatter4 = logging.Formatter('%(message)s')
-
-        self.stdout_handler = logging.StreamHandler(sys.stdout)
-        self.stdout_handler.setFormatter(self.default_format)
-        self.stdout_handler.setLevel(self.stdout_level)
-        #Add filter so only log records from this child logger are handled
-        self.stdout_handler.addFilter(Allow_Logger_By_Name(self.log.name))
-        if self.stdout_handler not in self.log.handlers:
-            self.log.addHandler(self.stdout_handler)
-        else:
-            print "Not adding stdout handler for this eulogger:" +str(self.identifier)
-
-        #Now add the file handlers...
+        #Now gather the log files...
         if use_global_log_files:
             self.file_info_list = self.get_parent_logger_files()
         if (self.logfile):
-            self.file_info_list.append(File_Handler_Info(self.logfile,self.logfile_level))
-            #If the clear flag is set remove the file first...
-            if (self.clear_file):
-                try:
-                    os.remove(self.logfile)
-                except Exception, e:
-                    print "Error while attempting to remove log file '" + self.logfile + "', err:" + str(e)
+            #The file may already be written to as a global log file
+            if self.logfile not in [x.filepath for x in self.file_info_list]:
+                self.file_info_list.append(File_Handler_Info(self.logfile,self.logfile_level))
+            self.backend.open_file(self.logfile, clear=self.clear_file)
             if make_log_file_global:
-                self.add_muted_file_handler_to_parent_logger(self.logfile,self.logfile_level)
-        for fileinfo in self.file_info_list:
-            file_hdlr = logging.FileHandler(fileinfo.filepath)
-            file_hdlr.setFormatter(self.file_format)
-            file_hdlr.setLevel(fileinfo.level)
-            #Add filter so only log records from this child logger are handled
-            file_hdlr.addFilter(Allow_Logger_By_Name(self.log.name))
-            #Make sure this is not a duplicate handler or this file is a dup of another handler
-            if file_hdlr not in self.log.handlers:
-                add = True
-                for h in self.log.handlers:
-                    if h.stream.name == file_hdlr.stream.name:
-                        add = False
-                        self.log.debug('File already has log handler:' + str(logfile.filepath))
-                        break
-                if add:
-                    self.log.addHandler(file_hdlr)
-            else:
-                print "Not adding logfile handler for this eulogger:" +str(self.identifier)
+                self.backend.add_global_file(self.logfile, self.logfile_level)
 
+        self.context = Eulogger_Context(identifier=self.identifier,
+                                        stdout_level=self.stdout_level,
+                                        stdout_format=self.default_format,
+                                        files=[(x.filepath, x.level, self.file_format) for x in self.file_info_list])
+        self.log = logging.LoggerAdapter(self.parent_logger, {'identifier': self.identifier,
+                                                              'eulogger_context': self.context})
         self.log.debug(str(self.identifier) + ": Eulogger init test message. Init complete")
 
-    def add_muted_file_handler_to_parent_logger(self,filepath, level):
-        file_handler = logging.FileHandler(filepath)
-        file_handler.setLevel(level)
-        file_handler.addFilter(Mute_Filter())
-
     def get_parent_logger_files(self):
         files = []
-        for h in self.parent_logger.handlers:
-            if isinstance(h, logging.FileHandler):
-                files.append(File_Handler_Info(h.stream.name, h.level))
+        for filepath, level in self.backend.get_global_files():
+            files.append(File_Handler_Info(filepath, level))
         return files
 
-    def getChild(self, logger, suffix):
-        """
-        ## Add this for 2.6 support, this was implemented in 2.7...###
-        """
-        if hasattr(logger,'getChild'):
-            return logger.getChild(suffix)
+    def flush(self, timeout=None):
+        '''
+        Blocks until all records queued so far have been written
+        '''
+        self.backend.flush(timeout=timeout)
+
+
+class Eulogger_Context():
+    '''
+    Per Eulogger output settings, carried on each record and read by the backend's writer thread
+    '''
+    def __init__(self, identifier, stdout_level, stdout_format, files):
+        self.identifier = identifier
+        self.stdout_level = stdout_level
+        self.stdout_format = stdout_format
+        #list of (absolute filepath, level, formatter)
+        self.files = files
+        self.min_level = min([stdout_level] + [x[1] for x in files])
+
+
+class Eulogger_Backend():
+    '''
+    Shared logging backend. Records from every Eulogger are handled by a single Eulogger_Queue_Handler, which
+    writes them to stdout in the caller's thread, so they stay in order with the framework's print statements,
+    and puts them on one bounded queue. One daemon thread writes the queued records to log files, keeping one
+    open handle per file. When the queue is full, loggers block until the writer catches up, so memory stays
+    bounded. Records still queued at interpreter exit are written by an atexit handler.
+    '''
+    def __init__(self, logger_name='eutester', queue_size=10000):
+        self.logger = logging.getLogger(logger_name)
+        self.logger.setLevel(logging.DEBUG)
+        self.logger.propagate = False
+        self.queue = Queue.Queue(maxsize=queue_size)
+        self.files = {}
+        self.global_files = []
+        self.lock = threading.Lock()
+        self.handler = Eulogger_Queue_Handler(self.queue)
+        self.logger.addHandler(self.handler)
+        self.thread = threading.Thread(target=self.writer, name='eulogger-' + str(logger_name))
+        self.thread.daemon = True
+        self.thread.start()
+        atexit.register(self.close)
+
+    def open_file(self, filepath, clear=False):
+        '''
+        Returns the open handle for 'filepath', opening it once for all Euloggers. If 'clear' is set
+        the file is truncated first.
+        '''
+        filepath = os.path.abspath(filepath)
+        with self.lock:
+            handle = self.files.get(filepath)
+            if handle is None:
+                try:
+                    handle = open(filepath, 'w' if clear else 'a')
+                except Exception, e:
+                    print "Error while attempting to open log file '" + filepath + "', err:" + str(e)
+                    return None
+                self.files[filepath] = handle
+            elif clear:
+                handle.seek(0)
+                handle.truncate()
+            return handle
+
+    def add_global_file(self, filepath, level):
+        filepath = os.path.abspath(filepath)
+        with self.lock:
+            for x in self.global_files:
+                if x[0] == filepath:
+                    return
+            self.global_files.append((filepath, level))
+
+    def get_global_files(self):
+        with self.lock:
+            return list(self.global_files)
+
+    def write_record(self, record):
+        context = record.eulogger_context
+        for filepath, level, formatter in context.files:
+            if record.levelno >= level:
+                handle = self.files.get(filepath) or self.open_file(filepath)
+                if handle:
+                    handle.write(formatter.format(record) + '\n')
+
+    def flush_streams(self):
+        with self.lock:
+            handles = self.files.values()
+        for handle in handles:
+            try:
+                handle.flush()
+            except Exception:
+                pass
+
+    def writer(self):
+        while True:
+            record = self.queue.get()
+            try:
+                if record is None:
+                    return
+                self.write_record(record)
+            except Exception, e:
+                try:
+                    sys.stderr.write('Eulogger failed to write record:' + str(e) + '\n')
+                except Exception:
+                    pass
+            finally:
+                #Flush once the queue is drained rather than per record
+                if record is None or self.queue.empty():
+                    self.flush_streams()
+                self.queue.task_done()
+
+    def flush(self, timeout=None):
+        '''
+        Blocks until all records queued so far have been written, or 'timeout' seconds have passed
+        '''
+        if not self.thread.is_alive():
+            return
+        if timeout is None:
+            self.queue.join()
         else:
-            if logger.root is not logger:
-                suffix = '.'.join((logger.name, suffix))
-            return logger.manager.getLogger(suffix)
+            done = threading.Event()
+            waiter = threading.Thread(target=lambda: (self.queue.join(), done.set()))
+            waiter.daemon = True
+            waiter.start()
+            done.wait(timeout)
 
+    def close(self, timeout=10):
+        '''
+        Writes any queued records, stops the writer thread and closes the log files
+        '''
+        if self.thread.is_alive():
+            self.logger.removeHandler(self.handler)
+            self.queue.put(None)
+            self.thread.join(timeout)
+        with self.lock:
+            for handle in self.files.values():
+                try:
+                    handle.close()
+                except Exception:
+                    pass
+            self.files = {}
 
-class File_Handler_Info():
-    def __init__(self, filepath, level):
-        if not filepath or not level:
-            raise Exception("File_Handler_Info None option not allowed, filepath:"+str(filepath)+",level:"+str(level))
-        self.filepath = filepath
-        self.level = level
 
-class Allow_Logger_By_Name(logging.Filter):
-    """
-    Only messages from this logger are allow through to prevent duplicates from other loggers of same level, etc..
-    """
-    def __init__(self, name=""):
-        logging.Filter.__init__(self, name)
+class Eulogger_Queue_Handler(logging.Handler):
+    '''
+    Writes records to stdout and puts records destined for log files on the backend queue. Messages,
+    arguments and tracebacks are rendered in the caller's thread so the writer thread never touches objects
+    the caller may change.
+    '''
+    def __init__(self, queue):
+        logging.Handler.__init__(self)
+        self.queue = queue
 
-    def filter(self, record):
-        return record.name == self.name
+    def emit(self, record):
+        try:
+            context = getattr(record, 'eulogger_context', None)
+            if context is None:
+                #Record logged directly to the shared logger rather than through a Eulogger
+                record.identifier = getattr(record, 'identifier', record.name)
+                context = Eulogger_Context(record.identifier, logging.DEBUG, default_format, [])
+                record.eulogger_context = context
+            if record.levelno < context.min_level:
+                return
+            record.msg = record.getMessage()
+            record.args = None
+            if record.exc_info:
+                record.exc_text = logging._defaultFormatter.formatException(record.exc_info)
+                record.exc_info = None
+            if record.levelno >= context.stdout_level:
+                sys.stdout.write(context.stdout_format.format(record) + '\n')
+                sys.stdout.flush()
+            for filepath, level, formatter in context.files:
+                if record.levelno >= level:
+                    self.queue.put(record)
+                    break
+        except (KeyboardInterrupt, SystemExit):
+            raise
+        except Exception:
+            self.handleError(record)
 
-class Mute_Filter(logging.Filter):
-    def filter(self, record):
-        return False
 
+_backends = {}
+_backends_lock = threading.Lock()
 
 
- 
+def get_backend(logger_name='eutester'):
+    '''
+    Returns the shared Eulogger_Backend for 'logger_name', creating it on first use
+    '''
+    with _backends_lock:
+        backend = _backends.get(logger_name)
+        if backend is None:
+            backend = Eulogger_Backend(logger_name)
+            _backends[logger_name] = backend
+        return backend
+
+
+class File_Handler_Info():
+    def __init__(self, filepath, level):
+        if not filepath or not level:
+            raise Exception("File_Handler_Info None option not allowed, filepath:"+str(filepath)+",level:"+str(level))
+        self.filepath = filepath
+        self.level = level
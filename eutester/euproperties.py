@@ -65,11 +65,16 @@ cat my_cloud.conf
         storage_properties = ep_mgr.get_properties(service_type='storage')
         partition1_properties = ep_mgr.get_properties(partition='partition1')
 
+    #Lookups are served from a local index of the property list. To re-fetch the list from the cloud
+    #once it is older than 5 minutes...
+        ep_mgr = euproperties.Euproperty_Manager(tester, cache_ttl=300)
+
 '''
 
 import types
 import re
 import copy
+import time
 
 class Euproperty_Type():
     authentication = 'authentication'
@@ -169,7 +174,15 @@ class Euproperty_Manager():
     verbose = False
     debugmethod = None
     
-    def __init__(self, tester, verbose=False, machine=None, debugmethod=None):
+    def __init__(self, tester, verbose=False, machine=None, debugmethod=None, cache_ttl=None):
+        '''
+        tester - mandatory - eucaops/eutester object
+        verbose - optional - boolean, show output of the property commands run on the work machine
+        machine - optional - machine to run the property commands on, defaults to the enabled clc
+        debugmethod - optional - method used for debug output
+        cache_ttl - optional - seconds the fetched property list is used for lookups before it is re-fetched.
+                    None (default) re-fetches only when forced or when a set property is read.
+        '''
         self.tester = tester
         self.debugmethod = debugmethod or tester.debug
         self.verbose = verbose
@@ -179,6 +192,13 @@ class Euproperty_Manager():
         self.service_url = 'http://'+str(self.tester.get_ec2_ip())+':8773/services/Eucalytpus'
         self.cmdpath = self.tester.eucapath+'/usr/sbin/'
         self.properties = []
+        self.cache_ttl = cache_ttl
+        self.last_updated = 0
+        self.stale_properties = set()
+        self.props_by_string = {}
+        self.props_by_name = {}
+        self.props_by_service = {}
+        self.props_by_partition = {}
         self.property_map = Property_Map()
         self.update_property_list()
         self.tester.property_manager = self
@@ -315,13 +335,15 @@ class Euproperty_Manager():
                                                 + ", value:" + str(value) \
                                                 + ", force_update:" +str(force_update))
         ret_props = []
-        if not self.properties or force_update:
-            self.update_property_list()
-        properties = copy.copy(self.properties)
-        if partition and properties:
-            properties = self.get_all_properties_for_partition(partition, list=properties)
-        if service_type and properties:
-            properties = self.get_all_properties_for_service(service_type,list=properties)
+        self.refresh_property_cache(force_update=force_update)
+        if partition:
+            properties = self.get_all_properties_for_partition(partition)
+            if service_type and properties:
+                properties = self.get_all_properties_for_service(service_type,list=properties)
+        elif service_type:
+            properties = self.get_all_properties_for_service(service_type)
+        else:
+            properties = copy.copy(self.properties)
         if search_string and properties:
             properties = self.get_all_properties_by_search_string(search_string, list=properties)
         if properties:
@@ -335,14 +357,77 @@ class Euproperty_Manager():
 
     def get_property(self,name,service_type, partition, force_update=False):
         self.debug('Get Property:' + str(name))
-        ret_prop = None
-        list = self.get_properties(partition=partition,service_type=service_type,force_update=force_update)
-        if list:
-            ret_prop =  self.get_euproperty_by_name(name, list=list)
-        return ret_prop
+        self.refresh_property_cache(force_update=force_update)
+        for prop in self.props_by_name.get(name, []):
+            if (not partition or prop.partition == partition) and \
+                    (not service_type or prop.service_type == service_type):
+                return prop
+        if self.get_properties(partition=partition,service_type=service_type):
+            raise EupropertyNotFoundException('Property not found by name:'+str(name))
+        return None
+
+    def is_property_cache_expired(self):
+        '''
+        Returns True if the property list has not been fetched yet, or is older than self.cache_ttl
+        '''
+        if not self.properties:
+            return True
+        if self.cache_ttl is not None and (time.time() - self.last_updated) > self.cache_ttl:
+            return True
+        return False
+
+    def invalidate_property_cache(self, property=None):
+        '''
+        Marks a single property, or the entire property list if 'property' is None, as needing to be re-fetched
+        the next time it is looked up.
+        property - optional - Euproperty or property string to invalidate
+        '''
+        if property is None:
+            self.last_updated = 0
+            self.properties = []
+        else:
+            if isinstance(property, Euproperty):
+                property = property.property_string
+            self.stale_properties.add(str(property))
+
+    def refresh_property_cache(self, force_update=False):
+        '''
+        Re-fetches the property list if forced or expired, otherwise re-fetches only the individual properties
+        which have been invalidated since the last fetch.
+        force_update - optional - boolean, re-fetch the entire property list
+        '''
+        if force_update or self.is_property_cache_expired():
+            self.update_property_list()
+        else:
+            for property_string in list(self.stale_properties):
+                self.update_property_list(property_name=property_string)
+                self.stale_properties.discard(property_string)
+
+    def index_property(self, prop):
+        '''
+        Adds a euproperty to the lookup indexes by property string, name, service type and partition
+        '''
+        self.props_by_string[prop.property_string] = prop
+        self.props_by_name.setdefault(prop.name, []).append(prop)
+        self.props_by_service.setdefault(prop.service_type, []).append(prop)
+        self.props_by_partition.setdefault(prop.partition, []).append(prop)
+
+    def build_property_index(self):
+        '''
+        Rebuilds the lookup indexes and the dynamic property map from self.properties
+        '''
+        self.props_by_string = {}
+        self.props_by_name = {}
+        self.props_by_service = {}
+        self.props_by_partition = {}
+        self.property_map = Property_Map()
+        for prop in self.properties:
+            self.index_property(prop)
+            self.create_dynamic_property_map_from_property(prop)
 
     def update_property_list(self, property_name= ''):
         newlist = []
+        seen = set()
         newprop = None
         self.debug("updating property list...")
         cmdout = self.work_machine.sys(self.cmdpath+'euca-describe-properties -v -U ' + str(self.service_url) +
@@ -363,19 +448,22 @@ class Euproperty_Manager():
             except Exception, e:
                 self.debug('Error processing property line: ' + propstring)
                 raise e
-            if not newprop in newlist:
+            if newprop and newprop.property_string not in seen:
+                seen.add(newprop.property_string)
                 newlist.append(newprop)
         if property_name:
+            #Existing properties were updated in place when parsed, only new properties need to be added
             for newprop in newlist:
-                for oldprop in self.properties:
-                    if oldprop.property_string  == newprop.property_string:
-                        oldprop = newprop
-                        self.create_dynamic_property_map_from_property(newprop)
+                if newprop.property_string not in self.props_by_string:
+                    self.properties.append(newprop)
+                    self.index_property(newprop)
+                    self.create_dynamic_property_map_from_property(newprop)
+                self.stale_properties.discard(newprop.property_string)
         else:
             self.properties = newlist
-            self.property_map = Property_Map()
-            for prop in self.properties:
-                self.create_dynamic_property_map_from_property(prop)
+            self.build_property_index()
+            self.stale_properties = set()
+            self.last_updated = time.time()
         return newlist
 
     def parse_euproperty_description(self, propstring):
@@ -410,12 +498,12 @@ class Euproperty_Manager():
         ret_value = " ".join(splitstring)
         #self.debug('property_string:'+str(property_string)+", ret_value:"+str(ret_value))
         #toss, property_string, ret_value = propstring.split()
-        for prop in self.properties:
-            #if this property is in our list, update the value and return
-            if prop.property_string == property_string:
-                prop.lastvalue = prop.value
-                prop.value = ret_value
-                return prop
+        #if this property is in our list, update the value and return
+        prop = self.props_by_string.get(property_string)
+        if prop:
+            prop.lastvalue = prop.value
+            prop.value = ret_value
+            return prop
         ret_name = property_string
         #...otherwise this property is not in our list yet, create a new property
         #parse property string into values...
@@ -472,8 +560,8 @@ class Euproperty_Manager():
 
 
     def get_euproperty_by_name(self,name, list=None):
-        props = []
-        list = list or self.properties
+        if list is None:
+            list = self.props_by_name.get(name, [])
         for property in list:
             if property.name == name:
                 return property
@@ -481,8 +569,11 @@ class Euproperty_Manager():
         
     def get_all_properties_for_partition(self, partition, list=None, verbose=False):
         self.debug('Get all properties for partition:'+str(partition))
+        if list is None:
+            props = copy.copy(self.props_by_partition.get(partition, []))
+            self.debug('Returning list of len:'+str(len(props)))
+            return props
         props = []
-        list = list or self.properties
         for property in list:
             if property.partition == partition:
                 if verbose:
@@ -492,8 +583,9 @@ class Euproperty_Manager():
         return props
 
     def get_all_properties_for_service(self,service, list=None):
+        if list is None:
+            return copy.copy(self.props_by_service.get(service, []))
         props = []
-        list = list or self.properties
         for property in list:
             if property.service_type == service:
                 props.append(property)
@@ -547,15 +639,13 @@ class Euproperty_Manager():
             ret_string = "\n".join(str(x) for x in ret_string)
             raise EupropertiesException("set property("+property.property_string+") to value("+str(value)+") failed.Ret Value ("+str(ret_value)+")\nRet String\n"+ret_string)
         property.value = ret_value
+        #The value reported by modify may differ from what describe returns, ie for reset, re-fetch on next lookup
+        self.invalidate_property_cache(property)
         return ret_value
 
     def get_property_by_string(self, property_string):
-        property = None
-        for prop in self.properties:
-            if prop.property_string == property_string:
-                property = prop
-                break
-        return property
+        self.refresh_property_cache()
+        return self.props_by_string.get(property_string)
 
     def set_property_value_by_string(self, property_string, value):
         property = self.get_property_by_string(property_string)
@@ -45,6 +45,7 @@ import time
 class EuSnapshot(Snapshot, TaggedResource):
     eutest_volume_md5 = None
     eutest_volume_md5len = None
+    eutest_volume_hash_tree = None
     eutest_volume_zone = None
     eutest_failmsg = None
     eutest_laststatus = None
@@ -65,6 +66,7 @@ class EuSnapshot(Snapshot, TaggedResource):
         newsnap.eutest_volume_md5 = None
         newsnap.tester = tester
         newsnap.eutest_volume_md5len = None
+        newsnap.eutest_volume_hash_tree = None
         newsnap.eutest_volume_zone = None
         newsnap.eutest_volumes = []
         newsnap.eutest_failmsg = None
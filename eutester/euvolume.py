@@ -70,6 +70,10 @@ class EuVolume(Volume, TaggedResource):
         newvol.eutest_createorder = None
         newvol.eutest_cmdtime = None
         newvol.eutest_attached_instance_id = None
+        newvol.pattern_seed = None #seed of the data pattern written to this volume, see EuInstance.pattern_fill_volume()
+        newvol.pattern_length = 0 #number of bytes from the start of the volume filled with the pattern
+        newvol.pattern_block_size = None
+        newvol.hash_tree = None #HashTree of the entire volume, see EuInstance.get_euvolume_hash_tree()
         if newvol.tags.has_key(newvol.tag_md5_key):
             newvol.md5 = newvol.tags[newvol.tag_md5_key]
         if newvol.tags.has_key(newvol.tag_md5len_key):
@@ -78,8 +82,16 @@ class EuVolume(Volume, TaggedResource):
 
         return newvol
     
-    def update(self):
-        super(EuVolume, self).update()
+    def update(self, volume=None):
+        """
+        Updates this volume's state. If 'volume' is provided, the update is applied from that already fetched
+        volume obj (ie from a batched describe, see EC2ops.update_volumes()) instead of a new describe request.
+        :param volume: optional boto volume obj with the same id as this volume
+        """
+        if volume is not None:
+            self._update(volume)
+        else:
+            super(EuVolume, self).update()
         if (self.tags.has_key(self.tag_md5_key) and (self.md5 != self.tags[self.tag_md5_key])) or \
             (self.tags.has_key(self.tag_md5len_key) and (self.md5len != self.tags[self.tag_md5len_key])):
             self.update_volume_attach_info_tags()
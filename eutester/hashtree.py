@@ -0,0 +1,122 @@
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2009-2011, Eucalyptus Systems, Inc.
+# All rights reserved.
+#
+# Redistribution and use of this software in source and binary forms, with or
+# without modification, are permitted provided that the following conditions
+# are met:
+#
+#   Redistributions of source code must retain the above
+#   copyright notice, this list of conditions and the
+#   following disclaimer.
+#
+#   Redistributions in binary form must reproduce the above
+#   copyright notice, this list of conditions and the
+#   following disclaimer in the documentation and/or other
+#   materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+'''
+Hash tree of per chunk checksums, used to verify entire volumes and find which chunks differ between them.
+
+The leaves are the md5 hex digests of consecutive 'chunk_size' byte chunks of a device, as produced on the guest
+by EuInstance.get_euvolume_hash_tree(). Each parent is the md5 of its children's digests concatenated, an odd
+node is promoted to the next level unchanged. Two trees built with the same chunk_size and length match if
+their roots match, and differing chunks are found by descending only into differing subtrees.
+
+Sample:
+    tree = instance.get_euvolume_hash_tree(volume)
+    ...
+    restored = instance.get_euvolume_hash_tree(volume_from_snap)
+    for offset, length in tree.get_chunk_ranges(tree.diff(restored)):
+        print 'differs at offset:' + str(offset) + ', length:' + str(length)
+'''
+import hashlib
+
+
+class HashTree():
+    def __init__(self, leaves, chunk_size, length):
+        '''
+        :param leaves: list of md5 hex digests, one per chunk in order
+        :param chunk_size: size in bytes of each chunk, the last chunk may be shorter
+        :param length: total number of bytes covered by the leaves
+        '''
+        self.chunk_size = int(chunk_size)
+        self.length = int(length)
+        expected = (self.length + self.chunk_size - 1) // self.chunk_size
+        if len(leaves) != expected:
+            raise Exception('HashTree expected ' + str(expected) + ' chunk digests for length:' + str(self.length) +
+                            ' and chunk_size:' + str(self.chunk_size) + ', got:' + str(len(leaves)))
+        self.levels = [list(leaves)]
+        while len(self.levels[-1]) > 1:
+            level = self.levels[-1]
+            parents = []
+            for x in xrange(0, len(level), 2):
+                if x + 1 < len(level):
+                    parents.append(hashlib.md5(level[x] + level[x + 1]).hexdigest())
+                else:
+                    parents.append(level[x])
+            self.levels.append(parents)
+
+    @property
+    def leaves(self):
+        return self.levels[0]
+
+    @property
+    def root(self):
+        if not self.leaves:
+            return hashlib.md5('').hexdigest()
+        return self.levels[-1][0]
+
+    def __eq__(self, other):
+        return isinstance(other, HashTree) and self.chunk_size == other.chunk_size and \
+            self.length == other.length and self.root == other.root
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __repr__(self):
+        return 'HashTree(root:' + str(self.root) + ', chunks:' + str(len(self.leaves)) + ', chunk_size:' + \
+               str(self.chunk_size) + ', length:' + str(self.length) + ')'
+
+    def diff(self, other):
+        '''
+        Returns the sorted list of chunk indexes whose digests differ between this tree and 'other'
+        '''
+        if self.chunk_size != other.chunk_size or self.length != other.length:
+            raise Exception('Can not compare hash trees with different chunk_size or length: ' + str(self) +
+                            ' -vs- ' + str(other))
+        if self.root == other.root:
+            return []
+        indexes = [0]
+        for depth in xrange(len(self.levels) - 1, 0, -1):
+            children = []
+            child_level = self.levels[depth - 1]
+            other_level = other.levels[depth - 1]
+            for index in indexes:
+                for child in (index * 2, index * 2 + 1):
+                    if child < len(child_level) and child_level[child] != other_level[child]:
+                        children.append(child)
+            indexes = children
+        return indexes
+
+    def get_chunk_range(self, index):
+        '''
+        Returns the (offset, length) tuple of bytes covered by chunk number 'index'
+        '''
+        offset = int(index) * self.chunk_size
+        return (offset, min(self.chunk_size, self.length - offset))
+
+    def get_chunk_ranges(self, indexes):
+        return [self.get_chunk_range(index) for index in indexes]
@@ -245,6 +245,22 @@ class Machine:
         else:
             raise Exception("Euinstance ssh connection is None")
         
+    def cmd_many(self, cmds, verbose=True, timeout=120, listformat=False, max_sessions=10):
+        '''
+        Issues several commands at once against the ssh connection to this machine, each on its own channel.
+        Returns a list of dicts in the same order as cmds, see cmd() and SshConnection.cmd_many() for more info.
+        cmds - mandatory - list of strings, the commands to be executed
+        verbose - optional - boolean flag to enable debug
+        timeout - optional - per command timeout in seconds
+        listformat -optional - specifies returned output in list of lines, or single string buffer
+        max_sessions - optional - max number of commands to have running at once
+        '''
+        if (self.ssh is not None):
+            return self.ssh.cmd_many(cmds, verbose=verbose, timeout=timeout, listformat=listformat,
+                                     max_sessions=max_sessions)
+        else:
+            raise Exception("Euinstance ssh connection is None")
+
     def sys_until_found(self, cmd, regex, verbose=True, timeout=120, listformat=True):
         '''
         Run a command until output of command satisfies/finds regex or EOF is found. 
@@ -304,6 +320,31 @@ class Machine:
             self.debug("Pid not found at paths: ".join(paths))
         return pid
 
+    def get_eucalyptus_service_pids(self, eucalyptus_services=None):
+        """
+        Looks up the pids of several eucalyptus services at once using concurrent commands on this
+        machine's ssh connection. Services which are not found will have a pid of None.
+
+        :param eucalyptus_services: list of service names, default: eucalyptus-cloud, eucalyptus-cc, eucalyptus-nc
+        :return: dict mapping service name to pid
+        """
+        eucalyptus_services = eucalyptus_services or ['eucalyptus-cloud', 'eucalyptus-cc', 'eucalyptus-nc']
+        paths = ["/var/run/eucalyptus/","/opt/eucalyptus/var/run/eucalyptus/"]
+        cmds = []
+        for service in eucalyptus_services:
+            cmds.append(" || ".join('cat ' + path + str(service) + '.pid 2>/dev/null' for path in paths))
+        pids = {}
+        for service, out in zip(eucalyptus_services, self.cmd_many(cmds, verbose=False, listformat=True)):
+            pids[service] = None
+            if out['status'] == 0 and out['output']:
+                try:
+                    pids[service] = int(out['output'][0].strip())
+                except ValueError:
+                    pass
+            if pids[service] is None:
+                self.debug("Pid for " + str(service) + " not found at paths: " + ",".join(paths))
+        return pids
+
     def get_eucalyptus_cloud_pid(self):
         """
         :return: Returns the process id for eucalyptus-cloud running on this machine, or None if not found.
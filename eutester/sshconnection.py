@@ -87,6 +87,7 @@ example with proxy:
 
 
 import copy
+import errno
 import os
 import paramiko
 import re
@@ -96,8 +97,8 @@ import time
 import types
 import sys
 import termios
+import threading
 import tty
-import eucaops
 
 
 
@@ -127,9 +128,200 @@ class SshCbReturn():
         self.buf = buf
 
 
+class SshConnectionPool():
+    def __init__(self, idle_timeout=300, keepalive=30, liveness_check_interval=10, liveness_timeout=5):
+        """
+        Process wide cache of established paramiko ssh clients. Connections are keyed by
+        host, port, user, credentials and proxy (see SshConnection.get_pool_key()) so new SshConnection objects
+        to the same destination reuse an existing transport instead of paying for a new key exchange and auth.
+
+        :param idle_timeout: seconds an unreferenced connection may sit idle before it is closed and evicted
+        :param keepalive: seconds between keepalive packets sent on pooled transports, 0 to disable
+        :param liveness_check_interval: connections idle longer than this are probed before being handed out
+        :param liveness_timeout: seconds to wait for a liveness probe to complete
+        """
+        self.idle_timeout = idle_timeout
+        self.keepalive = keepalive
+        self.liveness_check_interval = liveness_check_interval
+        self.liveness_timeout = liveness_timeout
+        self.lock = threading.RLock()
+        #Map of pool key to dict: {'client', 'refs', 'last_used', 'parent', 'probe'}
+        self.entries = {}
+
+    def needs_probe(self, entry):
+        """
+        Returns True if a pooled connection has been idle long enough that it should be probed before use,
+        or has been released since it was last checked.
+        """
+        return entry['probe'] or time.time() - entry['last_used'] > self.liveness_check_interval
+
+    def is_alive(self, entry, probe=True):
+        """
+        Checks whether a pooled connection's transport is still usable. The probe is a network round trip,
+        callers should not hold the pool lock while probing.
+        :param entry: pool entry dict
+        :param probe: boolean, if set probe connections idle longer than liveness_check_interval
+        :return: boolean
+        """
+        transport = entry['client'].get_transport()
+        if transport is None or not transport.is_active():
+            return False
+        if probe and self.needs_probe(entry):
+            #Probe with a round trip, a transport to a host which went away may still look active locally
+            try:
+                try:
+                    transport.open_session(timeout=self.liveness_timeout).close()
+                except TypeError:
+                    #Older paramiko versions do not support a timeout here
+                    transport.send_ignore()
+            except Exception:
+                return False
+            if not transport.is_active():
+                return False
+        return True
+
+    def get(self, key):
+        """
+        Returns a live pooled paramiko ssh client for 'key' and adds a reference to it, or None if the pool
+        does not have a usable connection for this key.
+        """
+        with self.lock:
+            self.evict_idle()
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if not self.is_alive(entry, probe=False):
+                self.remove(key)
+                return None
+            #Hold a reference so the entry is not evicted while it is probed outside of the lock
+            entry['refs'] += 1
+            probe = self.needs_probe(entry)
+        alive = not probe or self.is_alive(entry)
+        with self.lock:
+            if self.entries.get(key) is not entry:
+                #Removed by another thread while being probed
+                return None
+            if not alive:
+                self.remove(key)
+                return None
+            if probe:
+                entry['probe'] = False
+            entry['last_used'] = time.time()
+            return entry['client']
+
+    def put(self, key, client, parent=None):
+        """
+        Adds a newly established ssh client to the pool with a single reference. If another thread has already
+        pooled a live connection for this key, the new client is closed and the pooled client is returned instead.
+
+        :param key: pool key, see SshConnection.get_pool_key()
+        :param client: paramiko ssh client
+        :param parent: optional pool key of the proxy connection this client is tunneled through
+        :return: the paramiko ssh client to use
+        """
+        pooled = None
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry['client'] is not client:
+                if self.is_alive(entry, probe=False):
+                    #Hold a reference so the entry is not evicted while it is probed outside of the lock
+                    entry['refs'] += 1
+                    pooled = entry
+                    probe = self.needs_probe(entry)
+                else:
+                    self.remove(key)
+        if pooled is not None:
+            alive = not probe or self.is_alive(pooled)
+            with self.lock:
+                #The pooled entry may have been removed by another thread while being probed
+                alive = alive and self.entries.get(key) is pooled
+                if alive:
+                    if probe:
+                        pooled['probe'] = False
+                    pooled['last_used'] = time.time()
+                elif self.entries.get(key) is pooled:
+                    self.remove(key)
+            if alive:
+                client.close()
+                return pooled['client']
+        with self.lock:
+            transport = client.get_transport()
+            if transport and self.keepalive:
+                transport.set_keepalive(self.keepalive)
+            self.entries[key] = {'client': client, 'refs': 1, 'last_used': time.time(), 'parent': parent,
+                                 'probe': False}
+            return client
+
+    def release(self, key, client, invalidate=False):
+        """
+        Drops a reference to a pooled client. Unreferenced clients stay open until they idle out.
+        The next user of a released client probes it first, the host may have gone away (ie rebooted) while
+        it was in use.
+        :param key: pool key the client was obtained with
+        :param client: paramiko ssh client
+        :param invalidate: boolean, if set close the connection and remove it from the pool for all users
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry['client'] is client:
+                if invalidate:
+                    self.remove(key)
+                else:
+                    entry['refs'] = max(0, entry['refs'] - 1)
+                    entry['last_used'] = time.time()
+                    entry['probe'] = True
+            else:
+                #This client was already dropped from the pool, nobody else can get it from here
+                client.close()
+            self.evict_idle()
+
+    def remove(self, key):
+        """
+        Closes the connection for 'key' and removes it from the pool
+        """
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is not None:
+                try:
+                    entry['client'].close()
+                except Exception:
+                    pass
+
+    def evict_idle(self):
+        """
+        Closes unreferenced connections which have been idle longer than idle_timeout, and connections
+        which are no longer active. Proxy connections still in use by a pooled tunnel are kept.
+        """
+        with self.lock:
+            now = time.time()
+            parents = [entry['parent'] for entry in self.entries.itervalues() if entry['parent'] is not None]
+            for key, entry in self.entries.items():
+                if key in parents:
+                    continue
+                transport = entry['client'].get_transport()
+                if transport is None or not transport.is_active():
+                    self.remove(key)
+                elif entry['refs'] <= 0 and now - entry['last_used'] > self.idle_timeout:
+                    self.remove(key)
+
+    def close_all(self):
+        """
+        Closes all pooled connections
+        """
+        with self.lock:
+            for key in self.entries.keys():
+                self.remove(key)
+
+
+#Process wide ssh connection pool used by SshConnection
+ssh_pool = SshConnectionPool()
+
+
 class SshConnection():
     cmd_timeout_err_code = -100
     cmd_not_executed_code = -99
+    #Max number of bytes read from a channel per recv() call in cmd()
+    recv_bufsize = 32768
 
     def __init__(self,
                  host,
@@ -149,7 +341,9 @@ class SshConnection():
                  retry=1,
                  debugmethod=None,
                  verbose=False,
-                 debug_connect=False):
+                 debug_connect=False,
+                 port=22,
+                 use_pool=True):
         """
         :param host: -mandatory - string, hostname or ip address to establish ssh connection to
         :param username: - optional - string, username used to establish ssh session when keypath is not provided
@@ -168,9 +362,12 @@ class SshConnection():
         :param debugmethod: - method, used to handle debug msgs
         :param verbose: - optional - boolean to flag debug output on or off mainly for cmd execution
         :param debug_connect: - optional - boolean to flag debug output on or off for connection related operations
+        :param port: - optional - integer, ssh port to connect to, default 22
+        :param use_pool: - optional - boolean, reuse/share established connections via the process wide ssh_pool
         """
 
         self.host = host
+        self.port = port
         self.username = username
         self.password = password
         self.keypair = keypair
@@ -191,6 +388,7 @@ class SshConnection():
             self.key_files = str(self.key_files).split(',')
         self.find_keys = find_keys
         self.debug_connect = debug_connect
+        self.use_pool = use_pool
 
         #Used to store the last cmd attempted and it's exit code
         self.lastcmd = ""
@@ -214,20 +412,17 @@ class SshConnection():
                 self.debug("SSH proxy has hostname:" + str(self.proxy) + " user:" +
                            str(proxy_username) + " password:" + str(self.mask_password(proxy_password)))
 
+        self.proxy_pool_key = None
+        if self.proxy:
+            self.proxy_pool_key = self.get_pool_key(self.proxy, self.port, self.proxy_username,
+                                                    self.proxy_password, self.proxy_keypath)
+        self.pool_key = self.get_pool_key(self.host, self.port, self.username, self.password, self.keypath,
+                                          key_files=self.key_files, proxy_key=self.proxy_pool_key)
+
         if self.find_keys or \
                 self.keypath is not None or \
                 ((self.username is not None) and (self.password is not None)):
-            self.connection = self.get_ssh_connection(self.host,
-                                                      username=self.username,
-                                                      password=self.password,
-                                                      keypath=self.keypath,
-                                                      proxy_username=self.proxy_username,
-                                                      proxy_password=self.proxy_password,
-                                                      proxy_keypath=self.proxy_keypath,
-                                                      enable_ipv6_dns=self.enable_ipv6_dns,
-                                                      timeout=self.timeout,
-                                                      retry=self.retry,
-                                                      verbose=self.debug_connect)
+            self.connection = self.get_pooled_connection()
         else:
             raise Exception("Need either a keypath or username+password to create ssh connection")
 
@@ -263,6 +458,17 @@ class SshConnection():
         if key_files and not isinstance(key_files, types.ListType):
             key_files = key_files.split(',')
 
+        #Reuse an established transport to the proxy if we have one
+        proxy_key = self.get_pool_key(proxy_host[0], port, proxy_username, proxy_password, proxy_keypath)
+        if self.use_pool:
+            pooled = ssh_pool.get(proxy_key)
+            if pooled:
+                self.debug("Proxy - Reusing pooled connection to " + str(proxy_host[0]), verbose=verbose)
+                try:
+                    channel = pooled.get_transport().open_channel('direct-tcpip', dest_host, ('127.0.0.1', 0))
+                    return paramiko.Transport(channel)
+                finally:
+                    ssh_pool.release(proxy_key, pooled)
         #Make sure there is at least one likely way to authenticate...
         ssh = paramiko.SSHClient()
         if (proxy_username is not None) and (key_files or self.find_keys or proxy_keypath is not None or \
@@ -280,8 +486,15 @@ class SshConnection():
                            verbose=verbose)
                 ssh._auth(proxy_username, None,None,key_files, True, True)
                 p_transport = ssh._transport
+            if self.use_pool:
+                ssh = ssh_pool.put(proxy_key, ssh)
+                p_transport = ssh.get_transport()
             #forward from 127.0.0.1:<free_random_port> to |dest_host|
-            channel = p_transport.open_channel('direct-tcpip', dest_host, ('127.0.0.1', 0))
+            try:
+                channel = p_transport.open_channel('direct-tcpip', dest_host, ('127.0.0.1', 0))
+            finally:
+                if self.use_pool:
+                    ssh_pool.release(proxy_key, ssh)
             return paramiko.Transport(channel)
         else:
             raise Exception("Need either a keypath or username+password to create ssh proxy connection")
@@ -385,7 +598,7 @@ class SshConnection():
         if verbose:
             self.debug("[" + self.username + "@" + str(self.host) + "]# " + cmd)
         try:
-            tran = self.connection.get_transport()
+            tran = self.connection.get_transport() if self.connection else None
             if tran is None or not tran.active:
                 self.debug("SSH transport was None, attempting to restablish ssh to: "+str(self.host))
                 self.refresh_connection()
@@ -400,27 +613,28 @@ class SshConnection():
                 chan.sendall(cmd)
             else:
                 chan.exec_command(cmd)
-            output = None
+            # Collect output chunks in a list and join once at the end to avoid quadratic string concatenation
+            output = []
             fd = chan.fileno()
             cmdstart = start = time.time()
             newdebug = "\n"
             while not chan.closed:
-                time.sleep(0.05)
-                try:
-                    rl, wl, xl = select.select([fd], [], [], timeout)
-                except select.error:
-                    break
-                elapsed = int(time.time() - start)
+                elapsed = time.time() - start
                 if elapsed >= timeout:
                     raise CommandTimeoutException(
                         "SSH Command timer fired after " + str(int(elapsed)) + " seconds. Cmd:'" + str(cmd) + "'")
+                # Block until the channel has data, eof or the remaining time expires. No fixed sleep here.
+                try:
+                    rl, wl, xl = select.select([fd], [], [], timeout - elapsed)
+                except select.error:
+                    break
                 if len(rl) > 0:
                     cmddebug('ssh cmd: got input on recv channel')
                     while chan.recv_ready():
-                        new = chan.recv(1024)
+                        new = chan.recv(self.recv_bufsize)
                         if verbose:
                             cmddebug('ssh cmd: got new data on channel:"' + str(new) + '"')
-                        if new is not None:
+                        if new:
                             #We have data to handle...
                             #Run call back if there is one, let call back handle data read in
                             if cb is not None:
@@ -437,10 +651,7 @@ class SshConnection():
                                 if cbreturn.stop:
                                     cmddebug('ssh cmd: callback sent stop')
                                     if cbreturn.buf:
-                                        if output is None:
-                                            output = cbreturn.buf
-                                        else:
-                                            output += cbreturn.buf
+                                        output.append(cbreturn.buf)
                                     cbfired = True
                                     chan.close()
                                     #Let the callback dictate the return code, otherwise -1 for connection err may occur
@@ -461,10 +672,7 @@ class SshConnection():
                                     #Let the callback update the output buffer to be returned
                                     if cbreturn.buf:
                                         cmddebug('ssh cmd: cb returned buf:"' + str(cbreturn.buf) + '"')
-                                        if output is None:
-                                            output = cbreturn.buf
-                                        else:
-                                            output += cbreturn.buf
+                                        output.append(cbreturn.buf)
                                     #Change the callback to handle future output from this cmd
                                     if cbreturn.nextcb:
                                         cmddebug('ssh cmd: updating to new callback provided in cb return nextcb')
@@ -481,10 +689,7 @@ class SshConnection():
                                         cmddebug('channel status after sending string. Is closed = ' + str(chan.closed))
                             else:
                                 #if no call back then append output to return dict and handle debug
-                                if output == None:
-                                    output = new
-                                else:
-                                    output += new
+                                output.append(new)
                                 if verbose:
                                     #Dont print line by line output if cb is used, let cb handle that 
                                     newdebug += new
@@ -495,11 +700,14 @@ class SshConnection():
                     if newdebug and verbose:
                         self.debug(str(newdebug))
                         newdebug = ''
+                    # Remote side sent eof and all buffered data has been read, no need to wait for the close
+                    if not chan.closed and chan.eof_received and not chan.recv_ready():
+                        cmddebug('ssh cmd: eof received on channel')
+                        break
                 elif enable_debug:
                     self.debug('ssh cmd: len of rl was < 0')
             cmddebug('ssh cmd: channel closed')
-            if output is None:
-                output = ""
+            output = "".join(output)
             if listformat:
                 #return output as list of lines
                 output = output.splitlines()
@@ -509,6 +717,8 @@ class SshConnection():
             #add command outcome in return dict.
             if status is None:
                 status = self.lastexitcode = chan.recv_exit_status()
+            if not chan.closed:
+                chan.close()
             ret['cmd'] = cmd
             ret['output'] = output
             ret['status'] = status
@@ -523,24 +733,164 @@ class SshConnection():
             raise cte
         return ret
 
+    def cmd_many(self, cmds, verbose=None, timeout=120, listformat=False, get_pty=True, max_sessions=10):
+        """
+        Runs several commands at once, each on its own channel of this connection's single transport.
+        Output from all channels is read as it arrives, so the total time is roughly that of the slowest
+        command instead of the sum of all of them. Up to 'max_sessions' channels are open at any one time,
+        (see sshd MaxSessions), remaining commands are started as earlier ones complete.
+
+        Returns list of dicts, in the same order as cmds, each in the same format as cmd():
+            ['cmd'] - The command which was executed
+            ['output'] - The std out/err from the executed command
+            ['status'] - The exitcode of the command, cmd_timeout_err_code if the command timed out or did not
+                         finish, or cmd_not_executed_code if it could not be started
+            ['cbfired']  - Always False, callbacks are not supported here
+            ['elapsed'] - Time elapsed waiting for this command to end.
+
+        :param cmds: - mandatory - list of strings representing the commands to be run
+        :param verbose: - optional - will default to global setting
+        :param timeout: - optional - integer seconds each command is allowed to run for
+        :param listformat: - optional - boolean, if set returns output as list of lines, else a single buffer/string
+        :param get_pty: - optional - boolean, request a pty for each channel
+        :param max_sessions: - optional - integer, max number of channels to have open at once
+        """
+        if verbose is None:
+            verbose = self.verbose
+        cmds = [str(cmd) for cmd in cmds]
+        results = [None] * len(cmds)
+        #Map of open channels to [index of cmd, list of output chunks, start time]
+        active = {}
+        next_index = 0
+        #The connection is None once this obj has been closed
+        tran = self.connection.get_transport() if self.connection else None
+        if tran is None or not tran.active:
+            self.debug("SSH transport was None, attempting to restablish ssh to: "+str(self.host))
+            self.refresh_connection()
+            tran = self.connection.get_transport()
+
+        def set_result(index, output, status, cmdstart):
+            output = "".join(output)
+            if listformat:
+                output = output.splitlines()
+            results[index] = {'cmd': cmds[index],
+                              'output': output,
+                              'status': status,
+                              'cbfired': False,
+                              'elapsed': int(time.time() - cmdstart)}
+            self.lastcmd = cmds[index]
+            self.lastexitcode = status
+            if verbose:
+                self.debug("[" + self.username + "@" + str(self.host) + "]# " + cmds[index] +
+                           " exited with status:" + str(status) + "\n" + str(results[index]['output']))
+
+        def finish(chan, status):
+            index, output, cmdstart = active.pop(chan)
+            if not chan.closed:
+                chan.close()
+            set_result(index, output, status, cmdstart)
+
+        try:
+            while next_index < len(cmds) or active:
+                #Start as many of the remaining commands as our session limit allows
+                while next_index < len(cmds) and len(active) < max_sessions:
+                    index = next_index
+                    next_index += 1
+                    chan = None
+                    try:
+                        chan = tran.open_session()
+                        chan.setblocking(0)
+                        if get_pty:
+                            chan.get_pty()
+                        chan.exec_command(cmds[index])
+                    except Exception, e:
+                        self.debug("Failed to start command (" + cmds[index] + "), err:" + str(e))
+                        if chan:
+                            chan.close()
+                        set_result(index, [str(e)], SshConnection.cmd_not_executed_code, time.time())
+                        continue
+                    active[chan] = [index, [], time.time()]
+                now = time.time()
+                for chan in active.keys():
+                    if now - active[chan][2] >= timeout:
+                        self.debug("Command (" + cmds[active[chan][0]] + ") timeout after " + str(timeout) +
+                                   " seconds")
+                        finish(chan, SshConnection.cmd_timeout_err_code)
+                if not active:
+                    continue
+                remaining = min(timeout - (now - cmdstart) for index, output, cmdstart in active.values())
+                try:
+                    rl, wl, xl = select.select(active.keys(), [], [], max(0, remaining))
+                except select.error, se:
+                    if se.args and se.args[0] == errno.EINTR:
+                        continue
+                    self.debug("select failed waiting on commands, err:" + str(se))
+                    break
+                for chan in rl:
+                    index, output, cmdstart = active[chan]
+                    while chan.recv_ready():
+                        new = chan.recv(self.recv_bufsize)
+                        if not new:
+                            break
+                        output.append(new)
+                    if chan.closed or (chan.eof_received and not chan.recv_ready()):
+                        finish(chan, chan.recv_exit_status())
+        finally:
+            #Commands still running are reported as timed out, commands never started as not executed
+            for chan in active.keys():
+                finish(chan, SshConnection.cmd_timeout_err_code)
+            for index in xrange(len(cmds)):
+                if results[index] is None:
+                    set_result(index, [], SshConnection.cmd_not_executed_code, time.time())
+        return results
+
     def refresh_connection(self):
         """
         Attempts to establish a new ssh connection to replace the old 'connection' of this
-        ssh obj.
+        ssh obj. If the old connection is pooled, it is closed and removed from the pool for all users.
+        If another user has already replaced it in the pool, the newer pooled connection is used.
         """
         if self.connection:
-            self.connection.close()
-        self.connection = self.get_ssh_connection(self.host,
-                                                  username=self.username,
-                                                  password=self.password,
-                                                  keypath=self.keypath,
-                                                  proxy_username=self.proxy_username,
-                                                  proxy_password=self.proxy_password,
-                                                  proxy_keypath=self.proxy_keypath,
-                                                  enable_ipv6_dns=self.enable_ipv6_dns,
-                                                  timeout=self.timeout,
-                                                  retry=self.retry,
-                                                  verbose=self.debug_connect)
+            if self.use_pool:
+                ssh_pool.release(self.pool_key, self.connection, invalidate=True)
+            else:
+                self.connection.close()
+        self.connection = self.get_pooled_connection()
+
+    @staticmethod
+    def get_pool_key(host, port, username, password=None, keypath=None, key_files=None, proxy_key=None):
+        """
+        Returns the key used to look up connections in the ssh_pool.
+        :param proxy_key: pool key of the proxy this connection is tunneled through, if any
+        """
+        return (str(host).strip(), int(port), username, password, keypath, tuple(key_files or []), proxy_key)
+
+    def get_pooled_connection(self):
+        """
+        Returns a live ssh connection for this obj's host, user and credentials. The connection is taken
+        from the process wide ssh_pool when possible, otherwise a new connection is made (and pooled if
+        use_pool is set).
+        """
+        if self.use_pool:
+            connection = ssh_pool.get(self.pool_key)
+            if connection:
+                self.debug("SSH - Reusing pooled connection to " + str(self.host), verbose=self.debug_connect)
+                return connection
+        connection = self.get_ssh_connection(self.host,
+                                             username=self.username,
+                                             password=self.password,
+                                             keypath=self.keypath,
+                                             proxy_username=self.proxy_username,
+                                             proxy_password=self.proxy_password,
+                                             proxy_keypath=self.proxy_keypath,
+                                             enable_ipv6_dns=self.enable_ipv6_dns,
+                                             port=self.port,
+                                             timeout=self.timeout,
+                                             retry=self.retry,
+                                             verbose=self.debug_connect)
+        if self.use_pool:
+            connection = ssh_pool.put(self.pool_key, connection, parent=self.proxy_pool_key)
+        return connection
 
     def get_ssh_connection(self,
                            hostname,
@@ -632,7 +982,7 @@ class SshConnection():
                 if proxy_transport:
                     ssh._transport = proxy_transport
                 else:
-                    ssh._transport = paramiko.Transport(ip)
+                    ssh._transport = paramiko.Transport((ip, port))
                 ssh._transport.start_client()
                 ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
                 try:
@@ -831,7 +1181,7 @@ class SshConnection():
         Example method to invoke an interactive shell
         :pararm timeout: inactive session timeout, a value of 0 will wait for input/output forever
         '''
-        tran = self.connection.get_transport()
+        tran = self.connection.get_transport() if self.connection else None
         if tran is None:
             self.debug("SSH transport was None, attempting to re-establish ssh to: "+str(self.host))
             self.refresh_connection()
@@ -897,7 +1247,7 @@ class SshConnection():
         :param localfilepath: path to file on local system
         :param remotefilepath: destination path for put on remote system
         """
-        if not self.connection._transport:
+        if not self.connection or not self.connection._transport:
             self.refresh_connection()
         transport = self.connection._transport
         self.open_sftp()
@@ -910,7 +1260,7 @@ class SshConnection():
         :param localfilepath: path where remote file 'get' will place file on local system
         :param remotefilepath: destination path for file to 'get' on remote system
         """
-        if not self.connection._transport:
+        if not self.connection or not self.connection._transport:
             self.refresh_connection()
         transport = self.connection._transport
         self.open_sftp()
@@ -918,8 +1268,19 @@ class SshConnection():
         self.close_sftp()
 
 
-    def close(self):
-        self.connection.close()
+    def close(self, invalidate=False):
+        """
+        Closes this obj's ssh connection. Pooled connections are released back to the ssh_pool, and
+        are only closed once unreferenced and idle. Closing an already closed obj does nothing.
+        :param invalidate: boolean, if set close a pooled connection and remove it from the pool for all users
+        """
+        if self.connection is None:
+            return
+        if self.use_pool:
+            ssh_pool.release(self.pool_key, self.connection, invalidate=invalidate)
+        else:
+            self.connection.close()
+        self.connection = None
 
 
 class CommandExitCodeException(Exception):
@@ -57,6 +57,7 @@ from random import randint
 from datetime import datetime
 import winrm_connection
 import socket
+import base64
 import sys
 import os
 import re
@@ -389,6 +390,22 @@ class WinInstanceLogicalDisk(WinInstanceDiskType):
 class WinInstance(Instance, TaggedResource):
     gigabyte = 1073741824
     megabyte = 1048576
+    #Powershell script emitting the disk related wmi objects and their associations in the key=value
+    #format used by wmic's textvaluelist.xsl, with a 'wmiclass' key added to each object.
+    disk_inventory_script = """
+foreach ($c in 'Win32_DiskDrive','Win32_DiskPartition','Win32_LogicalDisk','Win32_LogicalDiskToPartition') {
+    foreach ($o in @(Get-WmiObject $c)) {
+        'wmiclass=' + $c
+        foreach ($p in $o.Properties) {
+            $v = $p.Value
+            if ($v -is [bool]) { $v = ([string]$v).ToUpper() }
+            elseif ($v -is [array]) { $v = '{' + ($v -join ',') + '}' }
+            $p.Name + '=' + ([string]$v -replace '[\\r\\n]+', ' ')
+        }
+        ''
+    }
+}
+"""
 
     @classmethod
     def make_euinstance_from_instance(cls,
@@ -417,7 +434,9 @@ class WinInstance(Instance, TaggedResource):
                                       cygwin_path = None,
                                       disk_update_interval=10,
                                       retry=2,
-                                      brief=False
+                                      brief=False,
+                                      security_groups=None,
+                                      vmtype_info=None
                                       ):
         '''
         Primary constructor for this class. Note: to avoid an ssh session within this method, provide keys, username/pass later.
@@ -433,6 +452,9 @@ class WinInstance(Instance, TaggedResource):
         debugmethod - optional - method, used for debug output
         verbose - optional - boolean to determine if debug is to be printed using debug()
         retry - optional - integer, ssh connection attempts for non-authentication failures
+        bdm_root_vol - optional - EuVolume obj already fetched for this instance's ebs root volume
+        security_groups - optional - list of security group objs already fetched for this instance's reservation
+        vmtype_info - optional - vm type info obj already fetched for this instance's zone and type
         '''
         newins = WinInstance(instance.connection)
         newins.__dict__ = instance.__dict__
@@ -467,7 +489,9 @@ class WinInstance(Instance, TaggedResource):
         newins.block_device_prefix = block_device_prefix
         newins.private_addressing = private_addressing
         newins.reservation = reservation or newins.get_reservation()
-        if newins.reservation:
+        if security_groups is not None:
+            newins.security_groups = security_groups
+        elif newins.reservation:
             newins.security_groups = newins.tester.get_instance_security_groups(newins)
         else:
             newins.security_groups = None
@@ -475,7 +499,10 @@ class WinInstance(Instance, TaggedResource):
         newins.cmdstart = cmdstart
         newins.auto_connect = auto_connect
         newins.set_last_status()
-        newins.update_vm_type_info()
+        if vmtype_info is not None:
+            newins.vmtype_info = vmtype_info
+        else:
+            newins.update_vm_type_info()
         newins.cygwin_path = cygwin_path
         newins.system_info = None
         newins.diskdrives = []
@@ -483,7 +510,9 @@ class WinInstance(Instance, TaggedResource):
         newins.logicaldisks = []
         newins.cygwin_dev_map  = {}
         #newins.set_block_device_prefix()
-        if newins.root_device_type == 'ebs':
+        if newins.root_device_type == 'ebs' and bdm_root_vol:
+            newins.bdm_root_vol = bdm_root_vol
+        elif newins.root_device_type == 'ebs':
             try:
                 volume = newins.tester.get_volume(volume_id = newins.block_device_mapping.get(newins.root_device_name).volume_id)
                 newins.bdm_root_vol = EuVolume.make_euvol_from_vol(volume, tester=newins.tester,cmdstart=newins.cmdstart)
@@ -495,8 +524,16 @@ class WinInstance(Instance, TaggedResource):
             newins.connect_to_instance(timeout=timeout)
         return newins
 
-    def update(self):
-        super(WinInstance, self).update()
+    def update(self, instance=None):
+        """
+        Updates this instance's state. If 'instance' is provided, the update is applied from that already fetched
+        instance obj (ie from a batched describe, see EC2ops.update_instances()) instead of a new describe request.
+        :param instance: optional boto instance obj with the same id as this instance
+        """
+        if instance is not None:
+            self._update(instance)
+        else:
+            super(WinInstance, self).update()
         self.set_last_status()
 
     def update_vm_type_info(self):
@@ -998,26 +1035,61 @@ class WinInstance(Instance, TaggedResource):
         self.diskdrives = []
         self.disk_partitions = []
         self.logicaldisks = []
-        self.diskdrives =  self.get_updated_diskdrive_info()
-        self.disk_partitions = self.get_updated_partition_info()
-        self.logicaldisks = self.get_updated_logicaldisk_info()
-        self.associate_diskdrives_to_partitions()
-        self.associate_partitions_to_logicaldrives()
-
-    def get_updated_diskdrive_info(self):
+        try:
+            inventory = self.get_disk_inventory()
+        except Exception, e:
+            self.debug('Could not fetch disk inventory with powershell, using individual wmic commands. Err:' + str(e))
+            inventory = None
+        if inventory is not None:
+            self.diskdrives =  self.get_updated_diskdrive_info(wmic_dicts=inventory.get('win32_diskdrive', []))
+            self.disk_partitions = self.get_updated_partition_info(wmic_dicts=inventory.get('win32_diskpartition', []))
+            self.logicaldisks = self.get_updated_logicaldisk_info(wmic_dicts=inventory.get('win32_logicaldisk', []))
+            self.associate_diskdrives_to_partitions()
+            self.associate_partitions_to_logicaldrives(
+                associations=inventory.get('win32_logicaldisktopartition', []))
+        else:
+            self.diskdrives =  self.get_updated_diskdrive_info()
+            self.disk_partitions = self.get_updated_partition_info()
+            self.logicaldisks = self.get_updated_logicaldisk_info()
+            self.associate_diskdrives_to_partitions()
+            self.associate_partitions_to_logicaldrives()
+
+    def get_disk_inventory(self, verbose=False):
+        '''
+        Fetches the Win32_DiskDrive, Win32_DiskPartition, Win32_LogicalDisk and Win32_LogicalDiskToPartition wmi
+        objects from the guest using a single powershell command, see disk_inventory_script.
+        :param verbose: boolean, show the command output
+        :returns dict mapping lowercase wmi class names to lists of dicts. Dict keys are in lowercase, as
+                 returned by get_parsed_wmic_command_output()
+        '''
+        self.debug('Getting disk inventory...')
+        encoded = base64.b64encode(self.disk_inventory_script.encode('utf-16-le'))
+        cmd = 'powershell -NoProfile -NonInteractive -InputFormat None -EncodedCommand ' + encoded
+        inventory = {}
+        for wmic_dict in self.get_parsed_wmic_command_output(cmd, verbose=verbose):
+            wmiclass = str(wmic_dict.pop('wmiclass', '')).lower()
+            inventory.setdefault(wmiclass, []).append(wmic_dict)
+        if not inventory.get('win32_diskdrive'):
+            raise Exception('No disk drives found in disk inventory output')
+        return inventory
+
+    def get_updated_diskdrive_info(self, wmic_dicts=None):
         '''
         Populate self.diskdrives with WinInstanceDisk objects containing info parsed from wmic command.
         Since wmic doesn't seem to use delimeters this method attempts to derive the lengh of each column/header
         in order to parse out the info per disk.
         :pararm force: boolean. Will force an update, otherwise this method will wait a minimum of
         self.disk_update_interval before updating again.
+        :param wmic_dicts: optional list of already fetched Win32_DiskDrive dicts, ie from get_disk_inventory()
         '''
         #cmd = "wmic diskdrive get  /format:textvaluelist.xsl"
         self.debug('Getting updated diskdrive info...')
         cmd = "wmic diskdrive list full"
 
         diskdrives = []
-        for disk_dict in self.get_parsed_wmic_command_output(cmd):
+        if wmic_dicts is None:
+            wmic_dicts = self.get_parsed_wmic_command_output(cmd)
+        for disk_dict in wmic_dicts:
             try:
                 diskdrives.append(WinInstanceDiskDrive(self,disk_dict))
             except Exception, e:
@@ -1029,19 +1101,22 @@ class WinInstance(Instance, TaggedResource):
         return diskdrives
 
 
-    def get_updated_partition_info(self):
+    def get_updated_partition_info(self, wmic_dicts=None):
         '''
         Populate self.diskdrives with WinInstanceDisk objects containing info parsed from wmic command.
         Since wmic doesn't seem to use delimeters this method attempts to derive the lengh of each column/header
         in order to parse out the info per disk.
         :pararm force: boolean. Will force an update, otherwise this method will wait a minimum of
         self.disk_update_interval before updating again.
+        :param wmic_dicts: optional list of already fetched Win32_DiskPartition dicts, ie from get_disk_inventory()
         '''
         self.debug('Getting udpated partition info...')
         cmd = "wmic partition list brief /format:textvaluelist.xsl"
 
         disk_partitions = []
-        for part_dict in self.get_parsed_wmic_command_output(cmd):
+        if wmic_dicts is None:
+            wmic_dicts = self.get_parsed_wmic_command_output(cmd)
+        for part_dict in wmic_dicts:
             try:
                 disk_partitions.append(WinInstanceDiskPartition(self,part_dict))
             except Exception, e:
@@ -1053,11 +1128,13 @@ class WinInstance(Instance, TaggedResource):
         return disk_partitions
 
 
-    def get_updated_logicaldisk_info(self):
+    def get_updated_logicaldisk_info(self, wmic_dicts=None):
         self.debug('Getting updated logicaldisk info...')
         cmd ='wmic logicaldisk list /format:textvaluelist.xsl'
         logicaldisks = []
-        for part_dict in self.get_parsed_wmic_command_output(cmd):
+        if wmic_dicts is None:
+            wmic_dicts = self.get_parsed_wmic_command_output(cmd)
+        for part_dict in wmic_dicts:
             try:
                 logicaldisks.append(WinInstanceLogicalDisk(self,part_dict))
             except Exception, e:
@@ -1076,7 +1153,28 @@ class WinInstance(Instance, TaggedResource):
                 if part.diskindex == disk.index:
                     disk.disk_partitions.append(part)
 
-    def associate_partitions_to_logicaldrives(self, verbose=False):
+    def associate_partitions_to_logicaldrives(self, verbose=False, associations=None):
+        '''
+        :param associations: optional list of already fetched Win32_LogicalDiskToPartition dicts, ie from
+                             get_disk_inventory(). If not provided a wmic assoc command is run per partition.
+        '''
+        if associations is not None:
+            for part in self.disk_partitions:
+                part.logicaldisks = []
+            for assoc in associations:
+                part_match = re.search('DeviceID="([^"]*)"', str(assoc.get('antecedent', '')))
+                disk_match = re.search('DeviceID="([^"]*)"', str(assoc.get('dependent', '')))
+                if not part_match or not disk_match:
+                    continue
+                for part in self.disk_partitions:
+                    if str(part.deviceid) == part_match.group(1):
+                        for disk in self.logicaldisks:
+                            if str(disk.deviceid) == disk_match.group(1):
+                                part.logicaldisks.append(disk)
+                                disk.partition = part
+                                break
+                        break
+            return
         for part in self.disk_partitions:
             drive_id = None
             part.logicaldisks = []
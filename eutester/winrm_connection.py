@@ -44,6 +44,7 @@ import copy
 import sys
 import time
 import re
+import threading
 
 
 class Winrm_Connection:
@@ -58,7 +59,18 @@ class Winrm_Connection:
                  default_command_timeout=600,
                  url=None,
                  debug_method=None,
-                 verbose=True):
+                 verbose=True,
+                 keep_shell=True,
+                 shell_idle_timeout=60,
+                 shell_pool_size=1):
+        '''
+        :param keep_shell: boolean, if True shells are kept open and reused across commands, if False a new
+                           shell is created and deleted for each command.
+        :param shell_idle_timeout: seconds a kept shell may sit unused before it is replaced rather than reused,
+                                   should be less than the server's shell IdleTimeout. None or 0 disables.
+        :param shell_pool_size: max number of shells open at once, allowing this many commands to run
+                                concurrently from separate threads.
+        '''
         self.debug_method = debug_method
         self.hostname = hostname
         self.username = username
@@ -72,6 +84,14 @@ class Winrm_Connection:
         self.shell_id = None
         self.command_id = None
         self.last_used = None
+        self.keep_shell = keep_shell
+        self.shell_idle_timeout = shell_idle_timeout
+        self.shell_pool_size = max(1, int(shell_pool_size))
+        self.shell_lock = threading.Condition(threading.Lock())
+        self.idle_shells = []
+        self.shells_in_use = 0
+        #Incremented by close_shell() so shells in use at that time are closed rather than reused when released
+        self.shell_generation = 0
 
         self.verbose = verbose
 
@@ -92,19 +112,15 @@ class Winrm_Connection:
         else:
             print(msg)
 
-    def reset_shell(self, timeout=None, retries=5):
+    def open_shell(self, winproto, retries=5):
         retry = 0
         tb = ""
         e = None
-        self.close_shell()
-        timeout = timeout or self.default_command_timeout
-        self.winproto.transport.timeout = timeout #self.default_command_timeout
-        #self.debug('reset_shell connection, Host:' + str(self.hostname) + ":" + str(self.port) + ", Username:" + str(self.username) + ', Password:' + str(self.password))
+        #self.debug('open_shell connection, Host:' + str(self.hostname) + ":" + str(self.port) + ", Username:" + str(self.username) + ', Password:' + str(self.password))
         while retry < retries:
             retry += 1
             try:
-                self.shell_id = self.winproto.open_shell()
-                return self.shell_id
+                return winproto.open_shell()
             except WinRMTransportError, wte:
                 print "Failed to open shell on attempt#:" + str(retry) + "/" + str(retries)+ ", err:" + str(wte)
                 if retry < retries:
@@ -116,6 +132,91 @@ class Winrm_Connection:
         self.debug(str(tb))
         raise Exception('Could not open shell to ' + str(self.url) + str(e))
 
+    def reset_shell(self, timeout=None, retries=5):
+        """
+        Closes any open shells and opens a new shell which will be used by the next command.
+        :returns: the new shell id
+        """
+        self.close_shell()
+        timeout = timeout or self.default_command_timeout
+        self.winproto.transport.timeout = timeout
+        shell = Winrm_Shell(self.winproto, self.open_shell(self.winproto, retries=retries))
+        with self.shell_lock:
+            self.shell_id = shell.shell_id
+            shell.generation = self.shell_generation
+            self.idle_shells.append(shell)
+            self.shell_lock.notify()
+        return shell.shell_id
+
+    def acquire_shell(self):
+        """
+        Returns an open shell for a command to run in. Reuses an idle kept shell if one is available, otherwise
+        opens a new shell. If shell_pool_size shells are already in use, waits for one to be released.
+        """
+        stale = []
+        shell = None
+        try:
+            with self.shell_lock:
+                while True:
+                    while self.idle_shells:
+                        idle = self.idle_shells.pop()
+                        if self.shell_idle_timeout and (time.time() - idle.last_used) > self.shell_idle_timeout:
+                            stale.append(idle)
+                            continue
+                        shell = idle
+                        break
+                    if shell or self.shells_in_use < self.shell_pool_size:
+                        self.shells_in_use += 1
+                        generation = self.shell_generation
+                        break
+                    self.shell_lock.wait()
+        finally:
+            for idle in stale:
+                self.delete_shell(idle)
+        if shell:
+            return shell
+        try:
+            #Each concurrent shell gets its own protocol obj so per command transport timeouts don't collide
+            if self.shell_pool_size > 1:
+                winproto = Protocol(endpoint=self.url, transport=self.transport,
+                                    username=self.username, password=self.password)
+            else:
+                winproto = self.winproto
+            shell = Winrm_Shell(winproto, self.open_shell(winproto))
+            shell.generation = generation
+            self.shell_id = shell.shell_id
+            return shell
+        except:
+            with self.shell_lock:
+                self.shells_in_use -= 1
+                self.shell_lock.notify()
+            raise
+
+    def release_shell(self, shell, discard=False):
+        """
+        Returns a shell acquired with acquire_shell(). The shell is kept for reuse unless 'discard' is set,
+        keep_shell is False, or close_shell() was called while it was in use, in which case it is closed.
+        :param shell: Winrm_Shell obj
+        :param discard: boolean, close this shell, ie after it has failed
+        """
+        with self.shell_lock:
+            self.shells_in_use -= 1
+            keep = self.keep_shell and not discard and shell.generation == self.shell_generation
+            if keep:
+                shell.last_used = time.time()
+                self.idle_shells.append(shell)
+            self.shell_lock.notify()
+        if not keep:
+            self.delete_shell(shell)
+
+    def delete_shell(self, shell):
+        try:
+            shell.winproto.close_shell(shell.shell_id)
+        except Exception, e:
+            self.debug('Error closing winrm shell:' + str(shell.shell_id) + ', err:' + str(e))
+        if self.shell_id == shell.shell_id:
+            self.shell_id = None
+
     def cmd(self, command, console_mode_stdin=True, skip_cmd_shell=False, timeout=None, verbose=None):
         errmsg = ""
         if verbose is None:
@@ -124,42 +225,64 @@ class Winrm_Connection:
         arguments = command.split(' ')
         command = arguments.pop(0)
         self.command_id = None
+        command_id = None
 
         #if timeout is not None:
             #convert timeout to ISO8601 format
             #timeout = self.convert_iso8601_timeout(timeout)
-        self.reset_shell(timeout=timeout)
+        shell = None
+        discard = False
         try:
-            self.command_id= self.winproto.run_command(self.shell_id,
-                                      command,
-                                      arguments=arguments,
-                                      console_mode_stdin=console_mode_stdin,
-                                      skip_cmd_shell=skip_cmd_shell)
+            #A kept shell may have been deleted on the remote side, ie by its IdleTimeOut. If starting the command
+            #in a reused shell fails, retry once in a new shell.
+            for attempt in [1, 2]:
+                shell = self.acquire_shell()
+                #Set per shell rather than with socket.setdefaulttimeout(), other shells may be in use by other threads
+                shell.winproto.transport.timeout = timeout or self.default_command_timeout
+                try:
+                    command_id = shell.winproto.run_command(shell.shell_id,
+                                                            command,
+                                                            arguments=arguments,
+                                                            console_mode_stdin=console_mode_stdin,
+                                                            skip_cmd_shell=skip_cmd_shell)
+                    break
+                except WinRMTransportError, wte:
+                    reused = shell.commands > 0
+                    self.release_shell(shell, discard=True)
+                    shell = None
+                    if attempt > 1 or not reused:
+                        raise
+                    self.debug('Failed to run command in kept winrm shell, recreating shell. Err:' + str(wte))
+            self.command_id = command_id
+            shell.commands += 1
             self.debug('winrm timeout:' + str(timeout) + ', cmd:' + str(orig_cmd))
             if timeout is not None:
-                sockdefault = socket.getdefaulttimeout()
-                socket.setdefaulttimeout(timeout)
-                stdout, stderr, statuscode = self.get_timed_command_output(self.shell_id, self.command_id, active_timeout=timeout)
+                stdout, stderr, statuscode = self.get_timed_command_output(shell.shell_id, command_id,
+                                                                           active_timeout=timeout,
+                                                                           winproto=shell.winproto)
             else:
-                stdout, stderr, statuscode = self.winproto.get_command_output(self.shell_id, self.command_id)
+                stdout, stderr, statuscode = shell.winproto.get_command_output(shell.shell_id, command_id)
             self.debug( 'Command:"' + str(orig_cmd) + '" , Done.')
         except WinRMTransportError as wte:
             errmsg = str(wte)
+            discard = True
         except CommandTimeoutException as cte:
             self.debug(str(cte))
             errmsg = 'timed out'
+            discard = True
+        except:
+            discard = True
+            raise
         finally:
-            try:
-                #self.winproto.transport.timeout = self.default_command_timeout
-                if timeout is not None:
-                    socket.setdefaulttimeout(sockdefault)
-                self.winproto.cleanup_command(self.shell_id, self.command_id)
-            except: pass
-            self.close_shell()
+            if shell:
+                try:
+                    shell.winproto.cleanup_command(shell.shell_id, command_id)
+                except: pass
+                self.release_shell(shell, discard=discard)
         if errmsg:
             if re.search('timed out', errmsg, re.IGNORECASE):
                 raise CommandTimeoutException('ERROR: Timed out after:' +
-                                              str(self.winproto.transport.timeout) +
+                                              str(timeout or self.default_command_timeout) +
                                               ', Cmd:"' + str(orig_cmd))
             else:
                 raise Exception(errmsg)
@@ -169,7 +292,7 @@ class Winrm_Connection:
 
 
 
-    def get_timed_command_output(self, shell_id, command_id, active_timeout=0):
+    def get_timed_command_output(self, shell_id, command_id, active_timeout=0, winproto=None):
         """
         Get the Output of the given shell and command
         @param string shell_id: The shell id on the remote machine.  See #open_shell
@@ -177,7 +300,9 @@ class Winrm_Connection:
         @param int active_timeout: Time out used during an active session. For example as the shell is actively returning
                                   data, but we want to timeout anyways. See cmd timeout for idle timeout where no
                                   data has been read.
+        @param winproto: protocol obj the shell was opened with, defaults to self.winproto
         """
+        winproto = winproto or self.winproto
         stdout_buffer, stderr_buffer = [], []
         command_done = False
         start = time.time()
@@ -186,15 +311,22 @@ class Winrm_Connection:
             if active_timeout and (elapsed > active_timeout):
                 raise CommandTimeoutException('Active timeout fired after:' + str(elapsed))
             stdout, stderr, return_code, command_done = \
-                self.winproto._raw_get_command_output(shell_id, command_id)
+                winproto._raw_get_command_output(shell_id, command_id)
             stdout_buffer.append(stdout)
             stderr_buffer.append(stderr)
         return ''.join(stdout_buffer), ''.join(stderr_buffer), return_code
 
 
     def close_shell(self):
-        if self.shell_id:
-            self.winproto.close_shell(self.shell_id)
+        """
+        Closes all idle shells. Shells in use by a running command are closed when the command completes.
+        """
+        with self.shell_lock:
+            self.shell_generation += 1
+            idle_shells = self.idle_shells
+            self.idle_shells = []
+        for shell in idle_shells:
+            self.delete_shell(shell)
         self.shell_id = None
 
     def sys(self, command, include_stderr=False, listformat=True, carriage_return=False, timeout=None, code=None, verbose=None):
@@ -234,6 +366,18 @@ class Winrm_Connection:
 
 
 
+class Winrm_Shell:
+    """
+    An open remote shell and the protocol obj it was opened with
+    """
+    def __init__(self, winproto, shell_id):
+        self.winproto = winproto
+        self.shell_id = shell_id
+        self.last_used = time.time()
+        self.commands = 0
+        self.generation = 0
+
+
 class CommandExitCodeException(Exception):
     def __init__(self, value):
         self.value = value
@@ -60,15 +60,13 @@ class GatherDebug(EutesterTestCase):
     def clean_method(self):
         pass
 
-    def run_command_list(self,machine, list):
-        for command in list:
-            machine.sys(command)
+    def run_command_list(self, component, list):
+        self.tester.run_fleet_command(list, component=component)
 
     def debug_clc(self, **kwargs):
         clc_commands = self.basic_commands + self.network_commands + self.euca_commands + self.clc_commands
-        for machine in self.tester.get_component_machines("clc"):
-            for command in clc_commands:
-                machine.sys("source " + self.tester.credpath + "/eucarc && " + command)
+        self.run_command_list("clc", ["source " + self.tester.credpath + "/eucarc && " + command
+                                      for command in clc_commands])
 
         for account in self.tester.get_all_accounts():
             account_name = next((value for key, value in account.iteritems() if 'account_name' in key), None)
@@ -91,23 +89,19 @@ class GatherDebug(EutesterTestCase):
 
     def debug_walrus(self, **kwargs):
         walrus_commands = self.basic_commands + self.network_commands + self.euca_commands
-        for machine in self.tester.get_component_machines("ws"):
-            self.run_command_list(machine,walrus_commands)
+        self.run_command_list("ws", walrus_commands)
 
     def debug_cc(self, **kwargs):
         cc_commands = self.basic_commands + self.network_commands + self.euca_commands
-        for machine in self.tester.get_component_machines("cc"):
-            self.run_command_list(machine,cc_commands)
+        self.run_command_list("cc", cc_commands)
 
     def debug_sc(self, **kwargs):
         sc_commands = self.basic_commands + self.network_commands + self.euca_commands + self.sc_commands
-        for machine in self.tester.get_component_machines("sc"):
-            self.run_command_list(machine,sc_commands)
+        self.run_command_list("sc", sc_commands)
 
     def debug_nc(self, **kwargs):
         nc_commands = self.basic_commands + self.network_commands + self.euca_commands + self.nc_commands
-        for machine in self.tester.get_component_machines("nc"):
-            self.run_command_list(machine,nc_commands)
+        self.run_command_list("nc", nc_commands)
 
     def cleanup(self):
         pass
@@ -28,16 +28,7 @@ class MyTestCase(EutesterTestCase):
         A test description must go here......
         This test will simply run an instance and check that it is reachable via ssh
         """
-        target_machines = []
-        if not self.args.component:
-            target_machines = self.tester.config['machines']
-        else:
-            target_machines = self.tester.get_component_machines(self.args.component)
-
-        for machine in target_machines:
-            if machine.distro.name is "vmware":
-                continue
-            machine.sys(self.args.command)
+        self.tester.run_fleet_command(self.args.command, component=self.args.component)
 
 if __name__ == "__main__":
     testcase = MyTestCase()
@@ -60,6 +60,10 @@ class Ebs_Persistance_Tests(EutesterTestCase):
                                  type=int,
                                  help='Time allowed for volume to transition from deleting to deleted, default:120',
                                  default=120)
+        self.parser.add_argument('--hashtree',
+                                 help='If set will record and verify a chunked hash tree of entire volumes',
+                                 action='store_true',
+                                 default=False)
         self.parser.add_argument('--no_clean_on_exit',
                                  help='If set will not attempt to remove created test artifacts after running',
                                  action='store_true',
@@ -205,6 +209,10 @@ class Ebs_Persistance_Tests(EutesterTestCase):
                             self.debug('Monitoring volume post VolumeStateException...')
                             vol.eutest_attached_status = None
                             self.tester.monitor_euvolumes_to_status([vol],status='in-use',attached_status='attached',timeout=60)
+        if self.args.hashtree:
+            for instance in self.instances:
+                for vol in instance.attached_vols:
+                    instance.get_euvolume_hash_tree(vol, timepergig=self.args.timepergig)
         self.status("\'pre_service_restart_attach_all_volumes\' done",
                         testcolor=TestColor.get_canned_color('whiteonblue'))
 
@@ -475,9 +483,14 @@ class Ebs_Persistance_Tests(EutesterTestCase):
                         errmsg += str(instance.id) +"Volume:" + str(vol.id) \
                                     + "has different md5 sum after service interruption. Before:'" \
                                     + str(md5before) + "' - vs - '" + str(md5now) + "'"
+                    if vol.hash_tree:
+                        instance.verify_euvolume_hash_tree(vol, timepergig=self.args.timepergig)
                     vol.length = write_length
                     instance.vol_write_random_data_get_md5(vol,length=write_length, overwrite=True)
                     instance.sys('sync',code=0)
+                    if self.args.hashtree:
+                        #record the tree of the new data for the snapshots taken later
+                        instance.get_euvolume_hash_tree(vol, timepergig=self.args.timepergig)
                 except Exception, e:
                     errmsg += str(instance.id) + "Volume:" + \
                               str(vol.id) + ", error while using vol post service interruption, err: "+str(e)
@@ -560,6 +573,9 @@ class Ebs_Persistance_Tests(EutesterTestCase):
                                     errmsg += "Volume:" + str(vol.id) + " MD5 did not match snapshots " \
                                               + str(snap.id) + ": snapmd5:" + str(snap.eutest_volume_md5) \
                                               + " --vs volmd5:-- " + str(vol.md5)
+                                if snap.eutest_volume_hash_tree:
+                                    instance.verify_euvolume_hash_tree(vol, hash_tree=snap.eutest_volume_hash_tree,
+                                                                       timepergig=self.args.timepergig)
                     except Exception, e:
                         errmsg += str(instance.id) +"Volume:" + str(vol.id) \
                               + " error when attaching and comparing md5, err:" + str(e)
@@ -47,6 +47,11 @@ class LoadBalancing(EutesterTestCase):
         if extra_args:
             for arg in extra_args:
                 self.parser.add_argument(arg)
+        self.parser.add_argument("--rps", type=int, default=None,
+                                 help="Target requests per second for the LoadTest, defaults to as fast as possible")
+        self.parser.add_argument("--duration", type=int, default=60, help="Seconds to run the LoadTest for")
+        self.parser.add_argument("--connections", type=int, default=50,
+                                 help="Number of keep-alive connections used by the LoadTest")
         self.get_args()
 
         # Setup basic eutester object
@@ -101,6 +106,25 @@ class LoadBalancing(EutesterTestCase):
         lb_url = "http://{0}:{1}/instance-name".format(lb_ip, self.load_balancer_port)
         self.tester.generate_http_requests(url=lb_url, count=1000)
 
+    def LoadTest(self):
+        """
+        Holds the target request rate against the load balancer for the configured duration and checks
+        that every request succeeded and that every backend instance served requests.
+        """
+        dns = self.tester.service_manager.get_enabled_dns()
+        lb_ip = dns.resolve(self.load_balancer.dns_name)
+        lb_url = "http://{0}:{1}/instance-name".format(lb_ip, self.load_balancer_port)
+        results = self.tester.generate_http_load(url=lb_url, rps=self.args.rps, duration=self.args.duration,
+                                                 connections=self.args.connections)
+        failed = results['errors'] + sum(count for status, count in results['status_codes'].iteritems()
+                                         if status != 200)
+        if failed:
+            raise Exception(str(failed) + " of " + str(results['requests']) + " requests failed, errors:" +
+                            str(results['error_types']) + " status codes:" + str(results['status_codes']))
+        if len(results['backends']) < len(self.web_servers.instances):
+            raise Exception("Expected requests to be served by " + str(len(self.web_servers.instances)) +
+                            " instances, got:" + str(results['backends']))
+
 if __name__ == "__main__":
     testcase = LoadBalancing()
     ### Use the list of tests passed from config/command line to determine what subset of tests to run
@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+#
+###########################################
+#                                         #
+#   objectstorage/S3 Benchmark Suite      #
+#                                         #
+###########################################
+'''
+Sweeps object sizes and concurrency levels across PUT, GET, ranged GET, LIST and DELETE against an
+objectstorage/S3 endpoint and records per operation latency percentiles (p50/p95/p99), a coarse latency
+histogram and aggregate MB/s and ops/s.
+
+Results are written as JSON (default) or CSV so runs against different backends (Walrus, OSG/Riak-CS)
+and releases can be compared. Each result row is one operation at one object size and concurrency level.
+
+example usage:
+    object_benchmark.py --config 2b_tested.lst --password foobar --sizes 1024,1048576,16777216 \
+        --concurrency 1,8,32 --count 200 --label walrus-3.4 --output walrus-3.4.json
+'''
+import csv
+import json
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from eucaops import Eucaops
+from eucaops import S3ops
+from eutester.eutestcase import EutesterTestCase
+from boto.s3.key import Key
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return 0
+    index = int(round((pct / 100.0) * (len(values) - 1)))
+    return values[index]
+
+
+def latency_histogram(latencies_ms):
+    '''
+    Returns an ordered list of (bucket, count) tuples counting latencies under power of two millisecond
+    boundaries, ie [('<=1ms', n), ('<=2ms', n) ... ('>65536ms', n)]. Buckets above the largest latency are omitted.
+    '''
+    histogram = []
+    bound = 1
+    remaining = sorted(latencies_ms)
+    while remaining and bound <= 65536:
+        count = 0
+        while count < len(remaining) and remaining[count] <= bound:
+            count += 1
+        histogram.append(('<=' + str(bound) + 'ms', count))
+        remaining = remaining[count:]
+        bound *= 2
+    if remaining:
+        histogram.append(('>' + str(bound / 2) + 'ms', len(remaining)))
+    return histogram
+
+
+class ObjectBenchmark(EutesterTestCase):
+    result_fields = ['label', 'operation', 'object_size', 'concurrency', 'ops', 'errors', 'elapsed_sec',
+                     'ops_per_sec', 'mb_per_sec', 'latency_avg_ms', 'latency_p50_ms', 'latency_p95_ms',
+                     'latency_p99_ms', 'latency_max_ms']
+
+    def __init__(self):
+        self.setuptestcase()
+        self.setup_parser()
+        self.parser.add_argument("--s3endpoint", default=None)
+        self.parser.add_argument("--sizes", default="1024,65536,1048576,8388608",
+                                 help="Comma separated list of object sizes in bytes")
+        self.parser.add_argument("--concurrency", default="1,4,16",
+                                 help="Comma separated list of concurrency levels")
+        self.parser.add_argument("--count", type=int, default=100,
+                                 help="Number of objects/operations per size and concurrency level")
+        self.parser.add_argument("--range-size", dest="range_size", type=int, default=65536,
+                                 help="Number of bytes requested by each ranged GET")
+        self.parser.add_argument("--list-page", dest="list_page", type=int, default=1000,
+                                 help="max-keys requested by each LIST")
+        self.parser.add_argument("--label", default=None,
+                                 help="Label stored with each result, ie backend and release under test")
+        self.parser.add_argument("--output", default=None,
+                                 help="File results are written to, defaults to s3-benchmark-<time>.<format>")
+        self.parser.add_argument("--format", default=None, choices=['json', 'csv'],
+                                 help="Output format, defaults to the --output extension or json")
+        self.get_args()
+        # Setup basic eutester object
+        if self.args.s3endpoint:
+            self.tester = S3ops(credpath=self.args.credpath, endpoint=self.args.s3endpoint)
+        else:
+            self.tester = Eucaops(credpath=self.args.credpath, config_file=self.args.config,
+                                  password=self.args.password)
+        self.start = time.time()
+        self.sizes = [int(x) for x in str(self.args.sizes).split(',') if x.strip()]
+        self.concurrency_levels = [int(x) for x in str(self.args.concurrency).split(',') if x.strip()]
+        self.label = self.args.label or self.tester.s3.host
+        self.output_format = self.args.format
+        if not self.output_format:
+            if self.args.output and self.args.output.lower().endswith('.csv'):
+                self.output_format = 'csv'
+            else:
+                self.output_format = 'json'
+        self.output = self.args.output or 's3-benchmark-' + str(int(self.start)) + '.' + self.output_format
+        self.results = []
+        self.bucket_name = "benchmark-" + str(int(self.start))
+        self.bucket = self.tester.create_bucket(self.bucket_name)
+
+    def clean_method(self):
+        self.tester.clear_bucket(self.bucket)
+
+    def run_operation(self, operation, func, items, concurrency, object_size=0):
+        '''
+        Runs func(item) for each item using 'concurrency' threads, timing every call.
+        'func' returns the number of payload bytes transferred by the call. Failed calls are counted as
+        errors and excluded from the latencies and throughput.
+        Returns a result dict which is also appended to self.results.
+        '''
+        def timed(item):
+            start = time.time()
+            transferred = func(item)
+            return time.time() - start, transferred
+
+        latencies = []
+        transferred = 0
+        errors = 0
+        start = time.time()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = [executor.submit(timed, item) for item in items]
+            for future in futures:
+                try:
+                    latency, size = future.result()
+                    latencies.append(latency * 1000)
+                    transferred += size
+                except Exception, e:
+                    errors += 1
+                    self.debug(operation + ' failed: ' + str(e))
+        elapsed = time.time() - start
+        result = {'label': self.label,
+                  'operation': operation,
+                  'object_size': object_size,
+                  'concurrency': concurrency,
+                  'ops': len(latencies),
+                  'errors': errors,
+                  'elapsed_sec': round(elapsed, 4),
+                  'ops_per_sec': round(len(latencies) / elapsed, 2) if elapsed else 0,
+                  'mb_per_sec': round((transferred / 1048576.0) / elapsed, 3) if elapsed else 0,
+                  'latency_avg_ms': round(sum(latencies) / len(latencies), 3) if latencies else 0,
+                  'latency_p50_ms': round(percentile(latencies, 50), 3),
+                  'latency_p95_ms': round(percentile(latencies, 95), 3),
+                  'latency_p99_ms': round(percentile(latencies, 99), 3),
+                  'latency_max_ms': round(max(latencies), 3) if latencies else 0,
+                  'latency_histogram': latency_histogram(latencies)}
+        self.results.append(result)
+        self.status(operation.ljust(10) + ' size:' + str(object_size) + ' concurrency:' + str(concurrency) +
+                    ' ops:' + str(result['ops']) + ' errors:' + str(errors) +
+                    ' ' + "%.2f" % result['ops_per_sec'] + 'ops/s ' + "%.3f" % result['mb_per_sec'] + 'MB/s' +
+                    ' p50:' + "%.2f" % result['latency_p50_ms'] + 'ms' +
+                    ' p95:' + "%.2f" % result['latency_p95_ms'] + 'ms' +
+                    ' p99:' + "%.2f" % result['latency_p99_ms'] + 'ms')
+        return result
+
+    def benchmark_level(self, size, concurrency):
+        '''
+        Runs PUT, GET, ranged GET, LIST and DELETE of self.args.count objects of 'size' bytes
+        at the given concurrency level. Objects are written under a prefix unique to this level.
+        Requests are made directly on the boto bucket so only the request itself is timed.
+        '''
+        prefix = 'bench/' + str(size) + '/' + str(concurrency) + '/'
+        key_names = [prefix + 'obj-' + str(x) for x in xrange(self.args.count)]
+        payload = os.urandom(size)
+        range_size = min(self.args.range_size, size)
+
+        def put(name):
+            Key(bucket=self.bucket, name=name).set_contents_from_string(payload)
+            return size
+
+        def get(name):
+            data = Key(bucket=self.bucket, name=name).get_contents_as_string()
+            if len(data) != size:
+                raise Exception('GET ' + name + ' returned ' + str(len(data)) + ' bytes, expected ' + str(size))
+            return len(data)
+
+        def get_range(name):
+            start = random.randint(0, size - range_size)
+            headers = {'Range': 'bytes=' + str(start) + '-' + str(start + range_size - 1)}
+            data = Key(bucket=self.bucket, name=name).get_contents_as_string(headers=headers)
+            if len(data) != range_size:
+                raise Exception('Ranged GET ' + name + ' returned ' + str(len(data)) + ' bytes, expected ' +
+                                str(range_size))
+            return len(data)
+
+        def list_keys(x):
+            keys = self.bucket.get_all_keys(prefix=prefix, max_keys=self.args.list_page)
+            if not keys:
+                raise Exception('LIST of prefix ' + prefix + ' returned no keys')
+            return 0
+
+        def delete(name):
+            self.bucket.delete_key(name)
+            return 0
+
+        self.run_operation('PUT', put, key_names, concurrency, size)
+        self.run_operation('GET', get, key_names, concurrency, size)
+        if size:
+            self.run_operation('RANGED_GET', get_range, key_names, concurrency, range_size)
+        self.run_operation('LIST', list_keys, xrange(self.args.count), concurrency, size)
+        self.run_operation('DELETE', delete, key_names, concurrency, size)
+
+    def write_results(self, path=None, output_format=None):
+        '''
+        Writes self.results to 'path' as json (with the run's parameters) or csv (one row per result,
+        without the histogram).
+        '''
+        path = path or self.output
+        output_format = output_format or self.output_format
+        with open(path, 'w') as outfile:
+            if output_format == 'csv':
+                writer = csv.DictWriter(outfile, fieldnames=self.result_fields, extrasaction='ignore')
+                #DictWriter.writeheader() is not available on python 2.6
+                writer.writerow(dict(zip(self.result_fields, self.result_fields)))
+                for result in self.results:
+                    writer.writerow(result)
+            else:
+                json.dump({'label': self.label,
+                           'endpoint': self.tester.s3.host,
+                           'started': int(self.start),
+                           'sizes': self.sizes,
+                           'concurrency': self.concurrency_levels,
+                           'count': self.args.count,
+                           'range_size': self.args.range_size,
+                           'results': self.results}, outfile, indent=2)
+        self.status('Wrote ' + str(len(self.results)) + ' benchmark results to:' + str(path))
+        return path
+
+    def BenchmarkSweep(self):
+        '''
+        Runs every operation for each object size and concurrency level, then writes the results
+        '''
+        try:
+            for size in self.sizes:
+                for concurrency in self.concurrency_levels:
+                    self.benchmark_level(size, concurrency)
+        finally:
+            if self.results:
+                self.write_results()
+        errors = sum(result['errors'] for result in self.results)
+        if errors:
+            raise Exception(str(errors) + ' benchmark operations failed, see results in:' + str(self.output))
+
+
+if __name__ == "__main__":
+    testcase = ObjectBenchmark()
+    ### Use the list of tests passed from config/command line to determine what subset of tests to run
+    ### or use a predefined list
+    list = testcase.args.tests or ["BenchmarkSweep"]
+
+    ### Convert test suite methods to EutesterUnitTest objects
+    unit_list = [ ]
+    for test in list:
+        unit_list.append( testcase.create_testunit_by_name(test) )
+
+    ### Run the EutesterUnitTest objects
+    result = testcase.run_test_case_list(unit_list)
+    exit(result)
@@ -11,6 +11,7 @@
 #Author: Zach Hill <zach@eucalyptus.com>
 #Author: Vic Iglesias <vic@eucalyptus.com>
 
+import os
 import time
 import random
 
@@ -307,6 +308,10 @@ class ObjectTestSuite(EutesterTestCase):
             self.fail("Fetched data and generated data don't match")
         else:
             self.tester.info("Data matches!")
+
+        self.tester.info("Fetching object with concurrent ranged GETs")
+        if self.tester.download_object(self.test_bucket_name, keyname, part_size=1024 * 1024) != test_data:
+            self.fail("Data fetched with ranged GETs and generated data don't match")
         
         self.tester.info("Removing large object")
         self.test_bucket.delete_key(ret_key)
@@ -314,8 +319,25 @@ class ObjectTestSuite(EutesterTestCase):
         pass
             
     def test_object_multipart(self):
-        """Test the multipart upload interface"""
-        self.fail("Feature not implemented")
+        """Test the multipart upload interface with concurrent part uploads and ranged GETs"""
+        self.tester.info("Testing multipart upload on bucket" + self.test_bucket_name)
+        self.test_bucket = self.clear_and_rebuild_bucket(self.test_bucket_name)
+        part_size = 5 * 1024 * 1024 #5MB, the minimum size of all but the last part
+        test_data = os.urandom(3 * part_size + 1024)
+        keyname = "multipartobj-" + str(int(time.time()))
+        self.tester.info("Uploading object content of size: " + str(len(test_data)) + " bytes in 4 parts")
+        key = self.tester.upload_object_multipart(self.test_bucket_name, keyname, contents=test_data,
+                                                  part_size=part_size, workers=4)
+        if key.size != len(test_data):
+            self.fail("Uploaded object size:" + str(key.size) + " != " + str(len(test_data)))
+        self.tester.info("Fetching object with concurrent ranged GETs")
+        ret_data = self.tester.download_object(self.test_bucket_name, keyname, part_size=part_size / 2,
+                                               md5=key.eutest_md5)
+        if ret_data != test_data:
+            self.fail("Fetched data and uploaded data don't match")
+        self.tester.info("Removing multipart object")
+        self.test_bucket.delete_key(keyname)
+        self.tester.info("Complete multipart test")
         
     def test_object_versioning_enabled(self):
         """Tests object versioning for get/put/delete on a versioned bucket"""
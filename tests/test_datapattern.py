@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2009-2011, Eucalyptus Systems, Inc.
+# All rights reserved.
+#
+# Redistribution and use of this software in source and binary forms, with or
+# without modification, are permitted provided that the following conditions
+# are met:
+#
+#   Redistributions of source code must retain the above
+#   copyright notice, this list of conditions and the
+#   following disclaimer.
+#
+#   Redistributions in binary form must reproduce the above
+#   copyright notice, this list of conditions and the
+#   following disclaimer in the documentation and/or other
+#   materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+import hashlib
+import unittest
+from eutester.datapattern import DataPattern
+
+
+class DataPatternTest(unittest.TestCase):
+    def setUp(self):
+        #A small block size keeps ranges spanning several blocks cheap to generate
+        self.block_size = 1000
+        self.pattern = DataPattern('vol-12345678', block_size=self.block_size)
+        self.data = "".join([self.pattern.get_block(x) for x in xrange(5)])
+
+    def test_blocks(self):
+        self.assertEqual(len(self.pattern.get_block(0)), self.block_size)
+        self.assertNotEqual(self.pattern.get_block(0), self.pattern.get_block(1))
+        self.assertEqual(self.pattern.get_block(3),
+                         DataPattern('vol-12345678', block_size=self.block_size).get_block(3))
+        self.assertNotEqual(self.pattern.get_block(0), DataPattern('vol-87654321', self.block_size).get_block(0))
+
+    def test_get_range(self):
+        for offset, length in [(0, 1000), (0, 1), (999, 2), (250, 3500), (1000, 2000), (4321, 679), (10, 0)]:
+            self.assertEqual(self.pattern.get_range(offset, length), self.data[offset:offset + length])
+
+    def test_md5_range_unaligned(self):
+        for offset, length in [(1, 10), (123, 456), (999, 1), (333, 667)]:
+            self.assertEqual(self.pattern.md5_range(offset, length),
+                             hashlib.md5(self.data[offset:offset + length]).hexdigest())
+
+    def test_md5_range_across_blocks(self):
+        for offset, length in [(0, 5000), (999, 2), (500, 1000), (1000, 3000), (1234, 3456)]:
+            self.assertEqual(self.pattern.md5_range(offset, length),
+                             hashlib.md5(self.data[offset:offset + length]).hexdigest())
+
+    def test_md5_range_empty(self):
+        self.assertEqual(self.pattern.md5_range(100, 0), hashlib.md5('').hexdigest())
+
+    def test_invalid_seed(self):
+        self.assertRaises(Exception, DataPattern, '')
+        self.assertRaises(Exception, DataPattern, "vol-1234'5678")
+        self.assertRaises(Exception, DataPattern, 'vol 12345678')
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2009-2011, Eucalyptus Systems, Inc.
+# All rights reserved.
+#
+# Redistribution and use of this software in source and binary forms, with or
+# without modification, are permitted provided that the following conditions
+# are met:
+#
+#   Redistributions of source code must retain the above
+#   copyright notice, this list of conditions and the
+#   following disclaimer.
+#
+#   Redistributions in binary form must reproduce the above
+#   copyright notice, this list of conditions and the
+#   following disclaimer in the documentation and/or other
+#   materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+import hashlib
+import unittest
+from eutester.hashtree import HashTree
+
+
+def md5(data):
+    return hashlib.md5(data).hexdigest()
+
+
+class HashTreeTest(unittest.TestCase):
+    def setUp(self):
+        #7 chunks of 4 bytes and a short final chunk of 2 bytes
+        self.chunk_size = 4
+        self.data = 'abcdefghijklmnopqrstuvwxyz0123'
+        self.tree = self.make_tree(self.data)
+
+    def make_tree(self, data):
+        leaves = [md5(data[x:x + self.chunk_size]) for x in xrange(0, len(data), self.chunk_size)]
+        return HashTree(leaves, self.chunk_size, len(data))
+
+    def change(self, *offsets):
+        data = self.data
+        for offset in offsets:
+            data = data[:offset] + '!' + data[offset + 1:]
+        return data
+
+    def test_equal(self):
+        other = self.make_tree(self.data)
+        self.assertEqual(self.tree, other)
+        self.assertFalse(self.tree != other)
+        self.assertEqual(self.tree.root, other.root)
+        self.assertEqual(self.tree.diff(other), [])
+
+    def test_not_equal(self):
+        self.assertNotEqual(self.tree, self.make_tree(self.change(5)))
+        self.assertNotEqual(self.tree, HashTree(self.tree.leaves, self.chunk_size, len(self.data) - 1))
+        self.assertNotEqual(self.tree, None)
+
+    def test_root(self):
+        leaves = [md5('a'), md5('b'), md5('c')]
+        tree = HashTree(leaves, 1, 3)
+        self.assertEqual(tree.root, md5(md5(leaves[0] + leaves[1]) + leaves[2]))
+        self.assertEqual(HashTree([], 4, 0).root, md5(''))
+
+    def test_diff(self):
+        for offsets, chunks in [([0], [0]), ([13], [3]), ([1, 2, 27], [0, 6]), ([29], [7]),
+                                ([3, 9, 17, 21, 29], [0, 2, 4, 5, 7])]:
+            other = self.make_tree(self.change(*offsets))
+            self.assertEqual(self.tree.diff(other), chunks)
+            self.assertEqual(other.diff(self.tree), chunks)
+
+    def test_diff_mismatched(self):
+        self.assertRaises(Exception, self.tree.diff, self.make_tree(self.data[:-1]))
+
+    def test_chunk_ranges(self):
+        self.assertEqual(self.tree.get_chunk_ranges([0, 3]), [(0, 4), (12, 4)])
+        #The final chunk is shorter than chunk_size
+        self.assertEqual(self.tree.get_chunk_ranges([7]), [(28, 2)])
+        self.assertEqual(self.tree.get_chunk_ranges(self.tree.diff(self.make_tree(self.change(29)))), [(28, 2)])
+
+    def test_leaf_count(self):
+        self.assertRaises(Exception, HashTree, self.tree.leaves[:-1], self.chunk_size, len(self.data))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,138 @@
+#!/usr/bin/python
+"""
+Measures SshConnection.cmd() performance against a local paramiko test server.
+
+Reports per-command round trip latency for short commands, and MB/s for commands
+producing large outputs. The test server runs commands locally with subprocess, so no
+remote host, sshd or keys are required.
+
+example usage:
+    python ssh_benchmark.py --count 200 --size 64
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import paramiko
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from eutester.sshconnection import SshConnection
+
+
+class BenchmarkServer(paramiko.ServerInterface):
+    """
+    Minimal paramiko server interface which accepts any password, and runs exec requests locally.
+    """
+    def __init__(self):
+        self.event = threading.Event()
+
+    def check_channel_request(self, kind, chanid):
+        if kind == 'session':
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_auth_password(self, username, password):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def get_allowed_auths(self, username):
+        return 'password'
+
+    def check_channel_pty_request(self, channel, term, width, height, pixelwidth, pixelheight, modes):
+        return True
+
+    def check_channel_exec_request(self, channel, command):
+        thread = threading.Thread(target=self.run_command, args=(channel, command))
+        thread.daemon = True
+        thread.start()
+        return True
+
+    def run_command(self, channel, command):
+        process = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        while True:
+            data = process.stdout.read(32768)
+            if not data:
+                break
+            channel.sendall(data)
+        channel.send_exit_status(process.wait())
+        channel.close()
+
+
+def start_server(host='127.0.0.1'):
+    """
+    Starts a listening socket and a thread accepting ssh transports on it.
+    :return: port the server is listening on
+    """
+    host_key = paramiko.RSAKey.generate(1024)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, 0))
+    sock.listen(10)
+
+    def accept_loop():
+        while True:
+            client, addr = sock.accept()
+            transport = paramiko.Transport(client)
+            transport.add_server_key(host_key)
+            transport.start_server(server=BenchmarkServer())
+
+    thread = threading.Thread(target=accept_loop)
+    thread.daemon = True
+    thread.start()
+    return sock.getsockname()[1]
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return 0
+    index = int(round((pct / 100.0) * (len(values) - 1)))
+    return values[index]
+
+
+def bench_latency(ssh, count, command='true'):
+    times = []
+    for x in xrange(count):
+        start = time.time()
+        out = ssh.cmd(command, verbose=False)
+        times.append(time.time() - start)
+        if out['status'] != 0:
+            raise Exception('Command:"' + str(command) + '" failed with status:' + str(out['status']))
+    print 'Latency for ' + str(count) + ' x "' + command + '":'
+    print '    avg:' + "%.2f" % (1000 * sum(times) / len(times)) + 'ms' + \
+          ', p50:' + "%.2f" % (1000 * percentile(times, 50)) + 'ms' + \
+          ', p95:' + "%.2f" % (1000 * percentile(times, 95)) + 'ms' + \
+          ', max:' + "%.2f" % (1000 * max(times)) + 'ms'
+
+
+def bench_throughput(ssh, size_mb, runs):
+    command = 'head -c ' + str(size_mb * 1024 * 1024) + ' /dev/zero'
+    rates = []
+    for x in xrange(runs):
+        start = time.time()
+        out = ssh.cmd(command, verbose=False, get_pty=False)
+        elapsed = time.time() - start
+        received = len(out['output'])
+        if received != size_mb * 1024 * 1024:
+            raise Exception('Expected ' + str(size_mb) + 'MB of output, got ' + str(received) + ' bytes')
+        rates.append(size_mb / elapsed)
+    print 'Throughput for ' + str(runs) + ' x ' + str(size_mb) + 'MB output:'
+    print '    avg:' + "%.2f" % (sum(rates) / len(rates)) + 'MB/s' + \
+          ', min:' + "%.2f" % min(rates) + 'MB/s' + \
+          ', max:' + "%.2f" % max(rates) + 'MB/s'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark SshConnection.cmd() against a local paramiko server')
+    parser.add_argument('--count', type=int, default=100, help='Number of short commands to time')
+    parser.add_argument('--size', type=int, default=32, help='Size in MB of the large output command')
+    parser.add_argument('--runs', type=int, default=3, help='Number of large output commands to time')
+    args = parser.parse_args()
+    port = start_server()
+    ssh = SshConnection('127.0.0.1', port=port, username='benchmark', password='benchmark',
+                        find_keys=False, verbose=False)
+    bench_latency(ssh, args.count)
+    bench_throughput(ssh, args.size, args.runs)
+    ssh.close()
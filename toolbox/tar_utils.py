@@ -7,9 +7,16 @@ import sys
 import time
 import commands
 import tarfile
-import urllib2
+import urlparse
+import httplib
+import socket
+import threading
+import hashlib
+import base64
+import json
 import cStringIO
 import errno
+from concurrent.futures import ThreadPoolExecutor
     
 class Tarutils():
     '''
@@ -167,49 +174,202 @@ class Local_Tarutils(Tarutils):
 class Http_Tarutils(Tarutils):
     '''
     Utility class for navigating and operating on remote tarfiles via http
+    Requests are sent over persistent (keep-alive) connections, one per thread. Tar headers are read in
+    'readahead' sized windows so a single request parses the headers of many small members, and the member
+    index of each tarball is cached on disk in 'cache_dir', keyed by url and ETag/Content-Length, so listing
+    an unchanged tarball again does not read its headers.
     '''
-    def get_members(self, url = None, headersize=None, mode=None):
+    def __init__(self, uri, headersize=512, printmethod=None, verbose=True, readahead=1048576, cache_dir=None,
+                 use_cache=True, timeout=60):
+        self.readahead = readahead
+        self.cache_dir = cache_dir or os.path.join(os.path.expanduser('~'), '.eutester', 'tar_index_cache')
+        self.use_cache = use_cache
+        self.timeout = timeout
+        self.etag = None
+        self.last_modified = None
+        self.connections = threading.local()
+        Tarutils.__init__(self, uri, headersize=headersize, printmethod=printmethod, verbose=verbose)
+
+    def get_connection(self, url=None, reset=False):
+        '''
+        Returns this thread's persistent http connection for the host of 'url', creating it if needed
+        url - optional - remote http address
+        reset - optional - boolean, close any existing connection and create a new one
+        '''
+        url = url or self.uri
+        parsed = urlparse.urlparse(url)
+        key = (parsed.scheme, parsed.netloc)
+        connection = getattr(self.connections, 'connection', None)
+        if reset or connection is None or self.connections.key != key:
+            self.close()
+            if parsed.scheme == 'https':
+                connection = httplib.HTTPSConnection(parsed.netloc, timeout=self.timeout)
+            else:
+                connection = httplib.HTTPConnection(parsed.netloc, timeout=self.timeout)
+            self.connections.connection = connection
+            self.connections.key = key
+        return connection
+
+    def http_request(self, url=None, method='GET', headers=None, retries=1, redirects=5):
+        '''
+        Sends a request over this thread's persistent connection and returns the httplib response. The
+        response must be read completely before the next request on this thread. A request failing on a
+        reused connection (ie: closed by the server while idle) is retried on a new connection.
+        url - optional - remote http address
+        method - optional - http method
+        headers - optional - dict of request headers
+        retries - optional - number of times to retry on a new connection
+        redirects - optional - max number of redirects to follow
+        '''
+        url = url or self.uri
+        parsed = urlparse.urlparse(url)
+        path = parsed.path or '/'
+        if parsed.query:
+            path += '?' + parsed.query
+        response = None
+        for attempt in xrange(0, retries + 1):
+            connection = self.get_connection(url, reset=bool(attempt))
+            try:
+                connection.request(method, path, headers=headers or {})
+                response = connection.getresponse()
+                break
+            except (httplib.HTTPException, socket.error), e:
+                if attempt >= retries:
+                    raise
+                self.debug('Retrying ' + str(method) + ' ' + str(url) + ' on new connection after err:' + str(e))
+        if response.status in [301, 302, 303, 307] and redirects:
+            response.read()
+            location = urlparse.urljoin(url, response.getheader('Location'))
+            self.debug('Following redirect to:' + str(location))
+            return self.http_request(location, method=method, headers=headers, retries=retries,
+                                     redirects=redirects - 1)
+        if response.status >= 300:
+            response.read()
+            raise Exception(str(method) + ' ' + str(url) + ' failed, status:' + str(response.status) + ' ' +
+                            str(response.reason))
+        return response
+
+    def get_index_cache_path(self, url=None, headersize=None):
+        '''
+        Returns the path of the member index cache file for this tarball, or None if the remote file provides
+        neither an ETag nor a size to validate the cache with.
+        '''
+        url = url or self.uri
+        headersize = headersize or self.headersize
+        if not self.etag and not self.filesize:
+            return None
+        key = "|".join([str(url), str(self.etag), str(self.last_modified), str(self.filesize), str(headersize)])
+        return os.path.join(self.cache_dir, hashlib.md5(key).hexdigest() + '.json')
+
+    def load_member_index(self, url=None, headersize=None):
+        '''
+        Returns the list of cached Tarinfo member objects for this tarball, or None if not cached
+        '''
+        path = self.get_index_cache_path(url, headersize)
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            with open(path) as cachefile:
+                index = json.load(cachefile)
+            headersize = headersize or self.headersize
+            members = []
+            for offset, header in index['members']:
+                member = tarfile.TarInfo.frombuf(base64.b64decode(header))
+                member.offset = offset
+                member.offset_data = offset + headersize
+                members.append(member)
+            self.debug('Loaded ' + str(len(members)) + ' members from index cache:' + str(path))
+            return members
+        except Exception, e:
+            self.debug('Ignoring unreadable index cache:' + str(path) + ', err:' + str(e))
+            return None
+
+    def save_member_index(self, members, headers, url=None, headersize=None):
+        '''
+        Writes the raw headers of 'members' to this tarball's index cache file
+        members - mandatory - list of Tarinfo member objects
+        headers - mandatory - list of the raw header buffers of each member
+        '''
+        path = self.get_index_cache_path(url, headersize)
+        if not path:
+            return
+        try:
+            self.make_path(path)
+            index = {'url': url or self.uri,
+                     'etag': self.etag,
+                     'filesize': self.filesize,
+                     'members': [[member.offset, base64.b64encode(header)]
+                                 for member, header in zip(members, headers)]}
+            tmppath = path + '.' + str(os.getpid())
+            with open(tmppath, 'w') as cachefile:
+                json.dump(index, cachefile)
+            os.rename(tmppath, path)
+        except Exception, e:
+            self.debug('Failed to write index cache:' + str(path) + ', err:' + str(e))
+
+    def get_members(self, url = None, headersize=None, mode=None, use_cache=None):
         '''
         Attempts to step through all tarball headers and gather the members/file info contained within.
+        Headers are read in self.readahead sized windows, and the result is cached on disk, see
+        load_member_index().
         Will update self.members with the returned list of members.
         url - optional - remote http address of tarball
         headersize - optional - tar header size to be used
         mode - optional - the file format string used for read the file (ie gzip'd or not)
+        use_cache - optional - boolean, use the on disk member index cache. Defaults to self.use_cache
         returns a list of Tarinfo member objects
         '''
         headersize = headersize or self.headersize
         mode = mode or self.fileformat
         url = url or self.uri
+        if use_cache is None:
+            use_cache = self.use_cache
         filesize = self.filesize or self.get_file_size(url)
+        if use_cache:
+            members = self.load_member_index(url, headersize)
+            if members is not None:
+                self.members = members
+                return members
+        readahead = max(int(self.readahead or headersize), headersize)
         start = 0
-        headers=[]
-        end = 0 
-        self.debug("get_members for url:"+str(url)+", headersize:"+str(headersize)+", filesize:"+str(filesize))
+        members = []
+        headers = []
+        end = 0
+        window = ''
+        window_start = 0
+        self.debug("get_members for url:"+str(url)+", headersize:"+str(headersize)+", filesize:"+str(filesize) +
+                   ", readahead:" + str(readahead))
         while (start+headersize) <= filesize and end < 2:
-            data = self.download_http_offset(url, start=start, offset=headersize)
-            if not len(data.getvalue().replace('\x00','')):
+            if start < window_start or (start + headersize) > (window_start + len(window)):
+                #header is outside of the current window, read the next window starting at this header
+                window_start = start
+                window = self.download_http_offset(url, start=start, offset=min(readahead, filesize - start),
+                                                   filesize=filesize).getvalue()
+            header = window[start - window_start:start - window_start + headersize]
+            if not len(header.replace('\x00','')):
                 #End of Tar markers are 2 consecutive zero filled 512byte buffers
                 self.debug('Got empty header, count:'+str(end))
                 end += 1
                 start += headersize
             else:
                 end = 0
-                #print 'got data:'+str(data.read())
-                data.seek(0)
                 #get tar member info from this header
-                member = tarfile.TarInfo.frombuf(data.getvalue())
+                member = tarfile.TarInfo.frombuf(header)
                 member.offset = start
                 member.offset_data = start + headersize
                 #append tar header/member to the list
                 self.debug("Got header:"+member.name)
-                headers.append(member)
+                members.append(member)
+                headers.append(header)
                 #move start point forward by the size of the file and header info. 
-                start = headersize + member.size
+                start += headersize + member.size
             #must end in an increment of headersize 512 ...or maybe tarfile.fileobject.blocksize ie:1024? 
             if start%headersize != 0:
                 start = ((start/headersize)+1)*headersize
-        self.members = headers
-        return headers
+        if use_cache:
+            self.save_member_index(members, headers, url, headersize)
+        self.members = members
+        return members
             
     def get_member(self, memberpath):
         '''
@@ -255,7 +415,7 @@ class Http_Tarutils(Tarutils):
         filesize = filesize or self.filesize
         freespace = self.get_freespace(destpath)
         if member.size > freespace:
-            raise Exception(str(memberpath)+":"+str(member.size)+" exceeds destpath freespace:"+(destpath)+":"+str(freespace) )
+            raise Exception(str(member.name)+":"+str(member.size)+" exceeds destpath freespace:"+(destpath)+":"+str(freespace) )
         start = member.offset_data
         offset = member.size
         destfile=str(destpath).rstrip('/')+'/'+str(member.name)
@@ -263,26 +423,149 @@ class Http_Tarutils(Tarutils):
         self.debug('Extracted member: '+str(member.name)+' to file: '+str(file.name))
         return file
     
-    def extract_all(self, memberlist=None,destpath=''):
+    def extract_all(self, memberlist=None,destpath='', workers=4, segment_size=67108864, max_bytes_per_sec=None,
+                    retries=3):
         '''
         Attempts to extract all members from list to local destination at 'destpath'
         Attempts to guesstimate the the size needed and check available space at destpath before extracting
+        Members are downloaded concurrently, see extract_all_parallel()
         memberlist - optional - list of tarinfo member objects
         destpath - optional - local destination to download/extract to
         '''
-        list = memberlist or self.members
+        return self.extract_all_parallel(memberlist=memberlist, destpath=destpath, workers=workers,
+                                         segment_size=segment_size, max_bytes_per_sec=max_bytes_per_sec,
+                                         retries=retries)
+
+    def extract_all_parallel(self, memberlist=None, destpath='.', workers=4, segment_size=67108864,
+                             max_bytes_per_sec=None, retries=3, readsize=None):
+        '''
+        Extracts members to local destination at 'destpath' using concurrent http range requests.
+        Members larger than segment_size are split into segments which are downloaded concurrently and written
+        into the preallocated destination file at their offsets, so several members and several segments of a
+        large member are in flight at once. Each worker uses its own persistent connection, so 'workers' also
+        caps the number of connections to the server. A failed segment is retried on a new connection.
+        memberlist - optional - list of tarinfo member objects
+        destpath - optional - local destination to download/extract to
+        workers - optional - number of concurrent segment downloads/connections
+        segment_size - optional - max bytes per range request
+        max_bytes_per_sec - optional - total bandwidth cap across all workers
+        retries - optional - number of times a failed segment is retried
+        readsize - optional - the incremental read size used when reading from http
+        returns list of extracted file paths
+        '''
+        members = memberlist or self.members
+        destpath = destpath or '.'
         size = 0
-        for member in list:
+        for member in members:
             size += int(member.size)
         freespace = self.get_freespace(destpath)
         if size > freespace:
             raise Exception("Extract_all size:"+str(size)+" exceeds destpath freespace:"+(destpath)+":"+str(freespace) )
-        for member in self.members:
-            file = self.extract_member_obj(member, destpath=destpath)
-            if not file.closed:
-                file.close()
+        segment_size = int(segment_size)
+        limiter = None
+        if max_bytes_per_sec:
+            limiter = Bandwidth_Limiter(max_bytes_per_sec)
+        segments = []
+        files = []
+        for member in members:
+            destfile = str(destpath).rstrip('/') + '/' + str(member.name)
+            if member.isdir():
+                self.make_path(destfile.rstrip('/') + '/')
+                continue
+            if not member.isfile():
+                self.debug('Skipping non regular file member:' + str(member.name))
+                continue
+            #Preallocate the destination file so segments can be written at their offsets in any order
+            destfile = self.make_path(destfile)
+            with open(destfile, 'wb') as dfile:
+                dfile.truncate(member.size)
+            files.append(destfile)
+            for offset in xrange(0, member.size, segment_size):
+                segments.append((member, destfile, offset, min(segment_size, member.size - offset)))
+        start = time.time()
+        self.debug('Extracting ' + str(len(files)) + ' members, ' + str(size) + ' bytes in ' + str(len(segments)) +
+                   ' segments using ' + str(workers) + ' workers...')
+        errors = []
+        executor = ThreadPoolExecutor(max_workers=max(1, int(workers)))
+        try:
+            futures = [executor.submit(self.extract_segment, member, destfile, offset, length, retries=retries,
+                                       readsize=readsize, limiter=limiter)
+                       for member, destfile, offset, length in segments]
+            for future, segment in zip(futures, segments):
+                try:
+                    future.result()
+                except Exception, e:
+                    errors.append(str(segment[0].name) + ' offset:' + str(segment[2]) + ', err:' + str(e))
+        finally:
+            executor.shutdown(wait=True)
+        if errors:
+            raise Exception('Failed to extract ' + str(len(errors)) + ' segments:\n' + "\n".join(errors))
+        elapsed = time.time() - start
+        self.debug('Extracted ' + str(size) + ' bytes in ' + "%.2f" % elapsed + ' seconds')
+        return files
+
+    def extract_segment(self, member, destfile, offset, length, uri=None, retries=3, readsize=None, limiter=None):
+        '''
+        Downloads 'length' bytes of a member's data starting at 'offset' within the member, and writes them to
+        the same offset of the existing destfile. Retries on a new connection upon failure.
+        returns number of bytes written
+        '''
+        uri = uri or self.uri
+        start = member.offset_data + offset
+        for attempt in xrange(0, retries + 1):
+            try:
+                with open(destfile, 'r+b') as dfile:
+                    dfile.seek(offset)
+                    return self.read_http_range(uri, start, start + length - 1, dfile, readsize=readsize,
+                                                limiter=limiter)
+            except Exception, e:
+                self.close()
+                if attempt >= retries:
+                    raise
+                self.debug('Retrying segment ' + str(member.name) + ' offset:' + str(offset) + ', attempt:' +
+                           str(attempt + 1) + ', err:' + str(e))
+                time.sleep(min(2 ** attempt, 30))
         
         
+    def open_member_stream(self, member, uri=None, retries=3):
+        '''
+        Returns a file like object reading a member's data directly from its http range, ie to pipe it into an
+        upload without staging it on local disk. The stream uses this thread's persistent connection, so it
+        should be read completely or closed before other requests are made from the same thread.
+        member - mandatory - tarfile.TarInfo member object or member name
+        uri - optional - remote url of the tarball
+        retries - optional - number of times a failed read is resumed on a new connection
+        '''
+        if not isinstance(member, tarfile.TarInfo):
+            member = self.get_member(member)
+        return Http_Range_Reader(self, uri or self.uri, member.offset_data, member.size, retries=retries)
+
+    def stream_member_to_s3(self, member, s3ops, bucket_name, key_name=None, part_size=8388608, workers=4):
+        '''
+        Uploads a member's data straight from its http range into a multipart upload, with bounded memory and
+        without local disk use. See S3ops.upload_object_from_stream()
+        member - mandatory - tarfile.TarInfo member object or member name
+        s3ops - mandatory - S3ops object to upload with
+        bucket_name - mandatory - name of the bucket to upload to
+        key_name - optional - name of the key, defaults to the member name
+        part_size - optional - size in bytes of each uploaded part
+        workers - optional - number of parts uploaded concurrently
+        returns the uploaded key
+        '''
+        if not isinstance(member, tarfile.TarInfo):
+            member = self.get_member(member)
+        key_name = key_name or member.name
+        stream = self.open_member_stream(member)
+        try:
+            key = s3ops.upload_object_from_stream(bucket_name, key_name, stream, part_size=part_size,
+                                                  workers=workers)
+        finally:
+            stream.close()
+        if stream.position != member.size:
+            raise Exception('Read ' + str(stream.position) + '/' + str(member.size) + ' bytes of member:' +
+                            str(member.name))
+        return key
+
     def get_file_offset(self, uri=None, start=0, offset=None, filesize=None, readsize=None,destfile=None):
         '''
         mapped method to down_load_http_offset
@@ -303,9 +586,8 @@ class Http_Tarutils(Tarutils):
         '''
         url = url or self.uri
         readsize = readsize or (16 * 1024)
-        filesize = self.filesize or int(self.get_file_size(url))
+        filesize = int(filesize or self.filesize or self.get_file_size(url))
         dfile = None #potential destination file desc. to write downloaded data to
-        retbuf = "" #potential buffer to hold downloaded data
         self.debug("download_http_offset starting: url:"+str(url)+", start:"+str(start)+", offset:"+str(offset)+
                    ", filesize:"+str(filesize)+", readsize:"+str(readsize)+", filename:"+str(destfile))
         #Validate our start and offset
@@ -313,7 +595,7 @@ class Http_Tarutils(Tarutils):
         if start < 0 or start > filesize:
             raise Exception('Invalid start for get_http_range, start:'+str(start))
         #calc range and expected byte length
-        if offset:
+        if offset is not None:
             end = int(start)+int(offset-1)
             if end > filesize:
                 end = filesize - 1
@@ -327,46 +609,155 @@ class Http_Tarutils(Tarutils):
             dfile = open(destfile, 'w+')
         else:
             dfile = cStringIO.StringIO()
-        #form our http request
-        request = urllib2.Request(url)
-        request.headers['Range'] = 'bytes=%s-%s' % (start, end)
-        #open http connection
-        remotefile = urllib2.urlopen(request)
+        if total <= 0:
+            #ie: empty tar member, nothing to request
+            return dfile
+        self.read_http_range(url, start, end, dfile, readsize=readsize)
+        dfile.seek(0)
+        return dfile
+
+    def read_http_range(self, url, start, end, fileobj, readsize=None, limiter=None):
+        '''
+        Requests bytes 'start' through 'end' (inclusive) over this thread's persistent connection and writes
+        them to fileobj at its current position.
+        url - mandatory - url to read from
+        start - mandatory - first byte to read
+        end - mandatory - last byte to read
+        fileobj - mandatory - file or file like object to write to
+        readsize - optional - the incremental read size used when reading from http and writing to fileobj
+        limiter - optional - Bandwidth_Limiter shared by concurrent readers
+        returns number of bytes written
+        '''
+        readsize = readsize or (16 * 1024)
+        total = (end + 1) - start
+        #send the range request over our persistent connection
+        remotefile = self.http_request(url, headers={'Range': 'bytes=%s-%s' % (start, end)})
         # If content length or range is not what we expected throw an error...
         # Note: content range in bytes is formated like: "byte <start>-<end>/<total bytes>
-        range=remotefile.headers.get('Content-Range')
-        clength = int(remotefile.headers.get('Content-Length'))
-        print('Content-Range:' +str(range)+", Content-Length:"+str(clength) ) 
+        range=remotefile.getheader('Content-Range')
+        clength = int(remotefile.getheader('Content-Length'))
+        self.debug('Content-Range:' +str(range)+", Content-Length:"+str(clength))
         if clength != total:
+            remotefile.close()
+            self.close()
             raise Exception("Content-length:"+str(clength)+" not equal to expected total:"+str(total)+", is range supported on remote server?")
         #Now try to parse the ranges...
+        rangestart = rangeend = None
         try:
             rangestart, rangeend = re.search("\d+-\d+", range).group().split('-')
         except Exception, e:
-            print "Couldn't derive rangestart and rangeend from string:"+str(range)+", err:"+str(e)
-        if int(rangestart) != int(start) or int(rangeend) != int(end):
+            self.debug("Couldn't derive rangestart and rangeend from string:"+str(range)+", err:"+str(e))
+        if range and (int(rangestart) != int(start) or int(rangeend) != int(end)):
+            remotefile.close()
+            self.close()
             raise Exception("Range request not met. (start:"+str(start)+" vs rangestart:"+str(rangestart)+") (end:"+str(end)+" vs rangeend:"+str(rangeend)+"), is range supported on remote server?") 
-        #finally get the data and return it as a filelike cString object
+        #finally get the data and write it to our file obj
+        written = 0
         for data in iter(lambda: remotefile.read(readsize), ''):
-            dfile.write(data)
-        dfile.seek(0)
-        return dfile
+            if limiter:
+                limiter.consume(len(data))
+            fileobj.write(data)
+            written += len(data)
+        if written != total:
+            self.close()
+            raise Exception('Short read for range ' + str(start) + '-' + str(end) + ' of ' + str(url) + ', got ' +
+                            str(written) + '/' + str(total) + ' bytes')
+        return written
     
     
     def get_file_size(self,uri=None):
         '''
-        Get remote file size for the http header
+        Get remote file size for the http header. The ETag and Last-Modified headers are recorded for
+        validating the member index cache.
         '''
         url = uri or self.uri   
-        site = urllib2.urlopen(url)
-        size =  int(site.headers.get('Content-Length'))
+        site = self.http_request(url, method='HEAD')
+        site.read()
+        size =  int(site.getheader('Content-Length'))
+        self.etag = site.getheader('ETag')
+        self.last_modified = site.getheader('Last-Modified')
         self.filesize = size
         return size
     
     def close(self):
-        return 
-        
-            
-        
-            
-            
\ No newline at end of file
+        '''
+        Closes this thread's persistent http connection
+        '''
+        connection = getattr(self.connections, 'connection', None)
+        if connection:
+            connection.close()
+            self.connections.connection = None
+
+
+class Http_Range_Reader():
+    '''
+    File like object reading 'length' bytes starting at 'start' of a remote file with a single range request,
+    resuming from the current position on a new connection if the read fails.
+    '''
+    def __init__(self, tarutils, url, start, length, retries=3):
+        self.tarutils = tarutils
+        self.url = url
+        self.start = int(start)
+        self.length = int(length)
+        self.retries = retries
+        self.position = 0
+        self.response = None
+        self.closed = False
+
+    def read(self, size=-1):
+        remaining = self.length - self.position
+        if self.closed or remaining <= 0:
+            return ''
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+        for attempt in xrange(0, self.retries + 1):
+            try:
+                if self.response is None:
+                    offset = self.start + self.position
+                    self.response = self.tarutils.http_request(
+                        self.url, headers={'Range': 'bytes=%s-%s' % (offset, self.start + self.length - 1)})
+                    if self.response.status != 206 and offset:
+                        raise Exception('Range request not met, status:' + str(self.response.status) +
+                                        ', is range supported on remote server?')
+                data = self.response.read(size)
+                if not data:
+                    raise Exception('Connection closed at position:' + str(self.position) + '/' + str(self.length))
+                self.position += len(data)
+                if self.position >= self.length:
+                    self.response = None
+                return data
+            except Exception, e:
+                self.response = None
+                self.tarutils.close()
+                if attempt >= self.retries:
+                    raise
+                self.tarutils.debug('Resuming read of ' + str(self.url) + ' at position:' + str(self.position) +
+                                    ', err:' + str(e))
+
+    def close(self):
+        if self.response is not None:
+            #an unfinished response can not be reused, drop the connection
+            self.response = None
+            self.tarutils.close()
+        self.closed = True
+
+
+class Bandwidth_Limiter():
+    '''
+    Limits the combined rate of data consumed by concurrent readers
+    '''
+    def __init__(self, max_bytes_per_sec):
+        self.max_bytes_per_sec = float(max_bytes_per_sec)
+        self.lock = threading.Lock()
+        self.start = time.time()
+        self.consumed = 0
+
+    def consume(self, size):
+        '''
+        Records 'size' bytes read, sleeping as needed to keep the overall rate under max_bytes_per_sec
+        '''
+        with self.lock:
+            self.consumed += size
+            wait = (self.consumed / self.max_bytes_per_sec) - (time.time() - self.start)
+        if wait > 0:
+            time.sleep(wait)